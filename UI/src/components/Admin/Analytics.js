@@ -13,25 +13,70 @@ import { FaChartBar, FaChartPie, FaSpinner, FaClipboardList, FaExclamationCircle
 
 ChartJS.register(ArcElement, Tooltip, Legend, CategoryScale, LinearScale, BarElement);
 
+const RESULT_KEYS = {
+    text: ["top_words", "word"],
+    dropdown: ["top_options", "option"],
+    checkbox: ["top_combos", "combination"],
+};
+
+// Add the counts of a live delta to the analytics payload
+function applyDelta(analytics, delta) {
+    if (!analytics) {
+        return analytics;
+    }
+    const next = { ...analytics };
+    Object.entries(delta.questions).forEach(([questionId, { type, counts }]) => {
+        const question = next[questionId];
+        if (!question || !RESULT_KEYS[type]) {
+            return;
+        }
+        const [resultKey, label] = RESULT_KEYS[type];
+        const items = new Map(
+            question.data[resultKey].map((item) => [JSON.stringify(item[label]), { ...item }])
+        );
+        counts.forEach((item) => {
+            const key = JSON.stringify(item[label]);
+            if (items.has(key)) {
+                items.get(key).count += item.count;
+            } else {
+                items.set(key, { ...item });
+            }
+        });
+        const ranked = [...items.values()].sort((a, b) => b.count - a.count);
+        const limit = Math.max(question.data[resultKey].length, 5);
+        next[questionId] = {
+            ...question,
+            data: { ...question.data, [resultKey]: ranked.slice(0, limit) },
+        };
+    });
+    return next;
+}
+
 export default function Analytics(props) {
     const { formId } = props;
     const [analytics, setAnalytics] = useState(null);
     const [loading, setLoading] = useState(true);
 
     useEffect(() => {
-        const fetchAnalytics = async () => {
-            const response = await fetch(`http://localhost:8000/api/response_analytics/${formId}/`);
-            const data = await response.json();
-            if (response.ok) {
-                setAnalytics(data);
-            } else {
-                console.error("Error fetching analytics", data);
-            }
+        if (!formId) {
+            return undefined;
+        }
+        // One long-lived connection: a full snapshot, then coalesced deltas
+        const source = new EventSource(`http://localhost:8000/api/response_analytics/${formId}/live/`);
+        source.addEventListener("snapshot", (event) => {
+            setAnalytics(JSON.parse(event.data));
+            setLoading(false);
+        });
+        source.addEventListener("delta", (event) => {
+            const delta = JSON.parse(event.data);
+            setAnalytics((current) => applyDelta(current, delta));
+        });
+        source.onerror = () => {
+            // EventSource reconnects by itself and is sent a fresh snapshot
+            console.error("Analytics feed interrupted, reconnecting");
             setLoading(false);
         };
-        if (formId) {
-            fetchAnalytics();
-        }
+        return () => source.close();
     }, [formId]);
 
     const generateChartData = (data, type) => {
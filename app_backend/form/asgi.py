@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "form.settings")
+# Serve the public read endpoints with async views (see form_stuff.async_views)
+os.environ.setdefault("FORM_STUFF_ASYNC_VIEWS", "1")
 
 application = get_asgi_application()
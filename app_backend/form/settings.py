@@ -74,6 +74,7 @@ CORS_ALLOWED_ORIGINS = [
 CORS_ALLOW_CREDENTIALS = True
 
 MIDDLEWARE = [
+    "form_stuff.middleware.RequestMetricsMiddleware",
     'corsheaders.middleware.CorsMiddleware',
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -82,6 +83,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "form_stuff.middleware.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "form.urls"
@@ -112,14 +114,131 @@ WSGI_APPLICATION = "form.wsgi.application"
 
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
+# DJANGO_DB_ENGINE selects SQLite (default) or PostgreSQL, configured by the
+# POSTGRES_* variables. DJANGO_DB_PROFILE=production tunes connections for
+# serving traffic: persistent connections and, on SQLite, the WAL,
+# synchronous, mmap and busy timeout pragmas applied by form_stuff/db.py
+# with writes taking the lock up front; on PostgreSQL a psycopg connection
+# pool (requires psycopg[pool]), which replaces persistent connections.
+
+DJANGO_DB_ENGINE = os.environ.get('DJANGO_DB_ENGINE', 'sqlite')
+FORM_STUFF_DB_PROFILE = os.environ.get('DJANGO_DB_PROFILE', 'default')
+PRODUCTION_DB = FORM_STUFF_DB_PROFILE == 'production'
+
+if DJANGO_DB_ENGINE == 'postgresql':
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get('POSTGRES_DB', 'form'),
+            "USER": os.environ.get('POSTGRES_USER', 'form'),
+            "PASSWORD": os.environ.get('POSTGRES_PASSWORD', ''),
+            "HOST": os.environ.get('POSTGRES_HOST', 'localhost'),
+            "PORT": os.environ.get('POSTGRES_PORT', '5432'),
+            "CONN_HEALTH_CHECKS": PRODUCTION_DB,
+            "OPTIONS": {
+                "pool": {
+                    "min_size": int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2)),
+                    "max_size": int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10)),
+                },
+            } if PRODUCTION_DB else {},
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db.sqlite3",
+            "CONN_MAX_AGE": int(os.environ.get('DJANGO_CONN_MAX_AGE', 600 if PRODUCTION_DB else 0)),
+            "CONN_HEALTH_CHECKS": PRODUCTION_DB,
+            # Take the write lock when a transaction starts, so concurrent
+            # writers wait on busy_timeout instead of failing to upgrade
+            "OPTIONS": {"transaction_mode": "IMMEDIATE"} if PRODUCTION_DB else {},
+        }
+    }
+
+# Read replica (see form_stuff/replicas.py)
+# With POSTGRES_REPLICA_HOST, or DJANGO_SQLITE_REPLICA_PATH on SQLite, the
+# analytics, response listing, form questions and list endpoints read from
+# the "replica" alias; writes and everything else use the primary. Locally,
+# `python manage.py replicate_db` keeps the SQLite replica in sync.
+
+if DJANGO_DB_ENGINE == 'postgresql' and os.environ.get('POSTGRES_REPLICA_HOST'):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "HOST": os.environ['POSTGRES_REPLICA_HOST'],
+        "PORT": os.environ.get('POSTGRES_REPLICA_PORT', DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+elif DJANGO_DB_ENGINE != 'postgresql' and os.environ.get('DJANGO_SQLITE_REPLICA_PATH'):
+    DATABASES["replica"] = {
+        **DATABASES["default"],
+        "NAME": os.environ['DJANGO_SQLITE_REPLICA_PATH'],
+        "TEST": {"MIRROR": "default"},
+    }
 
-DATABASES = {
+# Sharded response storage (see form_stuff/sharding.py)
+# DJANGO_SQLITE_SHARD_PATHS (comma separated files), or POSTGRES_SHARD_HOSTS
+# on PostgreSQL, adds the "shard1", "shard2"... databases. The responses and
+# analytics of each new form are stored on one of them or on the default
+# database, chosen by consistent hashing. Run `python manage.py migrate
+# --database=<alias>` for every new shard, then `python manage.py
+# rebalance_shards` to move existing forms onto the new layout.
+
+if DJANGO_DB_ENGINE == 'postgresql':
+    SHARD_LOCATIONS = [('HOST', host) for host in os.environ.get('POSTGRES_SHARD_HOSTS', '').split(',') if host]
+else:
+    SHARD_LOCATIONS = [('NAME', path) for path in os.environ.get('DJANGO_SQLITE_SHARD_PATHS', '').split(',') if path]
+for index, (key, location) in enumerate(SHARD_LOCATIONS, start=1):
+    DATABASES[f"shard{index}"] = {**DATABASES["default"], key: location}
+FORM_STUFF_SHARDS = ["default", *(f"shard{index}" for index in range(1, len(SHARD_LOCATIONS) + 1))]
+
+DATABASE_ROUTERS = ['form_stuff.sharding.ShardRouter', 'form_stuff.replicas.ReadReplicaRouter']
+# After a write, the client reads from the primary for this many seconds
+FORM_STUFF_REPLICA_PIN_SECONDS = int(os.environ.get('FORM_STUFF_REPLICA_PIN_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Form schemas are cached per process by default. Point DJANGO_CACHE_BACKEND
+# at a shared backend (e.g. django.core.cache.backends.redis.RedisCache) so
+# schema changes are seen by every worker immediately.
+
+CACHES = {
     "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+        "BACKEND": os.environ.get(
+            "DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("DJANGO_CACHE_LOCATION", ""),
     }
 }
 
+FORM_STUFF_SCHEMA_CACHE_TIMEOUT = 300
+
+# Serve the public read endpoints (form questions, analytics, form
+# responses) with async views. Enabled by default by form/asgi.py.
+
+FORM_STUFF_ASYNC_VIEWS = os.environ.get('FORM_STUFF_ASYNC_VIEWS', '').lower() in ('1', 'true', 'yes')
+
+# Live analytics feed (see form_stuff/live.py)
+# Deltas are coalesced into at most this many events per second per viewer,
+# a full snapshot is resent every RESYNC seconds and a feed is closed (and
+# reopened by the browser) after MAX seconds.
+
+FORM_STUFF_LIVE_MAX_UPDATES_PER_SECOND = float(os.environ.get('FORM_STUFF_LIVE_MAX_UPDATES_PER_SECOND', 2))
+FORM_STUFF_LIVE_HEARTBEAT_SECONDS = int(os.environ.get('FORM_STUFF_LIVE_HEARTBEAT_SECONDS', 15))
+FORM_STUFF_LIVE_RESYNC_SECONDS = int(os.environ.get('FORM_STUFF_LIVE_RESYNC_SECONDS', 60))
+FORM_STUFF_LIVE_MAX_SECONDS = int(os.environ.get('FORM_STUFF_LIVE_MAX_SECONDS', 300))
+
+# Text analytics
+# Words shorter than the minimum length and stop words (comma separated) are
+# not counted. Run `python manage.py rebuild_analytics` after changing them.
+
+FORM_STUFF_TEXT_MIN_WORD_LENGTH = int(os.environ.get('FORM_STUFF_TEXT_MIN_WORD_LENGTH', 5))
+FORM_STUFF_TEXT_STOP_WORDS = [
+    word.strip() for word in os.environ.get('FORM_STUFF_TEXT_STOP_WORDS', '').split(',')
+    if word.strip()
+]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -163,3 +282,64 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # Deployment directory for
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+
+# Submission ingest
+# "sync" writes each submission inside the request. "queued" validates it,
+# appends it to a local SQLite journal and returns 202 with a receipt id;
+# run `python manage.py flush_submissions` next to the web workers to write
+# the queued submissions to the database in batches.
+
+FORM_STUFF_INGEST_MODE = os.environ.get('FORM_STUFF_INGEST_MODE', 'sync')
+FORM_STUFF_INGEST_QUEUE_PATH = os.environ.get(
+    'FORM_STUFF_INGEST_QUEUE_PATH', os.path.join(BASE_DIR, 'ingest_queue.sqlite3')
+)
+
+# Idempotent submissions (see form_stuff/idempotency.py)
+# Each worker remembers the outcome of this many recent submissions sent
+# with an Idempotency-Key header, so retries are answered without touching
+# the database. Older keys are still caught by a unique index.
+
+FORM_STUFF_IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('FORM_STUFF_IDEMPOTENCY_CACHE_SIZE', 10000))
+
+
+# Background jobs
+# Artifacts of export and analytics snapshot jobs run by
+# `python manage.py run_jobs` are written here.
+
+FORM_STUFF_JOB_ROOT = os.environ.get(
+    'FORM_STUFF_JOB_ROOT', os.path.join(BASE_DIR, 'job_artifacts')
+)
+
+# A running job whose worker has not reported it alive for this many seconds
+# is taken to be abandoned and put back in the queue for another worker.
+
+FORM_STUFF_JOB_STALE_SECONDS = int(os.environ.get('FORM_STUFF_JOB_STALE_SECONDS', 60))
+
+# Approximate analytics (see form_stuff/sketches.py)
+# Answers submitted since `update_sketches` last ran are folded into the
+# sketches in memory when read, up to this many; past it they are left out
+# and reported as lag until the next update.
+
+FORM_STUFF_SKETCH_CATCH_UP = int(os.environ.get('FORM_STUFF_SKETCH_CATCH_UP', 10000))
+
+# Request metrics (see form_stuff/metrics.py)
+# DJANGO_METRICS=1 records per-route latency, database queries and time,
+# serializer time and response size, served at /metrics in the Prometheus
+# text format. DJANGO_METRICS_LOG=1 also logs one JSON line per request on
+# the "form_stuff.metrics" logger.
+
+FORM_STUFF_METRICS = os.environ.get('DJANGO_METRICS', '').lower() in ('1', 'true', 'yes')
+FORM_STUFF_METRICS_LOG = os.environ.get('DJANGO_METRICS_LOG', '').lower() in ('1', 'true', 'yes')
+
+# Compiled serializers (see form_stuff/fast_serializers.py)
+# Plain JSON requests to these routes (comma separated URL names) are
+# rendered straight from database rows, with orjson when it is installed.
+# The output is the same as the DRF serializers'.
+
+FORM_STUFF_FAST_SERIALIZER_ROUTES = [
+    route.strip() for route in os.environ.get(
+        'FORM_STUFF_FAST_SERIALIZER_ROUTES', 'form-responses,form-list'
+    ).split(',')
+    if route.strip()
+]
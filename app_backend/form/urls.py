@@ -24,6 +24,7 @@ from rest_framework_simplejwt.views import (
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from form_stuff.views import MetricsView
 
 
 schema_view = get_schema_view(
@@ -43,6 +44,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('api/', include('form_stuff.urls')),
     path("admin/", admin.site.urls),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
     path('api/token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
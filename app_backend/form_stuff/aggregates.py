@@ -0,0 +1,229 @@
+"""
+Incremental analytics aggregates.
+
+Every submitted answer is reduced to a handful of keys by the aggregators in
+`analytics` (words for text questions, the selected option for dropdowns, the
+sorted option combination for checkboxes) and the per-question count of each
+key is kept in `QuestionValueCount`. Analytics reads then cost O(distinct
+values) instead of O(answers).
+
+Answers are only written with their response (`ResponseSerializer.create`
+and the ingest flusher), and deleting a response through the API takes its
+answers back out (`forget_answers`). Rows changed any other way, e.g. from
+the shell, are not reflected; `rebuild_analytics` recomputes the tables from
+the raw `Answer` rows and `check_analytics` reports any drift.
+"""
+from collections import Counter
+
+from django.db import connections, router, transaction
+
+from .analytics import (
+    AGGREGATORS,
+    TOP_K,
+    aform_aggregators,
+    aggregate_answers,
+    decode_key,
+    encode_key,
+    form_aggregators,
+    render_analytics,
+)
+from .models import Question, QuestionValueCount
+
+
+def count_answers(answers):
+    """
+    Count the encoded keys of `(question_id, question_type, text_answer)` rows.
+
+    Returns:
+    Counter: Mapping of `(question_id, encoded key)` to its count.
+    """
+    counts = Counter()
+    for question_id, question_type, text_answer in answers:
+        aggregator = AGGREGATORS.get(question_type)
+        if aggregator is None:
+            continue
+        for key in aggregator.keys(text_answer):
+            counts[(question_id, encode_key(key))] += 1
+    return counts
+
+
+def upsert_counts(model, key_columns, deltas, using=None):
+    """
+    Add `deltas` onto the `count` column of `model` with a single upsert
+    statement.
+
+    Parameters:
+    model (Model): A model with a unique constraint on `key_columns`.
+    key_columns (tuple): Column names identifying a counted row.
+    deltas (dict): Mapping of key tuples (in `key_columns` order) to the
+                   amount to add.
+    using (str): The database alias; routed like a write by default.
+    """
+    if not deltas:
+        return
+    connection = connections[using or router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    count = quote('count')
+    keys = ', '.join(quote(column) for column in key_columns)
+    placeholders = ', '.join(['%s'] * (len(key_columns) + 1))
+    sql = (
+        f"INSERT INTO {table} ({keys}, {count}) VALUES ({placeholders}) "
+        f"ON CONFLICT ({keys}) "
+        f"DO UPDATE SET {count} = {table}.{count} + excluded.{count}"
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(*key, n) for key, n in deltas.items()])
+
+
+def subtract_counts(model, key_columns, deltas, using=None):
+    """
+    Subtract `deltas` from the `count` column of existing rows of `model`.
+
+    Counts are unsigned, so this cannot share the upsert of `upsert_counts`:
+    the inserted row of an upsert is checked before the conflict is.
+
+    Parameters:
+    model (Model): A model with a unique constraint on `key_columns`.
+    key_columns (tuple): Column names identifying a counted row.
+    deltas (dict): Mapping of key tuples (in `key_columns` order) to the
+                   amount to subtract.
+    using (str): The database alias; routed like a write by default.
+    """
+    if not deltas:
+        return
+    connection = connections[using or router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    count = quote('count')
+    where = ' AND '.join(f"{quote(column)} = %s" for column in key_columns)
+    sql = f"UPDATE {quote(model._meta.db_table)} SET {count} = {count} - %s WHERE {where}"
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [(n, *key) for key, n in deltas.items()])
+
+
+def _upsert_counts(deltas, using=None):
+    upsert_counts(QuestionValueCount, ('question_id', 'value'), deltas, using)
+
+
+def record_answers(answers, using=None):
+    """
+    Fold freshly created answers into the pre-aggregated counts.
+
+    Parameters:
+    answers (iterable): `(question_id, question_type, text_answer)` tuples.
+    using (str): The form's shard (see `sharding`).
+    """
+    _upsert_counts(count_answers(answers), using)
+
+
+def forget_answers(answers, using=None):
+    """
+    Take the answers of a deleted response back out of the counts.
+
+    Parameters:
+    answers (iterable): `(question_id, question_type, text_answer)` tuples.
+    using (str): The form's shard (see `sharding`).
+    """
+    subtract_counts(QuestionValueCount, ('question_id', 'value'), count_answers(answers), using)
+
+
+def _raw_counts(form_id, using=None):
+    """
+    Recompute the counts of a form from its raw `Answer` rows.
+    """
+    counts = Counter()
+    aggregators = aggregate_answers(form_aggregators(form_id), using=using)
+    for question_id, (_, aggregator) in aggregators.items():
+        for key, n in aggregator.key_counts().items():
+            counts[(question_id, encode_key(key))] = n
+    return counts
+
+
+def _question_ids(form_id):
+    # Questions live on the default database, not on the form's shard
+    return list(Question.objects.filter(form_id=form_id).values_list('id', flat=True))
+
+
+def _stored_counts(form_id, using=None):
+    rows = QuestionValueCount.objects.using(using).filter(
+        question_id__in=_question_ids(form_id)
+    ).values_list('question_id', 'value', 'count')
+    return Counter({
+        (question_id, value): count
+        for question_id, value, count in rows if count
+    })
+
+
+def rebuild_form(form_id, using=None):
+    """
+    Replace the stored counts of a form with counts recomputed from answers.
+
+    The answers are read in the same transaction as the counts are
+    replaced, so a concurrent submission cannot be counted twice or lost.
+
+    Returns:
+    int: The number of count rows written.
+    """
+    with transaction.atomic(using=using):
+        counts = _raw_counts(form_id, using)
+        QuestionValueCount.objects.using(using).filter(
+            question_id__in=_question_ids(form_id)
+        ).delete()
+        QuestionValueCount.objects.using(using).bulk_create(
+            [
+                QuestionValueCount(question_id=question_id, value=value, count=n)
+                for (question_id, value), n in counts.items()
+            ],
+            batch_size=1000
+        )
+    return len(counts)
+
+
+def check_form(form_id, using=None):
+    """
+    Compare the stored counts of a form with its raw answers.
+
+    Returns:
+    list: `(question_id, value, stored, expected)` tuples for every mismatch.
+    """
+    expected = _raw_counts(form_id, using)
+    stored = _stored_counts(form_id, using)
+    mismatches = []
+    for question_id, value in sorted(set(expected) | set(stored)):
+        key = (question_id, value)
+        if stored[key] != expected[key]:
+            mismatches.append(
+                (question_id, decode_key(value), stored[key], expected[key])
+            )
+    return mismatches
+
+
+def form_analytics(form_id, k=TOP_K, using=None):
+    """
+    Build the analytics payload of a form from the pre-aggregated counts,
+    reporting the top `k` values of every question.
+
+    Returns:
+    dict: Mapping of question id to `{'type': ..., 'data': ...}` in the shape
+          served by `AnalyticsView`.
+    """
+    aggregators = form_aggregators(form_id)
+    rows = QuestionValueCount.objects.using(using).filter(
+        question_id__in=list(aggregators), count__gt=0
+    ).values_list('question_id', 'value', 'count')
+    for question_id, value, count in rows:
+        aggregators[question_id][1].counts[decode_key(value)] = count
+    return render_analytics(aggregators, k)
+
+
+async def aform_analytics(form_id, k=TOP_K, using=None):
+    """
+    Async counterpart of `form_analytics`, using the async ORM.
+    """
+    aggregators = await aform_aggregators(form_id)
+    rows = QuestionValueCount.objects.using(using).filter(
+        question_id__in=list(aggregators), count__gt=0
+    ).values_list('question_id', 'value', 'count')
+    async for question_id, value, count in rows:
+        aggregators[question_id][1].counts[decode_key(value)] = count
+    return render_analytics(aggregators, k)
@@ -0,0 +1,396 @@
+"""
+Batched analytics engine.
+
+All answers of a form are pulled in a single streamed `values_list` pass and
+dispatched by question id to a per-question-type aggregator, so computing a
+form's analytics costs two queries regardless of how many questions it has
+and never instantiates `Answer` models. Answers are handed to the
+aggregators a chunk at a time, which lets text questions tokenize a whole
+chunk in one pass (see `text_analytics`) and checkbox questions encode each
+answer as an integer bitmask over the question's options.
+
+Answers are read in their compact storage columns (see `answer_storage`):
+dropdown indexes and checkbox bitmasks are counted as integers and only the
+distinct values are mapped to options.
+"""
+import json
+from collections import Counter, defaultdict
+from itertools import combinations, islice
+
+from . import text_analytics
+from .answer_storage import ANSWER_COLUMNS, AnswerCodec, set_bits
+from .models import Answer, Question
+
+
+TOP_K = text_analytics.TOP_K
+CHUNK_SIZE = 2000
+
+
+def encode_key(key):
+    """
+    Encode an aggregator key as stable JSON text.
+    """
+    return json.dumps(key, sort_keys=True, separators=(',', ':'))
+
+
+def decode_key(value):
+    """
+    Decode JSON text produced by `encode_key` back into a hashable key.
+    """
+    key = json.loads(value)
+    return tuple(key) if isinstance(key, list) else key
+
+
+class Aggregator:
+    """
+    Counts the keys of every answer given to one question.
+
+    Subclasses define how an answer is reduced to keys and how the top keys
+    are labelled in the analytics payload.
+
+    Parameters:
+    options (list): The question's options, for aggregators that use them.
+    stored_options (list): The question's `stored_options`, to decode stored
+                           answers with `add_stored`.
+    """
+    question_type = None
+    result_key = None
+    label = None
+
+    def __init__(self, options=None, stored_options=None):
+        self.counts = Counter()
+        self.codec = AnswerCodec(self.question_type, stored_options)
+
+    @staticmethod
+    def keys(text_answer):
+        """
+        Reduce a decoded `Answer.text_answer` to the keys it contributes.
+        """
+        raise NotImplementedError
+
+    def add(self, text_answer):
+        self.counts.update(self.keys(text_answer))
+
+    def add_many(self, text_answers):
+        for text_answer in text_answers:
+            self.add(text_answer)
+
+    def add_stored(self, rows):
+        """
+        Add answers read as `answer_storage.ANSWER_COLUMNS` tuples.
+        """
+        decode = self.codec.decode
+        self.add_many([decode(*row) for row in rows])
+
+    def key_counts(self):
+        """
+        Return the count of every key added so far.
+        """
+        return self.counts
+
+    def render(self, key):
+        return key
+
+    def result(self, k=TOP_K):
+        """
+        Render the top `k` keys and the summed count of the remaining ones.
+        """
+        top, others = text_analytics.top_k(self.key_counts(), k)
+        return {
+            self.result_key: [
+                {self.label: self.render(key), 'count': count}
+                for key, count in top
+            ],
+            'others': others
+        }
+
+
+class TextAggregator(Aggregator):
+    question_type = Question.TEXT
+    result_key = 'top_words'
+    label = 'word'
+
+    def __init__(self, options=None, stored_options=None):
+        super().__init__(options, stored_options)
+        self.tokenizer = text_analytics.default_tokenizer()
+
+    @staticmethod
+    def keys(text_answer):
+        return text_analytics.default_tokenizer().tokenize(text_answer)
+
+    def add_many(self, text_answers):
+        self.tokenizer.count(text_answers, self.counts)
+
+
+class DropdownAggregator(Aggregator):
+    question_type = Question.DROPDOWN
+    result_key = 'top_options'
+    label = 'option'
+
+    @staticmethod
+    def keys(text_answer):
+        if text_answer is None or isinstance(text_answer, (list, dict)):
+            return ()
+        return (text_answer,)
+
+    def add_stored(self, rows):
+        indexes = Counter()
+        others = []
+        for value_text, value_choice, value_json in rows:
+            if value_choice is None:
+                others.append(self.codec.decode(value_text, value_choice, value_json))
+            else:
+                indexes[value_choice] += 1
+        options = self.codec.options
+        for index, count in indexes.items():
+            self.counts[options[index]] += count
+        self.add_many(others)
+
+
+class CheckboxAggregator(Aggregator):
+    """
+    Counts option combinations as integer bitmasks.
+
+    Bit `i` of a mask is set when option `i` of the question is selected, so
+    a combination is counted without sorting or building a tuple, and
+    per-option and pairwise counts are derived from the distinct masks
+    rather than from every answer. Answers that cannot be encoded (options
+    no longer on the question, repeated options or a plain string) are
+    counted by their sorted tuple as before.
+    """
+    question_type = Question.CHECKBOX
+    result_key = 'top_combos'
+    label = 'combination'
+
+    def __init__(self, options=None, stored_options=None):
+        super().__init__(options, stored_options)
+        self.options = list(dict.fromkeys(options or []))
+        self.bits = {option: 1 << index for index, option in enumerate(self.options)}
+        self.masks = Counter()
+        # Stored masks are over `stored_options`, which usually starts with
+        # the current options; those masks are already in our bit order
+        stored = self.codec.options
+        self.same_bits = 1 << len(self.options) if stored[:len(self.options)] == self.options else 0
+
+    @staticmethod
+    def keys(text_answer):
+        if not isinstance(text_answer, (list, str)):
+            return ()
+        return (tuple(sorted(text_answer)),)
+
+    def encode(self, combination):
+        """
+        Return the bitmask of a combination, or None if it cannot be encoded
+        (an option is unknown or selected twice).
+        """
+        try:
+            mask = sum(map(self.bits.__getitem__, combination))
+        except (KeyError, TypeError):
+            return None
+        # A repeated option carries into another bit
+        return mask if mask.bit_count() == len(combination) else None
+
+    def decode(self, mask):
+        return tuple(sorted(self.options[index] for index in set_bits(mask)))
+
+    def add(self, text_answer):
+        self.add_many((text_answer,))
+
+    def add_many(self, text_answers):
+        bits = self.bits.__getitem__
+        masks = []
+        for text_answer in text_answers:
+            if isinstance(text_answer, list):
+                try:
+                    mask = sum(map(bits, text_answer))
+                except (KeyError, TypeError):
+                    mask = -1
+                if mask >= 0 and mask.bit_count() == len(text_answer):
+                    masks.append(mask)
+                    continue
+            self.counts.update(self.keys(text_answer))
+        self.masks.update(masks)
+
+    def add_stored(self, rows):
+        """
+        Count stored bitmasks directly, translating only the distinct masks
+        whose bits do not line up with the current options.
+        """
+        stored = Counter()
+        others = []
+        for value_text, value_choice, value_json in rows:
+            if value_choice is None:
+                others.append(self.codec.decode(value_text, value_choice, value_json))
+            else:
+                stored[value_choice] += 1
+        for mask, count in stored.items():
+            if mask < self.same_bits:
+                self.masks[mask] += count
+                continue
+            translated = self.encode(self.codec.decode_mask(mask))
+            if translated is None:
+                self.counts[tuple(sorted(self.codec.decode_mask(mask)))] += count
+            else:
+                self.masks[translated] += count
+        self.add_many(others)
+
+    def key_counts(self):
+        counts = Counter(self.counts)
+        for mask, count in self.masks.items():
+            counts[self.decode(mask)] += count
+        return counts
+
+    def split_counts(self):
+        """
+        Split the counts into bitmask counts, including combinations loaded
+        into `counts` as tuples (e.g. from stored counts), and the tuple
+        counts of combinations that cannot be encoded.
+
+        Returns:
+        tuple: `(masks, tuples)` counters.
+        """
+        masks = Counter(self.masks)
+        tuples = Counter()
+        for combination, count in self.counts.items():
+            mask = self.encode(combination)
+            if mask is None:
+                tuples[combination] += count
+            else:
+                masks[mask] += count
+        return masks, tuples
+
+    def co_occurrence(self, masks):
+        """
+        Count how often each pair of options is selected together.
+
+        Returns:
+        list: Square matrix in option order; the diagonal holds how often
+              each option was selected at all.
+        """
+        size = len(self.options)
+        matrix = [[0] * size for _ in range(size)]
+        for mask, count in masks.items():
+            selected = set_bits(mask)
+            for index in selected:
+                matrix[index][index] += count
+            for first, second in combinations(selected, 2):
+                matrix[first][second] += count
+                matrix[second][first] += count
+        return matrix
+
+    def render(self, key):
+        if isinstance(key, int):
+            key = self.decode(key)
+        return list(key)
+
+    def result(self, k=TOP_K):
+        """
+        Render the top combinations together with per-option counts and the
+        pairwise co-occurrence matrix.
+
+        Top combinations are picked among the bitmasks directly; only the
+        `k` reported ones are decoded.
+        """
+        masks, tuples = self.split_counts()
+        top, others = text_analytics.top_k(masks + tuples, k)
+        matrix = self.co_occurrence(masks)
+        return {
+            self.result_key: [
+                {self.label: self.render(key), 'count': count}
+                for key, count in top
+            ],
+            'others': others,
+            'option_counts': [
+                {'option': option, 'count': matrix[index][index]}
+                for index, option in enumerate(self.options)
+            ],
+            'co_occurrence': {'options': self.options, 'matrix': matrix},
+        }
+
+
+AGGREGATORS = {
+    Question.TEXT: TextAggregator,
+    Question.DROPDOWN: DropdownAggregator,
+    Question.CHECKBOX: CheckboxAggregator,
+}
+
+
+def form_aggregators(form_id):
+    """
+    Create an empty aggregator for every question of a form.
+
+    Returns:
+    dict: Mapping of question id to `(question_type, aggregator)`, in
+          question order.
+    """
+    questions = Question.objects.filter(form_id=form_id).values_list(
+        'id', 'question_type', 'options', 'stored_options'
+    )
+    return {
+        question_id: (question_type, AGGREGATORS[question_type](options, stored_options))
+        for question_id, question_type, options, stored_options in questions
+        if question_type in AGGREGATORS
+    }
+
+
+async def aform_aggregators(form_id):
+    """
+    Async counterpart of `form_aggregators`.
+    """
+    questions = Question.objects.filter(form_id=form_id).values_list(
+        'id', 'question_type', 'options', 'stored_options'
+    )
+    return {
+        question_id: (question_type, AGGREGATORS[question_type](options, stored_options))
+        async for question_id, question_type, options, stored_options in questions
+        if question_type in AGGREGATORS
+    }
+
+
+def aggregate_answers(aggregators, chunk_size=CHUNK_SIZE, using=None):
+    """
+    Feed every answer of the given questions into their aggregators.
+
+    Answers are read as `(question_id, *ANSWER_COLUMNS)` tuples through a
+    single server-side cursor, so memory stays bounded by the aggregator
+    state.
+    """
+    if not aggregators:
+        return aggregators
+    rows = Answer.objects.using(using).filter(
+        question_id__in=list(aggregators)
+    ).values_list('question_id', *ANSWER_COLUMNS).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return aggregators
+        pending = defaultdict(list)
+        for question_id, *stored in chunk:
+            pending[question_id].append(stored)
+        for question_id, stored in pending.items():
+            aggregators[question_id][1].add_stored(stored)
+
+
+def render_analytics(aggregators, k=TOP_K):
+    """
+    Render aggregators into the payload served by `AnalyticsView`.
+    """
+    return {
+        question_id: {'type': question_type, 'data': aggregator.result(k)}
+        for question_id, (question_type, aggregator) in aggregators.items()
+    }
+
+
+def compute_form_analytics(form_id, k=TOP_K, using=None):
+    """
+    Compute the analytics of a form directly from its raw answers.
+
+    Parameters:
+    form_id (int): The ID of the form.
+    k (int): How many top values to report per question.
+    using (str): The form's shard (see `sharding`).
+
+    Returns:
+    dict: Mapping of question id to `{'type': ..., 'data': ...}`.
+    """
+    return render_analytics(aggregate_answers(form_aggregators(form_id), using=using), k)
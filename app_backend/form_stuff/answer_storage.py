@@ -0,0 +1,141 @@
+"""
+Compact answer storage.
+
+An answer is stored in one of three columns of `Answer`:
+
+* ``value_text``: the plain text of a text answer.
+* ``value_choice``: the option index of a dropdown answer, or for a checkbox
+  answer a bitmask with bit ``i`` set when option ``i`` is selected.
+* ``value_json``: any other value as JSON (a value that does not match the
+  question type, an option the question does not know, a checkbox answer
+  selecting an option twice...), so nothing submitted is lost.
+
+Indexes refer to `Question.stored_options`: every option the question has
+ever had, in first-seen order. Editing the options of a question only
+appends to that list, so stored answers never need rewriting. Checkbox
+answers are returned in that order rather than in the submitted one.
+Nothing records whether a `value_choice` is an index or a bitmask but the
+question's type, which therefore cannot change once the question has
+answers (see `Question.type_change_error`).
+
+`Answer.text_answer` encodes and decodes through the question's
+`AnswerCodec`, so the API and `Answer(text_answer=...)` keep working. Bulk
+readers select `ANSWER_COLUMNS` and decode, or aggregate the integers
+directly (see `analytics`).
+"""
+from functools import lru_cache
+
+from .models import Question
+
+
+ANSWER_COLUMNS = ('value_text', 'value_choice', 'value_json')
+# `value_choice` is a signed 64-bit column
+MAX_CHOICE_BITS = 63
+
+
+def set_bits(mask):
+    """
+    Return the indexes of the bits set in `mask`, lowest first.
+    """
+    indexes = []
+    while mask:
+        lowest = mask & -mask
+        indexes.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return indexes
+
+
+def merge_options(stored_options, options):
+    """
+    Append the options not stored yet to `stored_options`.
+
+    Returns:
+    list: The new stored options; existing indexes are unchanged.
+    """
+    stored = list(stored_options or [])
+    known = set(stored)
+    for option in options or []:
+        if isinstance(option, str) and option not in known:
+            known.add(option)
+            stored.append(option)
+    return stored
+
+
+@lru_cache(maxsize=1024)
+def cached_codec(question_type, stored_options):
+    """
+    Return a shared codec; `stored_options` must be a tuple.
+    """
+    return AnswerCodec(question_type, stored_options)
+
+
+def answer_columns(question, value):
+    """
+    Encode a submitted value for a `schema.QuestionSpec`.
+
+    Returns:
+    dict: The `Answer` column values, to pass as keyword arguments.
+    """
+    codec = cached_codec(question.question_type, question.stored_options)
+    return dict(zip(ANSWER_COLUMNS, codec.encode(value)))
+
+
+class AnswerCodec:
+    """
+    Converts the answers of one question between submitted values and the
+    compact columns.
+
+    Parameters:
+    question_type (str): The question's type.
+    stored_options (list): The question's `stored_options`.
+    """
+
+    def __init__(self, question_type, stored_options):
+        self.question_type = question_type
+        self.options = list(stored_options or [])
+        self.positions = {option: index for index, option in enumerate(self.options)}
+
+    def encode(self, value):
+        """
+        Returns:
+        tuple: `(value_text, value_choice, value_json)`.
+        """
+        if self.question_type == Question.TEXT:
+            if isinstance(value, str):
+                return value, None, None
+        elif self.question_type == Question.DROPDOWN:
+            index = self.positions.get(value) if isinstance(value, str) else None
+            if index is not None:
+                return None, index, None
+        elif self.question_type == Question.CHECKBOX:
+            mask = self.encode_mask(value)
+            if mask is not None:
+                return None, mask, None
+        return None, None, value
+
+    def encode_mask(self, value):
+        """
+        Return the bitmask of a checkbox answer, or None if it cannot be
+        encoded.
+        """
+        if not isinstance(value, list):
+            return None
+        mask = 0
+        for option in value:
+            index = self.positions.get(option) if isinstance(option, str) else None
+            if index is None or index >= MAX_CHOICE_BITS or mask >> index & 1:
+                return None
+            mask |= 1 << index
+        return mask
+
+    def decode(self, value_text, value_choice, value_json):
+        if value_text is not None:
+            return value_text
+        if value_choice is None:
+            return value_json
+        if self.question_type == Question.CHECKBOX:
+            return self.decode_mask(value_choice)
+        return self.options[value_choice]
+
+    def decode_mask(self, mask):
+        return [self.options[index] for index in set_bits(mask)]
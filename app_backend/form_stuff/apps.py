@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class FormStuffConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "form_stuff"
+
+    def ready(self):
+        # Connect the cache invalidation signal handlers
+        from . import signals  # noqa: F401
+        # Apply the connection settings of the database profile
+        from . import db  # noqa: F401
+        # Count the queries of every connection in the request metrics
+        from . import metrics  # noqa: F401
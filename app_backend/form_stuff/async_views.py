@@ -0,0 +1,145 @@
+"""
+Async implementations of the public read endpoints.
+
+`FormQuestionsView`, `AnalyticsView`, `FormResponsesView` and the live
+analytics feed are the endpoints respondents and public dashboards hit. Django REST framework views
+are synchronous, so under an ASGI server each of those requests would hold a
+thread. The views below are plain Django async views using the async ORM
+and async cache API instead, so a single ASGI worker can keep thousands of
+connections open. They return the same payloads, status codes and headers as
+their DRF counterparts, which remain in use under WSGI.
+
+`form_stuff/urls.py` routes to these views when `FORM_STUFF_ASYNC_VIEWS` is
+enabled, which `form/asgi.py` does by default. Every endpoint here is public,
+so DRF authentication is not needed.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import NotFound
+from rest_framework.utils import encoders
+
+from . import aggregates, fast_serializers, live, schema, sharding
+from .models import Form, Question
+from .models import Response as FormResponse
+from .pagination import (
+    ResponseCursorPagination,
+    astream_json_lines,
+    is_stream_requested,
+)
+from .serializers import QuestionSerializer, ResponseSerializer
+from .views import analytics_options, build_analytics
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return JsonResponse(data, encoder=encoders.JSONEncoder, safe=False, status=status_code)
+
+
+def not_found(detail):
+    return json_response({"detail": detail}, status.HTTP_404_NOT_FOUND)
+
+
+def bad_request(detail):
+    return json_response({"detail": detail}, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncFormQuestionsView(View):
+    """
+    Async counterpart of `views.FormQuestionsView`, sharing its schema cache
+    entries and ETags.
+    """
+
+    async def get(self, request, form_id):
+        async def build():
+            return QuestionSerializer(
+                [question async for question in Question.objects.filter(form_id=form_id)],
+                many=True
+            ).data
+
+        return await schema.acached_schema_response(request, form_id, 'questions', build)
+
+
+class AsyncAnalyticsView(View):
+    """
+    Async counterpart of `views.AnalyticsView`.
+
+    The default exact analytics are read with the async ORM. Time-windowed
+    and approximate analytics are less frequent and reuse the sync builders
+    in a worker thread.
+    """
+
+    async def get(self, request, form_id):
+        try:
+            options = analytics_options(request.GET)
+        except ValueError as exc:
+            return bad_request(str(exc))
+        form = await Form.objects.only('shard').filter(id=form_id).afirst()
+        if form is None:
+            return not_found("No Form matches the given query.")
+
+        using = sharding.form_db(form)
+        if options['window'] is None and options['mode'] == 'exact':
+            return json_response(await aggregates.aform_analytics(form_id, options['k'], using))
+        try:
+            analytics = await sync_to_async(build_analytics)(form_id, options, using)
+        except ValueError as exc:
+            return bad_request(str(exc))
+        return json_response(analytics)
+
+
+class AsyncFormResponsesView(View):
+    """
+    Async counterpart of `views.FormResponsesView`, supporting the same
+    plain list, keyset pagination and JSON lines stream.
+    """
+
+    async def get(self, request, form_id):
+        form = await Form.objects.only('shard').filter(id=form_id).afirst()
+        if form is None:
+            return not_found("Form not found.")
+        responses = FormResponse.objects.using(sharding.form_db(form)).filter(form_id=form_id)
+        try:
+            if is_stream_requested(request):
+                return astream_json_lines(responses, ResponseSerializer, request)
+
+            paginator = ResponseCursorPagination()
+            if fast_serializers.use_fast_path(request):
+                compiled = fast_serializers.compiled(ResponseSerializer)
+                rows = await paginator.apaginate_rows(responses, request, compiled.columns)
+                if rows is not None:
+                    data = paginator.get_paginated_data(compiled.serialize_rows(rows))
+                else:
+                    data = await compiled.adata(responses)
+                return fast_serializers.json_response(data)
+
+            page = await paginator.apaginate_queryset(responses, request)
+        except NotFound as exc:
+            return not_found(str(exc.detail))
+        if page is not None:
+            data = ResponseSerializer(page, many=True).data
+            return json_response(paginator.get_paginated_data(data))
+
+        return json_response(
+            ResponseSerializer([response async for response in responses], many=True).data
+        )
+
+
+class AsyncAnalyticsLiveView(View):
+    """
+    Async counterpart of `views.AnalyticsLiveView`. An open feed costs a
+    suspended coroutine rather than a thread.
+    """
+
+    async def get(self, request, form_id):
+        try:
+            k = analytics_options(request.GET)['k']
+        except ValueError as exc:
+            return bad_request(str(exc))
+        form = await Form.objects.only('shard').filter(id=form_id).afirst()
+        if form is None:
+            return not_found("Form not found.")
+        using = sharding.form_db(form)
+        return live.event_response(
+            live.aevent_stream(form_id, lambda: aggregates.aform_analytics(form_id, k, using))
+        )
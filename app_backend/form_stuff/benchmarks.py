@@ -0,0 +1,199 @@
+"""
+Helpers shared by the benchmark management commands.
+
+Benchmarks run against a throwaway copy of the configured database (created
+the same way the test runner does), so they never touch real data.
+`generate_dataset` also backs the `generate_dataset` command, which fills the
+configured database itself for manual load testing.
+"""
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from django.db import connection
+
+from . import aggregates, rollups, sharding, sketches
+from .answer_storage import ANSWER_COLUMNS, merge_options
+from .models import Answer, Form, Question, Response
+
+
+WORDS = [
+    'service', 'support', 'quality', 'pricing', 'delivery', 'friendly',
+    'helpful', 'website', 'experience', 'product', 'recommend', 'excellent',
+    'average', 'terrible', 'shipping', 'checkout', 'payment', 'feature',
+    'design', 'mobile', 'great', 'slow', 'fast', 'easy', 'price', 'value',
+]
+OPTIONS = ['Option %d' % n for n in range(1, 9)]
+
+
+@contextmanager
+def benchmark_database(keep=False):
+    """
+    Run the enclosed block against a freshly migrated throwaway database.
+
+    SQLite databases are created as a temporary file rather than in memory
+    so that large datasets behave like they would on disk.
+    """
+    settings_dict = connection.settings_dict
+    if connection.vendor == 'sqlite':
+        settings_dict.setdefault('TEST', {})
+        settings_dict['TEST']['NAME'] = os.path.join(
+            tempfile.gettempdir(), 'form_stuff_benchmark.sqlite3'
+        )
+    old_name = settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=keep)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keep)
+
+
+def create_form(question_count=10, seed=0, created_by=None, status=Form.PUBLISHED):
+    """
+    Create a form with a realistic mix of question types.
+
+    Returns:
+    tuple: `(form, questions)`.
+    """
+    rng = random.Random(seed)
+    form = Form.objects.create(
+        title="Benchmark form", status=status, created_by=created_by
+    )
+    types = [question_type for question_type, _ in Question.QUESTION_TYPES]
+    questions = Question.objects.bulk_create([
+        Question(
+            form=form,
+            text=f"Question {order + 1}",
+            question_type=types[order % len(types)],
+            options=(
+                None if types[order % len(types)] == Question.TEXT
+                else rng.sample(OPTIONS, rng.randint(3, len(OPTIONS)))
+            ),
+            order=order,
+            is_required=bool(order % 2),
+        )
+        for order in range(question_count)
+    ])
+    # bulk_create skips Question.save, which records the stored options
+    for question in questions:
+        question.stored_options = merge_options([], question.options)
+    Question.objects.bulk_update(questions, ['stored_options'])
+    return form, questions
+
+
+def random_answer(question, rng):
+    """
+    Build a plausible `text_answer` value for a question.
+    """
+    if question.question_type == Question.TEXT:
+        return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 12)))
+    if question.question_type == Question.DROPDOWN:
+        return rng.choice(question.options)
+    return rng.sample(question.options, rng.randint(1, min(3, len(question.options))))
+
+
+def seed_responses(form, questions, response_count, seed=0, batch_size=5000, using=None):
+    """
+    Bulk insert `response_count` responses answering every question.
+
+    Answers are built from ids and encoded columns directly, skipping the
+    related-object descriptors, which dominate the cost of large seeds.
+    """
+    rng = random.Random(seed)
+    remaining = response_count
+    while remaining > 0:
+        size = min(batch_size, remaining)
+        responses = Response.objects.using(using).bulk_create(
+            [Response(form=form, ip_address='127.0.0.1') for _ in range(size)]
+        )
+        Answer.objects.using(using).bulk_create(
+            [
+                Answer(
+                    response_id=response.id,
+                    question_id=question.id,
+                    **dict(zip(ANSWER_COLUMNS, question.codec.encode(random_answer(question, rng))))
+                )
+                for response in responses
+                for question in questions
+            ],
+            batch_size=batch_size
+        )
+        remaining -= size
+
+
+def generate_dataset(form_count, question_count, response_count, seed=0, created_by=None,
+                     batch_size=5000, progress=None):
+    """
+    Create forms with answered responses and build their analytics.
+
+    The questions of each form cycle through `Question.QUESTION_TYPES`, with
+    random options, and every response answers every question. The same
+    arguments always produce the same forms, questions and answers.
+
+    Parameters:
+    form_count (int): Number of forms.
+    question_count (int): Questions per form.
+    response_count (int): Responses per form.
+    created_by (User): Owner of the forms.
+    progress (callable): Called with each `(form, questions)` once it is done.
+
+    Returns:
+    list: `(form, questions)` tuples.
+    """
+    dataset = []
+    for n in range(form_count):
+        form, questions = create_form(question_count, seed=seed + n, created_by=created_by)
+        using = sharding.form_db(form)
+        seed_responses(form, questions, response_count, seed=seed + n, batch_size=batch_size, using=using)
+        # Bulk inserts bypass the serializer that keeps the analytics current
+        aggregates.rebuild_form(form.id, using=using)
+        rollups.backfill_form(form.id, using=using)
+        sketches.fold_answers(form.id, 0, 1, using=using)
+        dataset.append((form, questions))
+        if progress is not None:
+            progress((form, questions))
+    return dataset
+
+
+def measure(func, repeat=3):
+    """
+    Time `func` `repeat` times.
+
+    Returns:
+    dict: Best, median and worst wall-clock time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return {
+        'best_ms': round(min(timings), 2),
+        'median_ms': round(statistics.median(timings), 2),
+        'worst_ms': round(max(timings), 2),
+    }
+
+
+def summarize(latencies, elapsed, errors):
+    """
+    Reduce per-request latencies (in seconds) to throughput and percentiles.
+    """
+    latencies = sorted(latencies)
+    count = len(latencies)
+
+    def percentile(fraction):
+        return round(latencies[min(count - 1, int(fraction * count))] * 1000, 2)
+
+    return {
+        'requests': count,
+        'errors': errors,
+        'requests_per_second': round(count / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'max_ms': round(latencies[-1] * 1000, 2),
+    }
@@ -0,0 +1,57 @@
+"""
+Database connection tuning.
+
+`configure_sqlite` runs for every new database connection and applies the
+SQLite pragmas of the active profile (`FORM_STUFF_DB_PROFILE`, set from
+`DJANGO_DB_PROFILE`). The production profile sets:
+
+* ``journal_mode=WAL``: readers no longer block the writer, nor the writer
+  readers. The mode is stored in the database file.
+* ``synchronous=NORMAL``: in WAL mode a commit no longer waits for fsync;
+  a power loss may lose the last commits but cannot corrupt the database.
+* ``mmap_size``: pages are read through a memory map instead of read()
+  calls.
+* ``busy_timeout``: a connection waits up to this many milliseconds for a
+  lock instead of failing with "database is locked".
+
+`FORM_STUFF_SQLITE_PRAGMAS` replaces the profile's pragmas when set.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+PRODUCTION_SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+PROFILE_SQLITE_PRAGMAS = {
+    'default': {},
+    'production': PRODUCTION_SQLITE_PRAGMAS,
+}
+
+
+def sqlite_pragmas():
+    """
+    Return the pragmas applied to new SQLite connections.
+    """
+    pragmas = getattr(settings, 'FORM_STUFF_SQLITE_PRAGMAS', None)
+    if pragmas is None:
+        profile = getattr(settings, 'FORM_STUFF_DB_PROFILE', 'default')
+        pragmas = PROFILE_SQLITE_PRAGMAS.get(profile, {})
+    return pragmas
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = sqlite_pragmas()
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,200 @@
+"""
+Wide-table exports of form responses.
+
+A form is exported as one row per response and one column per question (in
+`Question.order`), preceded by the response metadata columns. Rows come from
+a single server-side cursor over responses LEFT JOINed to their answers and
+ordered by `(submitted_at, id)`, so only one response is held in memory at a
+time regardless of how many the form has.
+
+Supported formats:
+
+* ``csv``: RFC 4180 CSV with a header row; checkbox answers are joined
+  with ``"; "``.
+* ``ndjson``: one JSON object per line, answers keep their JSON types.
+* ``columnar``: a compact column-major binary format. After the ``FSCOL1``
+  magic line comes a length-prefixed JSON header with the column names,
+  then row groups. Each row group is a row count followed by one
+  length-prefixed, zlib-compressed JSON array per column. A zero row count
+  ends the file. `read_columnar` decodes it.
+"""
+import csv
+import json
+import struct
+import zlib
+from datetime import datetime
+from itertools import groupby, islice
+from operator import itemgetter
+
+from rest_framework.utils import encoders
+
+from .answer_storage import ANSWER_COLUMNS, AnswerCodec
+from .models import Question, Response
+
+
+FORMATS = ('csv', 'ndjson', 'columnar')
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'columnar': 'application/octet-stream',
+}
+EXTENSIONS = {'csv': 'csv', 'ndjson': 'ndjson', 'columnar': 'fscol'}
+META_COLUMNS = ['response_id', 'submitted_at', 'ip_address', 'user_agent']
+
+CHUNK_SIZE = 2000
+ROW_GROUP_SIZE = 10000
+COLUMNAR_MAGIC = b'FSCOL1\n'
+_LENGTH = struct.Struct('<I')
+
+
+def export_questions(form_id):
+    """
+    Return `(question_id, column name, answer codec)` triples in question
+    order.
+
+    Column names are the question texts, suffixed with the question id when
+    two questions share the same text.
+    """
+    questions = list(
+        Question.objects.filter(form_id=form_id).order_by('order').values_list(
+            'id', 'text', 'question_type', 'stored_options'
+        )
+    )
+    texts = [text for _, text, _, _ in questions]
+    return [
+        (
+            question_id,
+            text if texts.count(text) == 1 else f"{text} [{question_id}]",
+            AnswerCodec(question_type, stored_options)
+        )
+        for question_id, text, question_type, stored_options in questions
+    ]
+
+
+def export_columns(questions):
+    return META_COLUMNS + [name for _, name, _ in questions]
+
+
+def iter_rows(form_id, questions, chunk_size=CHUNK_SIZE, using=None):
+    """
+    Yield one list per response: the metadata columns, then the answer to
+    every question (None when unanswered).
+    """
+    question_ids = [question_id for question_id, _, _ in questions]
+    codecs = {question_id: codec for question_id, _, codec in questions}
+    rows = Response.objects.using(using).filter(form_id=form_id).order_by(
+        'submitted_at', 'id'
+    ).values_list(
+        'id', 'submitted_at', 'ip_address', 'user_agent', 'answers__question_id',
+        *(f'answers__{column}' for column in ANSWER_COLUMNS)
+    )
+    for meta, group in groupby(rows.iterator(chunk_size=chunk_size), key=itemgetter(0, 1, 2, 3)):
+        answers = {
+            row[4]: codecs[row[4]].decode(*row[5:])
+            for row in group if row[4] is not None
+        }
+        yield list(meta) + [answers.get(question_id) for question_id in question_ids]
+
+
+def _csv_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, list):
+        return '; '.join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(value)
+    return value
+
+
+class _Echo:
+    """
+    File-like object whose `write` returns the written value, so `csv.writer`
+    can be used to format rows for a streaming response.
+    """
+
+    def write(self, value):
+        return value
+
+
+def csv_chunks(columns, rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow([_csv_cell(value) for value in row])
+
+
+def ndjson_chunks(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=encoders.JSONEncoder) + '\n'
+
+
+def _block(payload):
+    return _LENGTH.pack(len(payload)) + payload
+
+
+def columnar_chunks(columns, rows, row_group_size=ROW_GROUP_SIZE):
+    yield COLUMNAR_MAGIC
+    yield _block(json.dumps({'columns': columns}).encode())
+    rows = iter(rows)
+    while True:
+        group = list(islice(rows, row_group_size))
+        if not group:
+            break
+        yield _LENGTH.pack(len(group))
+        for values in zip(*group):
+            encoded = json.dumps(values, cls=encoders.JSONEncoder).encode()
+            yield _block(zlib.compress(encoded))
+    yield _LENGTH.pack(0)
+
+
+def read_columnar(stream):
+    """
+    Decode a ``columnar`` export.
+
+    Yields:
+    dict: One mapping of column name to the list of its values per row group.
+    """
+    if stream.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("Not a columnar export.")
+
+    def read_block():
+        (length,) = _LENGTH.unpack(stream.read(_LENGTH.size))
+        return stream.read(length)
+
+    columns = json.loads(read_block())['columns']
+    while True:
+        (row_count,) = _LENGTH.unpack(stream.read(_LENGTH.size))
+        if not row_count:
+            return
+        yield {
+            column: json.loads(zlib.decompress(read_block()))
+            for column in columns
+        }
+
+
+WRITERS = {
+    'csv': csv_chunks,
+    'ndjson': ndjson_chunks,
+    'columnar': columnar_chunks,
+}
+
+
+def export_form(form_id, export_format, chunk_size=CHUNK_SIZE, using=None):
+    """
+    Stream the responses of a form in the requested format.
+
+    Parameters:
+    using (str): The form's shard (see `sharding`).
+
+    Returns:
+    iterator: Chunks of `str` (csv, ndjson) or `bytes` (columnar).
+    """
+    questions = export_questions(form_id)
+    columns = export_columns(questions)
+    return WRITERS[export_format](columns, iter_rows(form_id, questions, chunk_size, using))
+
+
+def export_filename(form_id, export_format):
+    return f"form-{form_id}-responses.{EXTENSIONS[export_format]}"
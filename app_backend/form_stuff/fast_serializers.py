@@ -0,0 +1,304 @@
+"""
+Compiled, read-only rendering of model serializers.
+
+A `ModelSerializer` resolves every field of every object through DRF's
+generic machinery: attribute lookups, per-field `get_attribute` and
+`to_representation` calls and an `OrderedDict` per row. For the large lists
+served by `FormResponsesView` and `FormViewSet.list` that dominates the CPU
+time of the request.
+
+`CompiledSerializer` introspects a serializer class once and turns it into a
+list of `values_list()` columns plus a converter per field. Rows are then
+rendered straight from the tuples the database returns; fields whose DRF
+representation of a non-null value is the value itself (integers, strings,
+booleans, choices, JSON) are copied as they are, and every other field goes
+through the serializer field's own `to_representation`, so the output is
+the same as the serializer's. Nested many-to-one serializers, such as the
+questions of a form, are loaded with one query for the whole list.
+
+`dumps` encodes the result with orjson when it is installed and the stdlib
+`json` module otherwise, producing the same bytes as DRF's `JSONRenderer`.
+orjson writes floats in its own notation and refuses integers beyond 64
+bits, so payloads holding either (which only JSON fields can) are encoded
+with `json`.
+
+The fast path is used by the routes listed in `FORM_STUFF_FAST_SERIALIZER_ROUTES`
+when the client asked for plain JSON; the browsable API and indented JSON
+keep going through DRF.
+"""
+import json
+from collections import defaultdict
+from functools import lru_cache, partial
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from rest_framework import fields as drf_fields, relations, serializers
+from rest_framework import ISO_8601
+from rest_framework.settings import api_settings
+
+from . import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+DEFAULT_ROUTES = ('form-responses', 'form-list')
+
+# Fields whose representation of a non-null value is the value itself.
+# Matched by exact type, as subclasses may override `to_representation`.
+IDENTITY_FIELDS = (
+    drf_fields.BooleanField,
+    drf_fields.CharField,
+    drf_fields.ChoiceField,
+    drf_fields.EmailField,
+    drf_fields.IntegerField,
+    drf_fields.IPAddressField,
+    drf_fields.ReadOnlyField,
+)
+
+
+def fast_routes():
+    return getattr(settings, 'FORM_STUFF_FAST_SERIALIZER_ROUTES', DEFAULT_ROUTES)
+
+
+def use_fast_path(request):
+    """
+    Whether a DRF request should be answered by the compiled serializers:
+    its route is enabled and it negotiated JSON without indentation.
+    """
+    match = request.resolver_match
+    if match is None or match.url_name not in fast_routes():
+        return False
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is not None and renderer.format != 'json':
+        return False
+    return 'indent' not in (getattr(request, 'accepted_media_type', None) or '')
+
+
+class JSONFloat(float):
+    """
+    A float read from a JSON field. orjson hands it to `_refuse`, so the
+    payload is encoded by `json` with Python's float notation.
+    """
+
+
+def _refuse(value):
+    raise TypeError(f"{type(value).__name__} is encoded with json")
+
+
+def _json_value(value):
+    """
+    Mark the floats in a JSON field value (see `JSONFloat`), copying only
+    the containers that hold one.
+    """
+    if type(value) is float:
+        return JSONFloat(value)
+    if type(value) is list:
+        marked = [_json_value(item) for item in value]
+        return value if all(a is b for a, b in zip(marked, value)) else marked
+    if type(value) is dict:
+        marked = {key: _json_value(item) for key, item in value.items()}
+        return value if all(marked[key] is item for key, item in value.items()) else marked
+    return value
+
+
+def dumps(data):
+    """
+    Encode `data` into the bytes DRF's `JSONRenderer` would produce.
+    """
+    compact = api_settings.COMPACT_JSON and api_settings.UNICODE_JSON and api_settings.STRICT_JSON
+    content = None
+    if orjson is not None and compact:
+        try:
+            content = orjson.dumps(data, default=_refuse, option=orjson.OPT_PASSTHROUGH_SUBCLASS)
+        except (orjson.JSONEncodeError, TypeError):
+            # Integers beyond 64 bits, floats and other subclasses
+            pass
+    if content is None:
+        content = json.dumps(
+            data,
+            ensure_ascii=not api_settings.UNICODE_JSON,
+            allow_nan=not api_settings.STRICT_JSON,
+            separators=(',', ':') if api_settings.COMPACT_JSON else (', ', ': ')
+        ).encode()
+    # Like JSONRenderer, escape the line separators JavaScript rejects
+    return content.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+def _iso_datetime(field):
+    """
+    `DateTimeField.to_representation` for ISO 8601 output, with the field's
+    time zone resolved once instead of for every value.
+    """
+    field_timezone = field.timezone if hasattr(field, 'timezone') else field.default_timezone()
+    if field_timezone is None:
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str) or value.utcoffset() is None:
+            return field.to_representation(value)
+        value = value.astimezone(field_timezone).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+def json_response(data):
+    return HttpResponse(dumps(data), content_type='application/json')
+
+
+class CompiledSerializer:
+    """
+    A read-only serializer rendering `values_list()` rows of a model.
+
+    Parameters:
+    serializer_class (type): The `ModelSerializer` to reproduce.
+    nested (dict): Queryset per nested list field, giving the order of the
+                   nested objects, e.g. `{'questions': Question.objects.order_by('order')}`.
+                   Defaults to the nested model's default manager.
+
+    Raises:
+    ImproperlyConfigured: If the serializer has a field that cannot be read
+                          from a database column.
+    """
+
+    def __init__(self, serializer_class, nested=None):
+        nested = nested or {}
+        serializer = serializer_class()
+        self.model = serializer.Meta.model
+        self.names = []
+        self.columns = []
+        self.converters = []
+        # (position in the output, foreign key, CompiledSerializer, queryset)
+        self.children = []
+        # (name, column): DRF leaves out a field read through a relation
+        # when the relation is null
+        self.optional = []
+        relations_read = []
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if isinstance(field, serializers.ListSerializer):
+                self.children.append((len(self.names), *self._compile_child(field, nested)))
+                self.names.append(field.field_name)
+                continue
+            self.names.append(field.field_name)
+            self.columns.append(self._column(field))
+            self.converters.append(self._converter(serializer_class, field))
+            if '.' in field.source:
+                relations_read.append((field.field_name, field.source.partition('.')[0]))
+        # Extra columns follow the rendered ones
+        for name, relation in relations_read:
+            self.optional.append((name, len(self.columns)))
+            self.columns.append(self.model._meta.get_field(relation).attname)
+        # Nested lists are matched to their parents by primary key
+        self.pk_index = len(self.columns)
+        self.columns.append('pk')
+
+    def _converter(self, serializer_class, field):
+        """
+        Return a function producing, for one call of `serialize_rows`, the
+        function that turns a non-null column value into the field's
+        representation. None when that is the value itself.
+        """
+        if isinstance(field, relations.PrimaryKeyRelatedField) and not field.pk_field:
+            return None
+        if type(field) in IDENTITY_FIELDS:
+            return None
+        if type(field) is drf_fields.JSONField and not field.binary:
+            return lambda: _json_value
+        if isinstance(field, (serializers.BaseSerializer, relations.RelatedField, drf_fields.SerializerMethodField)):
+            raise ImproperlyConfigured(f"{serializer_class.__name__}.{field.field_name} cannot be compiled.")
+        if type(field) is drf_fields.DateTimeField:
+            output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+            if output_format is not None and output_format.lower() == ISO_8601:
+                return partial(_iso_datetime, field)
+        return lambda: field.to_representation
+    def _column(self, field):
+        if field.source == '*':
+            raise ImproperlyConfigured(f"{field.field_name} reads the whole object and cannot be compiled.")
+        if '.' in field.source:
+            relation, _, attribute = field.source.partition('.')
+            if '.' in attribute or not self.model._meta.get_field(relation).many_to_one:
+                raise ImproperlyConfigured(
+                    f"{field.field_name} must read a field of a foreign key to be compiled."
+                )
+            return f'{relation}__{attribute}'
+        model_field = self.model._meta.get_field(field.source)
+        return model_field.attname if model_field.is_relation else model_field.name
+
+    def _compile_child(self, field, nested):
+        relation = self.model._meta.get_field(field.source)
+        if not relation.one_to_many:
+            raise ImproperlyConfigured(f"{field.field_name} must be a reverse foreign key to be compiled.")
+        child = CompiledSerializer(type(field.child))
+        queryset = nested.get(field.field_name, relation.related_model._default_manager.all())
+        return relation.field.attname, child, queryset
+
+    def serialize_rows(self, rows, using=None):
+        """
+        Render rows read with `values_list(*self.columns)`.
+
+        Returns:
+        list: One dict per row, equal to the serializer's `.data`.
+        """
+        with metrics.timed():
+            children = [
+                (position, self._load_children(rows, fk, child, queryset, using))
+                for position, fk, child, queryset in self.children
+            ]
+            names = self.names
+            # The current time zone is looked up once for all rows
+            converters = [None if bind is None else bind() for bind in self.converters]
+            optional = self.optional
+            pk_index = self.pk_index
+            data = []
+            for row in rows:
+                values = [
+                    value if converter is None or value is None else converter(value)
+                    for converter, value in zip(converters, row)
+                ]
+                for position, by_parent in children:
+                    values.insert(position, by_parent.get(row[pk_index], []))
+                item = dict(zip(names, values))
+                for name, column in optional:
+                    if row[column] is None:
+                        del item[name]
+                data.append(item)
+            return data
+
+    def _load_children(self, rows, fk, child, queryset, using):
+        if not rows:
+            return {}
+        parent_ids = [row[self.pk_index] for row in rows]
+        child_rows = queryset.using(using).filter(**{f'{fk}__in': parent_ids}).values_list(fk, *child.columns)
+        grouped = defaultdict(list)
+        for parent_id, *child_row in child_rows:
+            grouped[parent_id].append(child_row)
+        return {
+            parent_id: child.serialize_rows(child_rows, using)
+            for parent_id, child_rows in grouped.items()
+        }
+
+    def data(self, queryset):
+        """
+        Render every object of `queryset`, in its order.
+        """
+        return self.serialize_rows(list(queryset.values_list(*self.columns)), queryset.db)
+
+    async def adata(self, queryset):
+        """
+        Async counterpart of `data`, for serializers without nested lists.
+        """
+        rows = [row async for row in queryset.values_list(*self.columns)]
+        return self.serialize_rows(rows, queryset.db)
+
+
+@lru_cache(maxsize=None)
+def compiled(serializer_class):
+    """
+    Return the shared `CompiledSerializer` of a serializer class.
+    """
+    return CompiledSerializer(serializer_class)
@@ -0,0 +1,167 @@
+"""
+Idempotent response submissions and duplicate detection.
+
+A client retrying `POST /api/responses/` sends every attempt with the same
+`Idempotency-Key` header. The key is stored on the `Response`, unique per
+form, and an attempt whose key the form already has is not written again:
+it is answered with the outcome of the first attempt, flagged with an
+`Idempotent-Replayed: true` header.
+
+Recent outcomes are kept in `recent`, a bounded LRU per process holding
+`FORM_STUFF_IDEMPOTENCY_CACHE_SIZE` keys, so a retry reaching the worker
+that served the first attempt is answered without writing or querying.
+Anything else, a retry reaching another worker or one older than the LRU,
+is caught by the unique constraint on insert, which looks the key up in an
+index rather than scanning responses. New keys cost nothing extra. Queued
+submissions are deduplicated the same way when the queue is flushed (see
+`ingest`).
+
+Responses submitted without a key can only be deduplicated after the fact:
+`find_duplicates` hashes the IP address, user agent and answers of every
+response of a form (see the `dedupe_responses` command).
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework import serializers
+from rest_framework.response import Response as APIResponse
+
+from . import sharding
+from .answer_storage import ANSWER_COLUMNS
+from .models import Answer, Response
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 64
+
+
+def cache_size():
+    return getattr(settings, 'FORM_STUFF_IDEMPOTENCY_CACHE_SIZE', 10000)
+
+
+def request_key(request):
+    """
+    Return the idempotency key of a request, or None if it has none.
+
+    Raises:
+    ValidationError: If the key is empty, too long or not printable ASCII.
+    """
+    key = request.headers.get(HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH or not (key.isascii() and key.isprintable()):
+        raise serializers.ValidationError({
+            HEADER: [f"Must be 1 to {MAX_KEY_LENGTH} printable ASCII characters."]
+        })
+    return key
+
+
+class RecentKeys:
+    """
+    Bounded LRU of the outcomes of recent keyed submissions, by
+    `(form id, key)`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._outcomes = OrderedDict()
+
+    def get(self, form_id, key):
+        """
+        Return the `(status code, data)` recorded for a key, or None.
+        """
+        with self._lock:
+            outcome = self._outcomes.get((form_id, key))
+            if outcome is not None:
+                self._outcomes.move_to_end((form_id, key))
+            return outcome
+
+    def add(self, form_id, key, status_code, data):
+        with self._lock:
+            self._outcomes[(form_id, key)] = (status_code, data)
+            self._outcomes.move_to_end((form_id, key))
+            while len(self._outcomes) > cache_size():
+                self._outcomes.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._outcomes.clear()
+
+
+recent = RecentKeys()
+
+
+def stored_response(form, key):
+    """
+    Return the response a form already has for a key, or None.
+    """
+    return Response.objects.using(sharding.form_db(form)).filter(form=form, idempotency_key=key).first()
+
+
+def replay(status_code, data):
+    """
+    Answer a repeated submission with the outcome of the first one.
+    """
+    return APIResponse(data, status=status_code, headers={REPLAYED_HEADER: 'true'})
+
+
+def content_digest(form_id, ip_address, user_agent, answers):
+    """
+    Hash what identifies a submission: its form, IP address, user agent and
+    answers.
+
+    Parameters:
+    answers (list): `(question id, *ANSWER_COLUMNS)` tuples, ordered by
+                    question id.
+
+    Returns:
+    bytes: A 16-byte digest.
+    """
+    content = json.dumps([form_id, ip_address, user_agent, answers], sort_keys=True, default=str)
+    return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+
+def find_duplicates(form_id, within=None, chunk_size=2000, using=None):
+    """
+    Find the responses of a form that repeat an earlier one: same IP address,
+    user agent and answers.
+
+    Responses and answers are streamed in id order and only a digest is kept
+    per distinct submission, so memory does not grow with the answers.
+
+    Parameters:
+    within (timedelta): Only count a response as a repeat when it was
+                        submitted within this long of the one it repeats.
+
+    Returns:
+    list: `(duplicate id, original id)` pairs, the original being the
+          earliest response with the same content.
+    """
+    responses = Response.objects.using(using).filter(form_id=form_id).order_by('id').values_list(
+        'id', 'ip_address', 'user_agent', 'submitted_at'
+    ).iterator(chunk_size=chunk_size)
+    answers = Answer.objects.using(using).filter(response__form_id=form_id).order_by(
+        'response_id', 'question_id'
+    ).values_list('response_id', 'question_id', *ANSWER_COLUMNS).iterator(chunk_size=chunk_size)
+
+    seen = {}
+    duplicates = []
+    answer = next(answers, None)
+    for response_id, ip_address, user_agent, submitted_at in responses:
+        rows = []
+        while answer is not None and answer[0] <= response_id:
+            if answer[0] == response_id:
+                rows.append(answer[1:])
+            answer = next(answers, None)
+        digest = content_digest(form_id, ip_address, user_agent, rows)
+        first = seen.get(digest)
+        if first is not None and (within is None or submitted_at - first[1] <= within):
+            duplicates.append((response_id, first[0]))
+        else:
+            seen[digest] = (response_id, submitted_at)
+    return duplicates
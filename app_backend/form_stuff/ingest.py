@@ -0,0 +1,360 @@
+"""
+Queued submission ingest.
+
+In queued mode (`FORM_STUFF_INGEST_MODE = 'queued'`) `ResponseViewSet.create`
+validates a submission, appends it to a local SQLite journal running in WAL
+mode and answers `202 Accepted` with a receipt id. The `flush_submissions`
+command drains the journal and writes each batch of responses and answers
+in a single transaction, so the main database sees one writer doing large
+transactions instead of every web worker contending for the write lock.
+
+Each stored `Response` carries its `ingest_receipt`, which makes a flush
+that crashed between committing and updating the journal safe to repeat.
+Submissions repeating an idempotency key (see `idempotency`) are not
+stored again; their receipts resolve to the response stored for the key.
+A batch that races a synchronous submission storing one of its keys is
+written again one submission at a time, skipping the repeated key.
+"""
+import json
+import os
+import sqlite3
+import time
+import uuid
+from collections import defaultdict
+from contextlib import closing
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+
+from . import aggregates, idempotency, live, rollups, schema, sharding
+from .answer_storage import answer_columns
+from .models import Answer, Response
+from .serializers import ResponseSerializer
+
+
+QUEUED = 'queued'
+STORED = 'stored'
+FAILED = 'failed'
+
+SYNC_MODE = 'sync'
+QUEUED_MODE = 'queued'
+
+
+def is_queued_mode():
+    return getattr(settings, 'FORM_STUFF_INGEST_MODE', SYNC_MODE) == QUEUED_MODE
+
+
+class SubmissionQueue:
+    """
+    Durable FIFO of validated submissions stored in a SQLite file.
+    """
+
+    def __init__(self, path=None):
+        self.path = str(path or settings.FORM_STUFF_INGEST_QUEUE_PATH)
+        self._ready = False
+
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA synchronous=NORMAL')
+        if not self._ready:
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS submission ('
+                ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+                ' receipt TEXT NOT NULL UNIQUE,'
+                ' payload TEXT NOT NULL,'
+                ' status TEXT NOT NULL,'
+                ' response_id INTEGER,'
+                ' errors TEXT,'
+                ' created_at REAL NOT NULL,'
+                ' updated_at REAL NOT NULL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS submission_status_id '
+                'ON submission (status, id)'
+            )
+            self._ready = True
+        return connection
+
+    def enqueue(self, payload):
+        """
+        Append a validated submission to the queue.
+
+        Returns:
+        str: The receipt id the client can poll.
+        """
+        receipt = uuid.uuid4().hex
+        now = time.time()
+        with closing(self.connect()) as connection:
+            connection.execute(
+                'INSERT INTO submission '
+                '(receipt, payload, status, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (receipt, json.dumps(payload), QUEUED, now, now)
+            )
+        return receipt
+
+    def pending(self, limit):
+        """
+        Return up to `limit` of the oldest queued `(receipt, payload)` pairs.
+        """
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                'SELECT receipt, payload FROM submission '
+                'WHERE status = ? ORDER BY id LIMIT ?',
+                (QUEUED, limit)
+            ).fetchall()
+        return [(receipt, json.loads(payload)) for receipt, payload in rows]
+
+    def mark_stored(self, response_ids):
+        """
+        Record the `Response` id each receipt was written as.
+        """
+        now = time.time()
+        with closing(self.connect()) as connection:
+            connection.execute('BEGIN')
+            connection.executemany(
+                'UPDATE submission SET status = ?, response_id = ?, updated_at = ? '
+                'WHERE receipt = ?',
+                [(STORED, pk, now, receipt) for receipt, pk in response_ids.items()]
+            )
+            connection.execute('COMMIT')
+
+    def mark_failed(self, errors):
+        """
+        Record the validation errors of submissions that could not be stored.
+        """
+        now = time.time()
+        with closing(self.connect()) as connection:
+            connection.execute('BEGIN')
+            connection.executemany(
+                'UPDATE submission SET status = ?, errors = ?, updated_at = ? '
+                'WHERE receipt = ?',
+                [(FAILED, json.dumps(error), now, receipt) for receipt, error in errors.items()]
+            )
+            connection.execute('COMMIT')
+
+    def status(self, receipt):
+        """
+        Look up a receipt.
+
+        Returns:
+        dict: `{'receipt', 'status', 'response', 'errors'}`, or None if the
+              receipt is unknown.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                'SELECT status, response_id, errors FROM submission WHERE receipt = ?',
+                (receipt,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, response_id, errors = row
+        return {
+            'receipt': receipt,
+            'status': status,
+            'response': response_id,
+            'errors': json.loads(errors) if errors else None,
+        }
+
+    def prune(self, older_than):
+        """
+        Delete settled entries last updated more than `older_than` seconds ago.
+        """
+        with closing(self.connect()) as connection:
+            cursor = connection.execute(
+                'DELETE FROM submission WHERE status != ? AND updated_at < ?',
+                (QUEUED, time.time() - older_than)
+            )
+        return cursor.rowcount
+
+
+_queues = {}
+
+
+def get_queue():
+    """
+    Return the shared queue for `FORM_STUFF_INGEST_QUEUE_PATH`.
+    """
+    path = str(settings.FORM_STUFF_INGEST_QUEUE_PATH)
+    if path not in _queues:
+        _queues[path] = SubmissionQueue(path)
+    return _queues[path]
+
+
+def submission_payload(validated_data, idempotency_key=None):
+    """
+    Convert `ResponseSerializer.validated_data` into a JSON-serializable payload
+    that the serializer accepts again when the queue is flushed.
+    """
+    payload = {
+        'form': validated_data['form'].id,
+        'answers': [dict(answer) for answer in validated_data['answers']],
+    }
+    if validated_data.get('submitted_by') is not None:
+        payload['submitted_by'] = validated_data['submitted_by'].id
+    for field in ('ip_address', 'user_agent'):
+        if validated_data.get(field) is not None:
+            payload[field] = validated_data[field]
+    if idempotency_key is not None:
+        payload['idempotency_key'] = idempotency_key
+    return payload
+
+
+def write_batch(submissions):
+    """
+    Write validated submissions in one transaction per shard (see
+    `sharding`).
+
+    Parameters:
+    submissions (dict): Mapping of receipt to `ResponseSerializer.validated_data`.
+
+    Returns:
+    dict: Mapping of receipt to the id of the stored `Response`.
+    """
+    batches = defaultdict(dict)
+    for receipt, data in submissions.items():
+        batches[sharding.form_db(data['form'])][receipt] = data
+    stored = {}
+    for using, batch in batches.items():
+        stored.update(_write_batch(batch, using))
+    return stored
+
+
+def _write_batch(submissions, using):
+    already_stored = dict(
+        Response.objects.using(using).filter(
+            ingest_receipt__in=list(submissions)
+        ).values_list('ingest_receipt', 'id')
+    )
+    pending = {
+        receipt: data for receipt, data in submissions.items()
+        if receipt not in already_stored
+    }
+    # Submissions repeating an idempotency key, stored before or earlier in
+    # the batch, resolve to the response stored for the key
+    keyed = defaultdict(list)
+    for receipt, data in pending.items():
+        if data.get('idempotency_key') is not None:
+            keyed[(data['form'].id, data['idempotency_key'])].append(receipt)
+    stored_keys = {}
+    if keyed:
+        stored_keys = {
+            (form_id, key): pk
+            for form_id, key, pk in Response.objects.using(using).filter(
+                form_id__in={form_id for form_id, _ in keyed},
+                idempotency_key__in={key for _, key in keyed}
+            ).values_list('form_id', 'idempotency_key', 'id')
+            if (form_id, key) in keyed
+        }
+    repeats = {}
+    for form_key, receipts in keyed.items():
+        for receipt in receipts if form_key in stored_keys else receipts[1:]:
+            repeats[receipt] = form_key
+            del pending[receipt]
+
+    try:
+        responses = _store(pending, using)
+    except IntegrityError:
+        # A synchronous submission stored one of the keys since they were
+        # looked up; store the batch one submission at a time instead
+        responses = []
+        for receipt, data in pending.items():
+            try:
+                responses += _store({receipt: data}, using)
+            except IntegrityError:
+                key = data.get('idempotency_key')
+                original = key and idempotency.stored_response(data['form'], key)
+                if not original:
+                    raise
+                stored_keys[(original.form_id, key)] = original.id
+                repeats[receipt] = (original.form_id, key)
+
+    stored = {response.ingest_receipt: response.id for response in responses}
+    stored.update(already_stored)
+    stored_keys.update(
+        ((response.form_id, response.idempotency_key), response.id)
+        for response in responses if response.idempotency_key is not None
+    )
+    stored.update((receipt, stored_keys[form_key]) for receipt, form_key in repeats.items())
+    return stored
+
+
+def _store(submissions, using):
+    """
+    Write submissions and their answers, and fold them into the analytics,
+    in one transaction.
+
+    Returns:
+    list: The created responses, in `submissions` order.
+    """
+    with transaction.atomic(using=using):
+        responses = Response.objects.using(using).bulk_create([
+            Response(
+                ingest_receipt=receipt,
+                **{key: value for key, value in data.items() if key != 'answers'}
+            )
+            for receipt, data in submissions.items()
+        ])
+        answers = []
+        counted = []
+        submitted = []
+        for response, data in zip(responses, submissions.values()):
+            questions = schema.question_map(data['form'].id)
+            response_counted = []
+            for answer in data['answers']:
+                answers.append(Answer(
+                    response=response,
+                    question_id=answer['question'],
+                    **answer_columns(questions[answer['question']], answer.get('text_answer'))
+                ))
+                response_counted.append((
+                    answer['question'],
+                    questions[answer['question']].question_type,
+                    answer.get('text_answer')
+                ))
+            counted.extend(response_counted)
+            submitted.append((response.form_id, response.submitted_at, response_counted))
+        Answer.objects.using(using).bulk_create(answers, batch_size=2000)
+        aggregates.record_answers(counted, using)
+        rollups.record_submissions(submitted, using)
+        transaction.on_commit(partial(
+            live.publish, [(form_id, answers) for form_id, _, answers in submitted]
+        ), using)
+    return responses
+
+
+def flush(queue, batch_size=500):
+    """
+    Move one batch of queued submissions into the database.
+
+    Submissions are validated again so that questions edited while a
+    submission was queued cannot produce invalid answers.
+
+    Returns:
+    tuple: `(stored, failed)` counts.
+    """
+    batch = queue.pending(batch_size)
+    if not batch:
+        return 0, 0
+
+    valid = {}
+    errors = {}
+    for receipt, payload in batch:
+        serializer = ResponseSerializer(data=payload)
+        if serializer.is_valid():
+            valid[receipt] = serializer.validated_data
+            if payload.get('idempotency_key') is not None:
+                valid[receipt]['idempotency_key'] = payload['idempotency_key']
+        else:
+            errors[receipt] = serializer.errors
+
+    stored = write_batch(valid) if valid else {}
+    if stored:
+        queue.mark_stored(stored)
+    if errors:
+        queue.mark_failed(errors)
+    return len(stored), len(errors)
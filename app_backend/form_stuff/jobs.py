@@ -0,0 +1,233 @@
+"""
+Background jobs using the database as the queue.
+
+Jobs are `Job` rows. The `run_jobs` worker claims queued rows with a
+conditional UPDATE (so several workers can share the table without row
+locks) and runs them in a process pool. While they run it keeps their
+heartbeat fresh; a running job whose heartbeat goes stale for
+`FORM_STUFF_JOB_STALE_SECONDS` was left by a worker that died, and is put
+back in the queue. Artifacts are written under
+`FORM_STUFF_JOB_ROOT` to a temporary name and renamed into place once
+complete, so a half-written file is never served.
+"""
+import json
+import logging
+import os
+import re
+import socket
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.utils import encoders
+
+from . import analytics, exports, sharding
+from .models import Job
+
+
+logger = logging.getLogger(__name__)
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def job_root():
+    root = str(settings.FORM_STUFF_JOB_ROOT)
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def artifact_path(job):
+    return os.path.join(job_root(), job.artifact)
+
+
+def stale_after():
+    return timedelta(seconds=getattr(settings, 'FORM_STUFF_JOB_STALE_SECONDS', 60))
+
+
+def worker_name():
+    """
+    Name a worker process uniquely, for the jobs it claims.
+    """
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def claim_next(worker=''):
+    """
+    Atomically move the oldest queued job to running.
+
+    Parameters:
+    worker (str): The claiming worker, recorded with the job.
+
+    Returns:
+    int: The id of the claimed job, or None if the queue is empty.
+    """
+    while True:
+        job_id = Job.objects.filter(status=Job.QUEUED).order_by('id').values_list(
+            'id', flat=True
+        ).first()
+        if job_id is None:
+            return None
+        now = timezone.now()
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, worker=worker, heartbeat_at=now
+        )
+        if claimed:
+            return job_id
+
+
+def heartbeat(worker):
+    """
+    Report the running jobs claimed by `worker` alive.
+
+    Returns:
+    int: The number of jobs still running for the worker.
+    """
+    return Job.objects.filter(status=Job.RUNNING, worker=worker).update(
+        heartbeat_at=timezone.now()
+    )
+
+
+def requeue_interrupted():
+    """
+    Put jobs left running by a worker that died back in the queue.
+
+    Only jobs whose heartbeat is older than `FORM_STUFF_JOB_STALE_SECONDS`
+    are requeued, so the live jobs of other workers are left alone. Jobs
+    claimed before heartbeats were recorded go by their start time.
+
+    Returns:
+    int: The number of jobs requeued.
+    """
+    cutoff = timezone.now() - stale_after()
+    return Job.objects.filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+        status=Job.RUNNING
+    ).update(status=Job.QUEUED, started_at=None, worker='', heartbeat_at=None)
+
+
+def _write_export(job, output):
+    chunks = exports.export_form(
+        job.form_id, job.export_format, using=sharding.get_form_db(job.form_id)
+    )
+    if job.export_format == 'columnar':
+        output.writelines(chunks)
+    else:
+        output.writelines(chunk.encode() for chunk in chunks)
+
+
+def _write_analytics_snapshot(job, output):
+    snapshot = {
+        'form': job.form_id,
+        'generated_at': timezone.now(),
+        'analytics': analytics.compute_form_analytics(
+            job.form_id, using=sharding.get_form_db(job.form_id)
+        ),
+    }
+    output.write(json.dumps(snapshot, cls=encoders.JSONEncoder).encode())
+
+
+def artifact_name(job):
+    if job.kind == Job.EXPORT:
+        return f"job-{job.id}-{exports.export_filename(job.form_id, job.export_format)}"
+    return f"job-{job.id}-form-{job.form_id}-analytics.json"
+
+
+def run_job(job_id):
+    """
+    Run a claimed job to completion. Executed inside a pool process.
+
+    Returns:
+    str: The final status of the job.
+    """
+    try:
+        job = Job.objects.get(id=job_id)
+        name = artifact_name(job)
+        path = os.path.join(job_root(), name)
+        # Per process, in case a requeued job is still being written elsewhere
+        partial = f'{path}.{os.getpid()}.partial'
+        with open(partial, 'wb') as output:
+            if job.kind == Job.EXPORT:
+                _write_export(job, output)
+            else:
+                _write_analytics_snapshot(job, output)
+        os.replace(partial, path)
+        Job.objects.filter(id=job_id).update(
+            status=Job.DONE,
+            artifact=name,
+            artifact_size=os.path.getsize(path),
+            finished_at=timezone.now()
+        )
+        return Job.DONE
+    except Exception as exc:
+        logger.exception("Job %s failed", job_id)
+        Job.objects.filter(id=job_id).update(
+            status=Job.FAILED, error=str(exc), finished_at=timezone.now()
+        )
+        return Job.FAILED
+    finally:
+        connections.close_all()
+
+
+def _read_range(artifact, start, end, block_size=64 * 1024):
+    with artifact:
+        artifact.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            block = artifact.read(min(block_size, remaining))
+            if not block:
+                return
+            remaining -= len(block)
+            yield block
+
+
+def ranged_file_response(request, path, content_type, filename):
+    """
+    Serve a file, honouring a single `Range: bytes=start-end` request header.
+
+    Returns:
+    HttpResponse: 200 with the whole file, 206 with the requested range, or
+                  416 if the range cannot be satisfied.
+
+    Raises:
+    Http404: If the file does not exist, e.g. it was cleaned up.
+    """
+    try:
+        artifact = open(path, 'rb')
+    except FileNotFoundError:
+        raise Http404("The artifact no longer exists.")
+    size = os.fstat(artifact.fileno()).st_size
+    match = RANGE_RE.match(request.headers.get('Range', '').strip())
+    if not match or match.groups() == ('', ''):
+        response = FileResponse(
+            artifact, as_attachment=True, filename=filename,
+            content_type=content_type
+        )
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    start, end = match.groups()
+    if start:
+        start = int(start)
+        end = min(int(end), size - 1) if end else size - 1
+    else:
+        # Suffix range: the last N bytes
+        start = max(size - int(end), 0)
+        end = size - 1
+    if start >= size or start > end:
+        artifact.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    response = StreamingHttpResponse(
+        _read_range(artifact, start, end), status=206, content_type=content_type
+    )
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
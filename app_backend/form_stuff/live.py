@@ -0,0 +1,302 @@
+"""
+Live analytics feed over server-sent events.
+
+Every worker process has one in-process `Publisher`. Submissions written
+through `ResponseSerializer` and the ingest flusher are published once their
+transaction commits, as the keys they add to each question (see
+`analytics`). Each open feed holds a `Subscription` to its form that merges
+those deltas until the feed sends them, and a feed sends at most
+`FORM_STUFF_LIVE_MAX_UPDATES_PER_SECOND` events a second, so a burst of
+submissions reaches the viewer as one coalesced event. Publishing to a form
+nobody watches costs a dictionary lookup.
+
+A feed opens with a `snapshot` event carrying the same payload as
+`AnalyticsView`, then sends `delta` events of the form
+
+    {"responses": 3, "questions": {"12": {"type": "dropdown",
+                                          "counts": [{"option": "a", "count": 2}]}}}
+
+to be added to it. Submissions published by another worker process, or
+flushed by `flush_submissions`, are not seen as deltas; the feed sends a
+fresh snapshot every `FORM_STUFF_LIVE_RESYNC_SECONDS` to catch up with them,
+and ends after `FORM_STUFF_LIVE_MAX_SECONDS`, after which `EventSource`
+reconnects on its own. A submission committed while a snapshot is being
+read may be counted twice until the next snapshot.
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework.utils import encoders
+
+from .analytics import AGGREGATORS
+
+
+MAX_UPDATES_PER_SECOND = 2
+HEARTBEAT_SECONDS = 15
+RESYNC_SECONDS = 60
+MAX_SECONDS = 300
+# Milliseconds EventSource waits before reconnecting
+RETRY_MS = 2000
+
+
+def feed_settings():
+    """
+    Read the feed settings.
+
+    Returns:
+    dict: `interval` (minimum seconds between events), `heartbeat`,
+          `resync` and `lifetime` in seconds.
+    """
+    rate = getattr(settings, 'FORM_STUFF_LIVE_MAX_UPDATES_PER_SECOND', MAX_UPDATES_PER_SECOND)
+    return {
+        'interval': 1 / rate if rate > 0 else 0,
+        'heartbeat': getattr(settings, 'FORM_STUFF_LIVE_HEARTBEAT_SECONDS', HEARTBEAT_SECONDS),
+        'resync': getattr(settings, 'FORM_STUFF_LIVE_RESYNC_SECONDS', RESYNC_SECONDS),
+        'lifetime': getattr(settings, 'FORM_STUFF_LIVE_MAX_SECONDS', MAX_SECONDS),
+    }
+
+
+class Subscription:
+    """
+    Pending analytics deltas of one form for one open feed.
+
+    Deltas are pushed from whichever thread committed the submission, so the
+    pending counts are guarded by a lock. A subscription created inside an
+    event loop also wakes that loop when a delta arrives.
+    """
+
+    def __init__(self, form_id):
+        self.form_id = form_id
+        self.responses = 0
+        self.counts = Counter()
+        self.types = {}
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        try:
+            self._loop = asyncio.get_running_loop()
+            self._async_ready = asyncio.Event()
+        except RuntimeError:
+            self._loop = self._async_ready = None
+
+    def push(self, responses, counts, types):
+        with self._lock:
+            self.responses += responses
+            self.counts.update(counts)
+            self.types.update(types)
+        self._ready.set()
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._async_ready.set)
+            except RuntimeError:
+                # The feed's loop has already closed
+                pass
+
+    def drain(self):
+        """
+        Take the pending deltas, leaving the subscription empty.
+
+        Returns:
+        tuple: `(responses, counts, types)`.
+        """
+        with self._lock:
+            pending = self.responses, self.counts, self.types
+            self.responses, self.counts, self.types = 0, Counter(), {}
+            self._ready.clear()
+            if self._async_ready is not None:
+                self._async_ready.clear()
+        return pending
+
+    def wait(self, timeout):
+        """
+        Block until a delta is pending or `timeout` seconds have passed.
+        """
+        return self._ready.wait(timeout)
+
+    async def await_delta(self, timeout):
+        """
+        Async counterpart of `wait`.
+        """
+        try:
+            await asyncio.wait_for(self._async_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class Publisher:
+    """
+    Fans submissions out to the subscriptions of their form.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, form_id):
+        subscription = Subscription(form_id)
+        with self._lock:
+            self._subscriptions[form_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscriptions.get(subscription.form_id)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscriptions[subscription.form_id]
+
+    def watched(self, form_id):
+        return form_id in self._subscriptions
+
+    def publish(self, submissions):
+        """
+        Push the deltas of committed submissions to their subscriptions.
+
+        Parameters:
+        submissions (iterable): `(form_id, answers)` pairs, where `answers`
+                                are `(question_id, question_type, text_answer)`
+                                tuples.
+        """
+        responses = Counter()
+        counts = defaultdict(Counter)
+        types = defaultdict(dict)
+        for form_id, answers in submissions:
+            if not self.watched(form_id):
+                continue
+            responses[form_id] += 1
+            for question_id, question_type, text_answer in answers:
+                aggregator = AGGREGATORS.get(question_type)
+                if aggregator is None:
+                    continue
+                types[form_id][question_id] = question_type
+                for key in aggregator.keys(text_answer):
+                    counts[form_id][(question_id, key)] += 1
+        for form_id, count in responses.items():
+            with self._lock:
+                subscribers = list(self._subscriptions.get(form_id, ()))
+            for subscription in subscribers:
+                subscription.push(count, counts[form_id], types[form_id])
+
+
+publisher = Publisher()
+
+
+def publish(submissions):
+    """
+    Publish committed submissions to this worker's live feeds.
+    """
+    publisher.publish(submissions)
+
+
+def render_delta(responses, counts, types):
+    """
+    Render pending deltas in the vocabulary of the analytics payload.
+    """
+    aggregators = {
+        question_id: AGGREGATORS[question_type]()
+        for question_id, question_type in types.items()
+    }
+    questions = {}
+    for (question_id, key), count in counts.items():
+        aggregator = aggregators[question_id]
+        question = questions.setdefault(question_id, {'type': types[question_id], 'counts': []})
+        question['counts'].append({aggregator.label: aggregator.render(key), 'count': count})
+    return {'responses': responses, 'questions': questions}
+
+
+def event(name, data):
+    """
+    Encode one server-sent event.
+    """
+    payload = json.dumps(data, cls=encoders.JSONEncoder, separators=(',', ':'))
+    return f"event: {name}\ndata: {payload}\n\n".encode()
+
+
+def _opening():
+    return f"retry: {RETRY_MS}\n\n".encode()
+
+
+KEEPALIVE = b": keepalive\n\n"
+
+
+def event_stream(form_id, snapshot):
+    """
+    Yield the events of a form's feed, blocking the calling thread between
+    them.
+
+    The feed subscribes when the first event is requested and unsubscribes
+    when the stream ends or is closed.
+
+    Parameters:
+    form_id (int): The ID of the form.
+    snapshot (callable): Returns the current analytics payload of the form.
+    """
+    config = feed_settings()
+    subscription = publisher.subscribe(form_id)
+    try:
+        started = last_snapshot = time.monotonic()
+        yield _opening() + event('snapshot', snapshot())
+        deadline = started + config['lifetime']
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now - last_snapshot >= config['resync']:
+                subscription.drain()
+                last_snapshot = now
+                yield event('snapshot', snapshot())
+                continue
+            wait = min(config['heartbeat'], deadline - now, last_snapshot + config['resync'] - now)
+            if not subscription.wait(wait):
+                yield KEEPALIVE
+                continue
+            yield event('delta', render_delta(*subscription.drain()))
+            # Let the next deltas accumulate into a single event
+            time.sleep(config['interval'])
+    finally:
+        publisher.unsubscribe(subscription)
+
+
+async def aevent_stream(form_id, snapshot):
+    """
+    Async counterpart of `event_stream`; `snapshot` is a coroutine function.
+    """
+    config = feed_settings()
+    subscription = publisher.subscribe(form_id)
+    try:
+        started = last_snapshot = time.monotonic()
+        yield _opening() + event('snapshot', await snapshot())
+        deadline = started + config['lifetime']
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            if now - last_snapshot >= config['resync']:
+                subscription.drain()
+                last_snapshot = now
+                yield event('snapshot', await snapshot())
+                continue
+            wait = min(config['heartbeat'], deadline - now, last_snapshot + config['resync'] - now)
+            if not await subscription.await_delta(wait):
+                yield KEEPALIVE
+                continue
+            yield event('delta', render_delta(*subscription.drain()))
+            await asyncio.sleep(config['interval'])
+    finally:
+        publisher.unsubscribe(subscription)
+
+
+def event_response(stream):
+    """
+    Wrap an event stream in a response that proxies do not buffer.
+    """
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from form_stuff import rollups, sharding
+from form_stuff.models import Form
+
+
+class Command(BaseCommand):
+    help = "Rebuild the hourly analytics rollups from the raw responses."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'form_ids',
+            nargs='*',
+            type=int,
+            help="Forms to backfill. Defaults to every form."
+        )
+
+    def handle(self, *args, **options):
+        form_ids = options['form_ids'] or Form.objects.values_list('id', flat=True)
+        for form_id in form_ids:
+            submissions, values = rollups.backfill_form(
+                form_id, using=sharding.get_form_db(form_id)
+            )
+            self.stdout.write(
+                f"Form {form_id}: {submissions} hourly submission counts, "
+                f"{values} hourly value counts"
+            )
+        self.stdout.write(self.style.SUCCESS("Analytics rollups backfilled."))
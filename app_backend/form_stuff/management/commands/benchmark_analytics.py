@@ -0,0 +1,75 @@
+import json
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from form_stuff import aggregates, analytics
+from form_stuff.benchmarks import benchmark_database, create_form, measure, seed_responses
+from form_stuff.models import Question
+
+
+def per_question_analytics(form_id):
+    """
+    The original per-question implementation, kept as the baseline.
+    """
+    result = {}
+    for question in Question.objects.filter(form_id=form_id):
+        answers = question.answers.all()
+        if question.question_type == Question.TEXT:
+            counts = Counter(word.lower() for answer in answers
+                             for word in answer.text_answer.split() if len(word) >= 5)
+        elif question.question_type == Question.CHECKBOX:
+            counts = Counter(tuple(sorted(answer.text_answer)) for answer in answers)
+        else:
+            counts = Counter(answer.text_answer for answer in answers)
+        result[question.id] = counts.most_common(5)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark analytics computation on synthetic forms of increasing size. "
+        "Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            nargs='+',
+            type=int,
+            default=[10_000, 100_000, 1_000_000],
+            help="Total answer counts to benchmark."
+        )
+        parser.add_argument(
+            '--questions',
+            type=int,
+            default=10,
+            help="Questions per synthetic form."
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        results = []
+        with benchmark_database():
+            for size in sorted(options['sizes']):
+                form, questions = create_form(options['questions'])
+                seed_responses(form, questions, size // len(questions))
+                aggregates.rebuild_form(form.id)
+
+                result = {'answers': size, 'questions': len(questions)}
+                result['per_question'] = measure(
+                    lambda: per_question_analytics(form.id), options['repeat']
+                )
+                result['batched'] = measure(
+                    lambda: analytics.compute_form_analytics(form.id), options['repeat']
+                )
+                result['pre_aggregated'] = measure(
+                    lambda: aggregates.form_analytics(form.id), options['repeat']
+                )
+                results.append(result)
+                self.stderr.write(
+                    f"{size} answers: per-question {result['per_question']['median_ms']} ms, "
+                    f"batched {result['batched']['median_ms']} ms, "
+                    f"pre-aggregated {result['pre_aggregated']['median_ms']} ms"
+                )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,127 @@
+import json
+from collections import defaultdict
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from form_stuff import analytics
+from form_stuff.answer_storage import ANSWER_COLUMNS
+from form_stuff.benchmarks import benchmark_database, create_form, measure, seed_responses
+from form_stuff.models import Answer, Question
+
+
+TABLE = Answer._meta.db_table
+
+
+def answer_table_bytes():
+    """
+    Return the on-disk size of the answer table and of its indexes.
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute('VACUUM')
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = %s", [TABLE]
+            )
+            table = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = %s)",
+                [TABLE]
+            )
+            return {'table_bytes': table, 'index_bytes': cursor.fetchone()[0]}
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'VACUUM FULL {TABLE}')
+            cursor.execute(
+                "SELECT pg_table_size(%s), pg_indexes_size(%s)", [TABLE, TABLE]
+            )
+            table, indexes = cursor.fetchone()
+            return {'table_bytes': table, 'index_bytes': indexes}
+    return {}
+
+
+def expand_to_json(form_id):
+    """
+    Rewrite every answer of a form into `value_json` only, the layout of the
+    former `text_answer` column.
+    """
+    for question in Question.objects.filter(form_id=form_id):
+        answers = list(Answer.objects.filter(question=question).only(*ANSWER_COLUMNS))
+        for answer in answers:
+            answer.question = question
+            answer.value_json = answer.text_answer
+            answer.value_text = answer.value_choice = None
+        Answer.objects.bulk_update(answers, list(ANSWER_COLUMNS), batch_size=5000)
+
+
+def json_form_analytics(form_id, chunk_size=analytics.CHUNK_SIZE):
+    """
+    The analytics scan over JSON answers, as it ran before compact storage.
+    """
+    aggregators = analytics.form_aggregators(form_id)
+    rows = Answer.objects.filter(
+        question_id__in=list(aggregators)
+    ).values_list('question_id', 'value_json').iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        pending = defaultdict(list)
+        for question_id, value in chunk:
+            pending[question_id].append(value)
+        for question_id, values in pending.items():
+            aggregators[question_id][1].add_many(values)
+    return analytics.render_analytics(aggregators)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the size and scan speed of compact answer storage with the "
+        "former JSON-per-answer layout. Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--responses', type=int, default=20_000)
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def scan(self, run, answers, repeat):
+        timing = measure(run, repeat)
+        timing['answers_per_second'] = round(answers / (timing['median_ms'] / 1000))
+        return timing
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            form, questions = create_form(question_count=options['questions'])
+            seed_responses(form, questions, options['responses'])
+            answers = Answer.objects.filter(question__form=form).count()
+            results = {'answers': answers}
+
+            results['compact'] = {
+                **answer_table_bytes(),
+                'analytics_scan': self.scan(
+                    lambda: analytics.compute_form_analytics(form.id), answers, options['repeat']
+                ),
+            }
+            compact = analytics.compute_form_analytics(form.id)
+
+            expand_to_json(form.id)
+            results['json'] = {
+                **answer_table_bytes(),
+                'analytics_scan': self.scan(
+                    lambda: json_form_analytics(form.id), answers, options['repeat']
+                ),
+            }
+            if json_form_analytics(form.id) != compact:
+                self.stderr.write("Warning: the two layouts produced different analytics")
+
+        for layout in ('json', 'compact'):
+            result = results[layout]
+            self.stderr.write(
+                f"{layout}: table {result.get('table_bytes')} bytes, indexes "
+                f"{result.get('index_bytes')} bytes, analytics scan "
+                f"{result['analytics_scan']['median_ms']} ms "
+                f"({result['analytics_scan']['answers_per_second']} answers/s)"
+            )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,293 @@
+import asyncio
+import importlib
+import io
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+
+from form_stuff import aggregates
+from form_stuff.benchmarks import benchmark_database, create_form, seed_responses, summarize
+
+
+ENDPOINTS = [
+    'form_questions/{form}/',
+    'response_analytics/{form}/',
+    'form_responses/{form}/?page_size=50',
+]
+HOST = 'localhost'
+
+
+def use_async_views(enabled):
+    """
+    Re-import the URL configuration with `FORM_STUFF_ASYNC_VIEWS` toggled,
+    so both request paths can be driven from one process.
+    """
+    override = override_settings(FORM_STUFF_ASYNC_VIEWS=enabled)
+    override.enable()
+    importlib.reload(importlib.import_module('form_stuff.urls'))
+    importlib.reload(importlib.import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+    return override
+
+
+def wsgi_environ(path):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': HOST,
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': HOST,
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': io.StringIO(),
+        'wsgi.url_scheme': 'http',
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'wsgi.version': (1, 0),
+    }
+
+
+def run_wsgi(paths, threads):
+    """
+    Drive the WSGI handler from a pool of `threads` threads, like a threaded
+    WSGI worker.
+    """
+    handler = WSGIHandler()
+
+    def call(path):
+        statuses = []
+        start = time.perf_counter()
+        body = handler(wsgi_environ(path), lambda status, headers: statuses.append(status))
+        b''.join(body)
+        body.close()
+        return time.perf_counter() - start, statuses[0].startswith('200')
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(call, paths))
+    elapsed = time.perf_counter() - start
+    # Close the connections the pool threads opened
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda _: connections.close_all(), range(threads)))
+    return summarize([r[0] for r in results], elapsed, sum(not r[1] for r in results))
+
+
+async def _asgi_call(application, path):
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', HOST.encode())],
+        'server': (HOST, 80),
+        'client': ('127.0.0.1', 50000),
+    }
+    received = False
+    finished = asyncio.Event()
+    status = []
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await finished.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status.append(message['status'])
+        elif not message.get('more_body'):
+            finished.set()
+
+    start = time.perf_counter()
+    await application(scope, receive, send)
+    return time.perf_counter() - start, status[0] == 200
+
+
+async def _run_asgi(paths, concurrency):
+    application = ASGIHandler()
+    limit = asyncio.Semaphore(concurrency)
+
+    async def bounded(path):
+        async with limit:
+            return await _asgi_call(application, path)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(bounded(path) for path in paths))
+    elapsed = time.perf_counter() - start
+    return summarize([r[0] for r in results], elapsed, sum(not r[1] for r in results))
+
+
+def run_asgi(paths, concurrency):
+    """
+    Drive the ASGI handler on one event loop with `concurrency` requests in
+    flight, like a single ASGI worker.
+    """
+    return asyncio.run(_run_asgi(paths, concurrency))
+
+
+async def _http_get(reader, writer, host, path):
+    """
+    Send one keep-alive GET and read the response.
+    """
+    writer.write(
+        f"GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: keep-alive\r\n\r\n".encode()
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    else:
+        await reader.readexactly(int(headers.get('content-length', 0)))
+    return int(status_line.split()[1]) == 200
+
+
+async def _run_http(base_url, paths, concurrency):
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    prefix = url.path.rstrip('/')
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+    latencies = []
+    errors = 0
+
+    async def client():
+        nonlocal errors
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while not queue.empty():
+                path = queue.get_nowait()
+                start = time.perf_counter()
+                ok = await _http_get(reader, writer, url.netloc, prefix + path)
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return summarize(latencies, time.perf_counter() - start, errors)
+
+
+def run_http(base_url, paths, concurrency):
+    """
+    Load a running server over `concurrency` keep-alive connections.
+    """
+    return asyncio.run(_run_http(base_url, paths, concurrency))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare WSGI and ASGI throughput and latency on the public read "
+        "endpoints. By default both handlers are driven in-process against a "
+        "throwaway database; pass --wsgi-url and --asgi-url to load running "
+        "servers instead (e.g. `gunicorn form.wsgi --threads 8` and "
+        "`uvicorn form.asgi:application`)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=3000, help="Requests per target.")
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=200,
+            help="Requests in flight (ASGI and HTTP targets)."
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=8,
+            help="Worker threads of the in-process WSGI target."
+        )
+        parser.add_argument(
+            '--responses',
+            type=int,
+            default=1000,
+            help="Responses seeded into the benchmark form."
+        )
+        parser.add_argument('--wsgi-url', help="Base URL of a running WSGI server, e.g. http://127.0.0.1:8000/api/")
+        parser.add_argument('--asgi-url', help="Base URL of a running ASGI server, e.g. http://127.0.0.1:8001/api/")
+        parser.add_argument('--form-id', type=int, help="Form to request when loading running servers.")
+
+    def paths(self, form_id, requests, prefix=''):
+        return [
+            prefix + ENDPOINTS[n % len(ENDPOINTS)].format(form=form_id)
+            for n in range(requests)
+        ]
+
+    def handle(self, *args, **options):
+        if options['wsgi_url'] or options['asgi_url']:
+            results = self.load_servers(options)
+        else:
+            results = self.load_in_process(options)
+        for name, result in results.items():
+            self.stderr.write(
+                f"{name}: {result['requests_per_second']} req/s, p50 {result['p50_ms']} ms, "
+                f"p99 {result['p99_ms']} ms, {result['errors']} errors"
+            )
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def load_servers(self, options):
+        if options['form_id'] is None:
+            raise CommandError("--form-id is required when loading running servers.")
+        paths = self.paths(options['form_id'], options['requests'], '/')
+        results = {}
+        for name in ('wsgi', 'asgi'):
+            url = options[f'{name}_url']
+            if url:
+                results[name] = run_http(url, paths, options['concurrency'])
+        return results
+
+    def load_in_process(self, options):
+        with benchmark_database():
+            form, questions = create_form()
+            seed_responses(form, questions, options['responses'])
+            aggregates.rebuild_form(form.id)
+            paths = self.paths(form.id, options['requests'], '/api/')
+
+            results = {}
+            override = use_async_views(False)
+            try:
+                results['wsgi'] = run_wsgi(paths, options['threads'])
+            finally:
+                override.disable()
+            override = use_async_views(True)
+            try:
+                results['asgi'] = run_asgi(paths, options['concurrency'])
+            finally:
+                override.disable()
+                use_async_views(settings.FORM_STUFF_ASYNC_VIEWS).disable()
+            connections.close_all()
+        return results
@@ -0,0 +1,121 @@
+import json
+import random
+import tracemalloc
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from form_stuff.analytics import CHUNK_SIZE, CheckboxAggregator
+from form_stuff.benchmarks import measure
+
+
+def checkbox_answers(count, option_count, seed=0):
+    """
+    Build `count` checkbox answers over `option_count` options.
+    """
+    rng = random.Random(seed)
+    options = [f"Option {n}" for n in range(1, option_count + 1)]
+    return options, [
+        rng.sample(options, rng.randint(1, min(4, option_count)))
+        for _ in range(count)
+    ]
+
+
+def chunks(answers):
+    for start in range(0, len(answers), CHUNK_SIZE):
+        yield answers[start:start + CHUNK_SIZE]
+
+
+def tuple_counts(answers):
+    """
+    The original sorted-tuple implementation, kept as the baseline.
+    """
+    counts = Counter()
+    for chunk in chunks(answers):
+        counts.update(tuple(sorted(answer)) for answer in chunk)
+    return counts
+
+
+def tuple_co_occurrence(options, answers):
+    """
+    Per-option and pairwise counts from the distinct sorted tuples.
+    """
+    index = {option: position for position, option in enumerate(options)}
+    matrix = [[0] * len(options) for _ in options]
+    for combination, count in tuple_counts(answers).items():
+        for first in combination:
+            for second in combination:
+                matrix[index[first]][index[second]] += count
+    return matrix
+
+
+def bitmask_counts(options, answers):
+    aggregator = CheckboxAggregator(options)
+    for chunk in chunks(answers):
+        aggregator.add_many(chunk)
+    return aggregator
+
+
+def peak_memory(func):
+    """
+    Return the peak memory allocated by `func`, in KiB.
+    """
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1024)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark checkbox combination counting with sorted tuples against "
+        "integer bitmasks, in memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--answers',
+            type=int,
+            default=1_000_000,
+            help="Number of checkbox answers to count."
+        )
+        parser.add_argument(
+            '--options',
+            nargs='+',
+            type=int,
+            default=[5, 20, 60],
+            help="Option counts per question to benchmark."
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        results = []
+        for option_count in options['options']:
+            question_options, answers = checkbox_answers(options['answers'], option_count)
+            result = {'answers': options['answers'], 'options': option_count}
+            result['tuples'] = measure(lambda: tuple_counts(answers), options['repeat'])
+            result['tuples']['peak_kib'] = peak_memory(lambda: tuple_counts(answers))
+            result['bitmasks'] = measure(
+                lambda: bitmask_counts(question_options, answers), options['repeat']
+            )
+            result['bitmasks']['peak_kib'] = peak_memory(
+                lambda: bitmask_counts(question_options, answers)
+            )
+            result['tuples_co_occurrence'] = measure(
+                lambda: tuple_co_occurrence(question_options, answers), options['repeat']
+            )
+            result['bitmasks_co_occurrence'] = measure(
+                lambda: bitmask_counts(question_options, answers).result(), options['repeat']
+            )
+            results.append(result)
+            self.stderr.write(
+                f"{option_count} options: counting tuples {result['tuples']['median_ms']} ms "
+                f"({result['tuples']['peak_kib']} KiB), "
+                f"bitmasks {result['bitmasks']['median_ms']} ms "
+                f"({result['bitmasks']['peak_kib']} KiB); "
+                f"with marginals and co-occurrence: tuples "
+                f"{result['tuples_co_occurrence']['median_ms']} ms, "
+                f"bitmasks {result['bitmasks_co_occurrence']['median_ms']} ms"
+            )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,155 @@
+import json
+import random
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection, connections
+from django.db.utils import OperationalError
+from django.test.utils import override_settings
+
+from form_stuff import aggregates
+from form_stuff.benchmarks import benchmark_database, create_form, random_answer, seed_responses
+from form_stuff.serializers import ResponseSerializer
+
+
+# Connection settings of each profile, mirroring form/settings.py
+PROFILES = {
+    'sqlite': {
+        'default': {'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+        'production': {'CONN_MAX_AGE': 600, 'OPTIONS': {'transaction_mode': 'IMMEDIATE'}},
+    },
+    'postgresql': {
+        'default': {'CONN_MAX_AGE': 0, 'OPTIONS': {}},
+        'production': {'CONN_MAX_AGE': 600, 'OPTIONS': {}},
+    },
+}
+
+
+def percentile(latencies, fraction):
+    if not latencies:
+        return None
+    latencies = sorted(latencies)
+    return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 2)
+
+
+class Worker(threading.Thread):
+    """
+    Repeat one operation until the deadline, ending each like a request
+    ends: `close_old_connections` closes the connection unless it is
+    persistent.
+    """
+
+    def __init__(self, operation, deadline):
+        super().__init__()
+        self.operation = operation
+        self.deadline = deadline
+        self.latencies = []
+        self.errors = 0
+
+    def run(self):
+        try:
+            while time.monotonic() < self.deadline:
+                start = time.perf_counter()
+                try:
+                    self.operation()
+                    self.latencies.append(time.perf_counter() - start)
+                except OperationalError:
+                    # "database is locked" and friends
+                    self.errors += 1
+                finally:
+                    close_old_connections()
+        finally:
+            connection.close()
+
+
+def summarize(workers, seconds):
+    latencies = [latency for worker in workers for latency in worker.latencies]
+    return {
+        'operations': len(latencies),
+        'per_second': round(len(latencies) / seconds, 1),
+        'errors': sum(worker.errors for worker in workers),
+        'p50_ms': percentile(latencies, 0.50),
+        'p99_ms': percentile(latencies, 0.99),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent submission and analytics throughput under the "
+        "default and production database profiles (see form_stuff/db.py). "
+        "Each profile runs against its own throwaway database of the "
+        "configured engine."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4, help="Threads submitting responses.")
+        parser.add_argument('--readers', type=int, default=4, help="Threads reading analytics.")
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--responses', type=int, default=5000, help="Responses seeded beforehand.")
+        parser.add_argument(
+            '--profiles',
+            nargs='+',
+            default=['default', 'production'],
+            choices=['default', 'production']
+        )
+
+    def run_profile(self, profile, options):
+        settings_dict = connections['default'].settings_dict
+        saved = {key: settings_dict.get(key) for key in ('CONN_MAX_AGE', 'OPTIONS')}
+        settings_dict.update(PROFILES[connection.vendor][profile])
+        try:
+            with override_settings(FORM_STUFF_DB_PROFILE=profile), benchmark_database():
+                form, questions = create_form()
+                seed_responses(form, questions, options['responses'])
+                aggregates.rebuild_form(form.id)
+                connections.close_all()
+                return self.load(form, questions, options)
+        finally:
+            settings_dict.update(saved)
+
+    def load(self, form, questions, options):
+        rng = random.Random(0)
+        payloads = [
+            {
+                'form': form.id,
+                'answers': [
+                    {'question': question.id, 'text_answer': random_answer(question, rng)}
+                    for question in questions
+                ]
+            }
+            for _ in range(1000)
+        ]
+
+        def submit():
+            serializer = ResponseSerializer(data=rng.choice(payloads))
+            serializer.is_valid(raise_exception=True)
+            serializer.save()
+
+        def read():
+            aggregates.form_analytics(form.id)
+
+        deadline = time.monotonic() + options['seconds']
+        writers = [Worker(submit, deadline) for _ in range(options['writers'])]
+        readers = [Worker(read, deadline) for _ in range(options['readers'])]
+        for worker in writers + readers:
+            worker.start()
+        for worker in writers + readers:
+            worker.join()
+        return {
+            'submissions': summarize(writers, options['seconds']),
+            'analytics': summarize(readers, options['seconds']),
+        }
+
+    def handle(self, *args, **options):
+        results = {'engine': connection.vendor}
+        for profile in options['profiles']:
+            result = self.run_profile(profile, options)
+            results[profile] = result
+            self.stderr.write(
+                f"{profile}: {result['submissions']['per_second']} submissions/s "
+                f"({result['submissions']['errors']} errors, p99 {result['submissions']['p99_ms']} ms), "
+                f"{result['analytics']['per_second']} analytics reads/s "
+                f"({result['analytics']['errors']} errors, p99 {result['analytics']['p99_ms']} ms)"
+            )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,231 @@
+import json
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from form_stuff import metrics
+from form_stuff.benchmarks import benchmark_database, generate_dataset, random_answer, summarize
+from form_stuff.models import Answer, Form, Question, Response
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+# Name -> (method, URL template, expected status). Unbounded listings are
+# read one page at a time so the timings do not grow with the dataset.
+ENDPOINTS = {
+    'form-list': ('get', '/api/forms/', 200),
+    'form-detail': ('get', '/api/forms/{form}/', 200),
+    'question-list': ('get', '/api/questions/', 200),
+    'question-detail': ('get', '/api/questions/{question}/', 200),
+    'response-list': ('get', '/api/responses/?form={form}&page_size=100', 200),
+    'response-detail': ('get', '/api/responses/{response}/', 200),
+    'answer-list': ('get', '/api/answers/?response={response}', 200),
+    'answer-detail': ('get', '/api/answers/{answer}/', 200),
+    'analytics': ('get', '/api/response_analytics/{form}/', 200),
+    'analytics (approximate)': ('get', '/api/response_analytics/{form}/?mode=approximate', 200),
+    'analytics (last 30 days)': ('get', '/api/response_analytics/{form}/?from={month_ago}', 200),
+    'analytics-live': ('get', '/api/response_analytics/{form}/live/', 200),
+    'form-responses': ('get', '/api/form_responses/{form}/?page_size=100', 200),
+    'form-questions': ('get', '/api/form_questions/{form}/', 200),
+    'form-export': ('get', '/api/form_export/{form}/', 200),
+    'response-create': ('post', '/api/responses/', 201),
+}
+
+
+def peak_rss_kib():
+    """
+    Return the peak resident set size of this process so far, in KiB.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API endpoint through the Django test client against "
+        "a generated dataset in a throwaway database, and print throughput, "
+        "latency percentiles, query counts and peak RSS per endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forms', type=int, default=5)
+        parser.add_argument('--questions', type=int, default=10,
+                            help="Questions per form.")
+        parser.add_argument('--responses', type=int, default=5000,
+                            help="Responses per form.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=50,
+                            help="Timed requests per endpoint.")
+        parser.add_argument('--warmup', type=int, default=3,
+                            help="Untimed requests per endpoint, to fill caches.")
+        parser.add_argument('--endpoint', action='append', choices=list(ENDPOINTS),
+                            help="Only benchmark this endpoint; may be repeated.")
+        parser.add_argument('--keepdb', action='store_true',
+                            help="Keep the throwaway database and reuse its dataset on the "
+                                 "next run instead of generating it again.")
+        parser.add_argument('--output', help="Also write the JSON report to this file.")
+
+    def context(self, options):
+        """
+        Generate the dataset (unless a kept database has one) and pick the
+        objects the URL templates refer to.
+        """
+        user, _ = User.objects.get_or_create(username='benchmark')
+        if not Form.objects.exists():
+            self.stderr.write("Generating the dataset...")
+            generate_dataset(
+                options['forms'], options['questions'], options['responses'],
+                seed=options['seed'], created_by=user
+            )
+        form = Form.objects.order_by('id').first()
+        questions = list(Question.objects.filter(form=form).order_by('order'))
+        response = Response.objects.filter(form=form).order_by('id').first()
+        if response is None:
+            raise CommandError("The dataset has no responses.")
+        return {
+            'user': user,
+            'questions': questions,
+            'values': {
+                'form': form.id,
+                'question': questions[0].id,
+                'response': response.id,
+                'answer': Answer.objects.filter(response=response).values_list('id', flat=True).first(),
+                'month_ago': time.strftime('%Y-%m-%d', time.gmtime(time.time() - 30 * 86400)),
+            },
+        }
+
+    def request(self, client, method, url, body):
+        """
+        Perform one request, reading a streamed body to the end.
+
+        Returns:
+        tuple: `(seconds, status code, RequestStats, body bytes)`.
+        """
+        stats = metrics.start_request()
+        try:
+            start = time.perf_counter()
+            if method == 'post':
+                response = client.post(url, body, content_type='application/json')
+            else:
+                response = client.get(url)
+            size = (
+                sum(len(chunk) for chunk in response.streaming_content)
+                if response.streaming else len(response.content)
+            )
+            seconds = time.perf_counter() - start
+        finally:
+            metrics.finish_request()
+        return seconds, response.status_code, stats, size
+
+    def run_endpoint(self, client, context, name, options, rng_seed):
+        method, template, expected = ENDPOINTS[name]
+        url = template.format(**context['values'])
+        rng = random.Random(rng_seed)
+
+        def body():
+            if method != 'post':
+                return None
+            return json.dumps({
+                'form': context['values']['form'],
+                'answers': [
+                    {'question': question.id, 'text_answer': random_answer(question, rng)}
+                    for question in context['questions']
+                ],
+            })
+
+        for _ in range(options['warmup']):
+            self.request(client, method, url, body())
+
+        latencies, queries, db_seconds, serializer_seconds, sizes = [], [], [], [], []
+        errors = 0
+        start = time.perf_counter()
+        for _ in range(options['requests']):
+            seconds, status_code, stats, size = self.request(client, method, url, body())
+            latencies.append(seconds)
+            queries.append(stats.queries)
+            db_seconds.append(stats.db_seconds)
+            serializer_seconds.append(stats.serializer_seconds)
+            sizes.append(size)
+            errors += status_code != expected
+        result = summarize(latencies, time.perf_counter() - start, errors)
+        result.update({
+            'method': method.upper(),
+            'url': url,
+            'queries_per_request': {'min': min(queries), 'max': max(queries)},
+            'db_ms_mean': round(statistics.fmean(db_seconds) * 1000, 2),
+            'serializer_ms_mean': round(statistics.fmean(serializer_seconds) * 1000, 2),
+            'bytes_mean': round(statistics.fmean(sizes)),
+            'peak_rss_kib': peak_rss_kib(),
+        })
+        return result
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError("--requests must be at least 1.")
+        names = options['endpoint'] or list(ENDPOINTS)
+
+        setup_test_environment()
+        # Queries are counted by `metrics` around each request, not by the
+        # middleware; live feeds end after their opening snapshot
+        overrides = override_settings(FORM_STUFF_METRICS=False, FORM_STUFF_LIVE_MAX_SECONDS=0)
+        overrides.enable()
+        try:
+            with benchmark_database(keep=options['keepdb']):
+                context = self.context(options)
+                client = Client()
+                client.force_login(context['user'])
+                results = {}
+                # Writes run last so the reads see the same dataset every run
+                for index, name in enumerate(sorted(names, key=lambda name: ENDPOINTS[name][0] == 'post')):
+                    results[name] = self.run_endpoint(client, context, name, options, options['seed'] + index)
+                    self.stderr.write(
+                        f"{name}: {results[name]['requests_per_second']} req/s, "
+                        f"p50 {results[name]['p50_ms']} ms, p95 {results[name]['p95_ms']} ms, "
+                        f"p99 {results[name]['p99_ms']} ms, "
+                        f"{results[name]['queries_per_request']['max']} queries"
+                    )
+        finally:
+            overrides.disable()
+            teardown_test_environment()
+
+        report = {
+            'commit': current_commit(),
+            'dataset': {
+                'forms': options['forms'],
+                'questions': options['questions'],
+                'responses': options['responses'],
+                'seed': options['seed'],
+            },
+            'requests': options['requests'],
+            'peak_rss_kib': peak_rss_kib(),
+            'endpoints': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
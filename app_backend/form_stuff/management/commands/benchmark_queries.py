@@ -0,0 +1,120 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from form_stuff.answer_storage import ANSWER_COLUMNS
+from form_stuff.benchmarks import benchmark_database, create_form, measure, seed_responses
+from form_stuff.models import Answer, Form, Response
+from form_stuff.pagination import after_position
+
+
+def hot_queries(context):
+    """
+    The queries behind the hot endpoints, keyed by a descriptive name.
+    """
+    form_id = context['form'].id
+    middle = context['middle']
+    return {
+        'AnalyticsView (batched engine answers)': lambda: Answer.objects.filter(
+            question_id__in=context['question_ids']
+        ).values_list('question_id', *ANSWER_COLUMNS),
+        'FormResponsesView (first page)': lambda: Response.objects.filter(
+            form_id=form_id
+        ).order_by('submitted_at', 'id')[:100],
+        'FormResponsesView (deep page)': lambda: after_position(
+            Response.objects.filter(form_id=form_id), middle
+        ).order_by('submitted_at', 'id')[:100],
+        'ResponseViewSet.get_queryset (?form=)': lambda: Response.objects.filter(
+            form_id=form_id
+        ),
+        'AdminFormsView': lambda: Form.objects.filter(created_by=context['user']),
+        'AdminFormsView (published only)': lambda: Form.objects.filter(
+            created_by=context['user'], status=Form.PUBLISHED
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Report EXPLAIN output and timings for the hot endpoint queries with "
+        "and without the form_stuff indexes. Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forms', type=int, default=50)
+        parser.add_argument('--responses', type=int, default=2000,
+                            help="Responses per form.")
+        parser.add_argument('--questions', type=int, default=10)
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def seed(self, options):
+        users = [
+            User.objects.create(username=f'benchmark-{n}')
+            for n in range(options['users'])
+        ]
+        forms = []
+        for n in range(options['forms']):
+            form, questions = create_form(
+                options['questions'],
+                seed=n,
+                created_by=users[n % len(users)],
+                status=[Form.DRAFT, Form.PUBLISHED, Form.CLOSED][n % 3]
+            )
+            seed_responses(form, questions, options['responses'], seed=n)
+            forms.append((form, questions))
+
+        form, questions = forms[len(forms) // 2]
+        ordered = Response.objects.filter(form=form).order_by('submitted_at', 'id')
+        middle = ordered.values_list('submitted_at', 'id')[options['responses'] // 2]
+        return {
+            'form': form,
+            'question_ids': [question.id for question in questions],
+            'middle': middle,
+            'user': users[0],
+        }
+
+    def run_queries(self, context, repeat):
+        results = {}
+        for name, build in hot_queries(context).items():
+            queryset = build()
+            results[name] = {
+                'plan': queryset.explain().splitlines(),
+                'timing': measure(lambda: list(build()), repeat),
+            }
+        return results
+
+    def set_indexes(self, enabled):
+        models = [Form, Response, Answer]
+        with connection.schema_editor() as editor:
+            for model in models:
+                for index in model._meta.indexes:
+                    if enabled:
+                        editor.add_index(model, index)
+                    else:
+                        editor.remove_index(model, index)
+        # Refresh planner statistics so the plans reflect the current indexes
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            context = self.seed(options)
+            self.set_indexes(False)
+            before = self.run_queries(context, options['repeat'])
+            self.set_indexes(True)
+            after = self.run_queries(context, options['repeat'])
+
+        report = {
+            name: {'before': before[name], 'after': after[name]}
+            for name in before
+        }
+        for name, result in report.items():
+            self.stderr.write(
+                f"{name}: {result['before']['timing']['median_ms']} ms -> "
+                f"{result['after']['timing']['median_ms']} ms"
+            )
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,68 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+
+from form_stuff import fast_serializers
+from form_stuff.benchmarks import benchmark_database, create_form, measure, seed_responses
+from form_stuff.models import Form, Response
+from form_stuff.serializers import FormSerializer, ResponseSerializer
+from form_stuff.views import form_list_queryset
+
+
+def drf_render(serializer_class, queryset):
+    return JSONRenderer().render(serializer_class(queryset, many=True).data)
+
+
+def compiled_render(serializer_class, queryset):
+    return fast_serializers.dumps(fast_serializers.compiled(serializer_class).data(queryset))
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering form responses and forms to JSON with the DRF "
+        "serializers and with the compiled serializers, in rows per second. "
+        "Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--responses', type=int, default=20000)
+        parser.add_argument('--forms', type=int, default=500)
+        parser.add_argument('--questions', type=int, default=10,
+                            help="Questions per form.")
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = User.objects.create(username='benchmark')
+            form, questions = create_form(options['questions'], created_by=user)
+            seed_responses(form, questions, options['responses'])
+            for n in range(1, options['forms']):
+                create_form(options['questions'], seed=n, created_by=user if n % 2 else None)
+
+            cases = {
+                'ResponseSerializer (FormResponsesView)': (
+                    ResponseSerializer, lambda: Response.objects.filter(form=form), options['responses']
+                ),
+                'FormSerializer (FormViewSet.list)': (
+                    FormSerializer, lambda: form_list_queryset(Form.objects.all()), options['forms']
+                ),
+            }
+            report = {}
+            for name, (serializer_class, queryset, rows) in cases.items():
+                if drf_render(serializer_class, queryset()) != compiled_render(
+                    serializer_class, queryset().prefetch_related(None)
+                ):
+                    raise CommandError(f"{name}: the compiled output differs from DRF's.")
+                report[name] = {'rows': rows}
+                for variant, render in (('drf', drf_render), ('compiled', compiled_render)):
+                    timing = measure(lambda: render(serializer_class, queryset()), options['repeat'])
+                    timing['rows_per_second'] = round(rows / timing['median_ms'] * 1000)
+                    report[name][variant] = timing
+                self.stderr.write(
+                    f"{name}: {report[name]['drf']['rows_per_second']} rows/s -> "
+                    f"{report[name]['compiled']['rows_per_second']} rows/s"
+                )
+        report['encoder'] = 'orjson' if fast_serializers.orjson is not None else 'json'
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,100 @@
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from rest_framework import serializers
+
+from form_stuff.benchmarks import benchmark_database, create_form, random_answer
+from form_stuff.models import Answer, Response
+from form_stuff.serializers import AnswerSerializer, ResponseSerializer
+
+
+class PerAnswerResponseSerializer(serializers.ModelSerializer):
+    """
+    The original submission path, kept as the baseline: one question lookup
+    and one INSERT per answer.
+    """
+    answers = AnswerSerializer(many=True, write_only=True)
+
+    class Meta:
+        model = Response
+        fields = ['id', 'form', 'answers']
+
+    def create(self, validated_data):
+        answers_data = validated_data.pop('answers')
+        response = Response.objects.create(**validated_data)
+        for answer_data in answers_data:
+            Answer.objects.create(response=response, **answer_data)
+        return response
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test response submission through the per-answer and bulk paths. "
+        "Runs against a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--questions',
+            nargs='+',
+            type=int,
+            default=[10, 50, 100],
+            help="Question counts of the synthetic forms."
+        )
+        parser.add_argument(
+            '--submissions',
+            type=int,
+            default=200,
+            help="Submissions timed per form and path."
+        )
+
+    def submit(self, serializer_class, payloads):
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(count_query):
+            for payload in payloads:
+                serializer = serializer_class(data=payload)
+                serializer.is_valid(raise_exception=True)
+                serializer.save()
+        elapsed = time.perf_counter() - start
+        return {
+            'submissions_per_second': round(len(payloads) / elapsed, 1),
+            'queries_per_submission': round(len(queries) / len(payloads), 1),
+        }
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        results = []
+        with benchmark_database():
+            for question_count in options['questions']:
+                form, questions = create_form(question_count)
+                payloads = [
+                    {
+                        'form': form.id,
+                        'answers': [
+                            {'question': question.id, 'text_answer': random_answer(question, rng)}
+                            for question in questions
+                        ]
+                    }
+                    for _ in range(options['submissions'])
+                ]
+                result = {
+                    'questions': question_count,
+                    'per_answer': self.submit(PerAnswerResponseSerializer, payloads),
+                    'bulk': self.submit(ResponseSerializer, payloads),
+                }
+                results.append(result)
+                self.stderr.write(
+                    f"{question_count} questions: "
+                    f"per-answer {result['per_answer']['submissions_per_second']}/s, "
+                    f"bulk {result['bulk']['submissions_per_second']}/s"
+                )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,86 @@
+import json
+import random
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from form_stuff import text_analytics
+from form_stuff.benchmarks import WORDS, measure
+
+
+PUNCTUATION = ['', '', '', ',', '.', '!', '?']
+
+
+def short_texts(count, seed=0):
+    """
+    Build `count` short, punctuated text answers.
+    """
+    rng = random.Random(seed)
+    return [
+        ' '.join(
+            rng.choice(WORDS).capitalize() if rng.random() < 0.1 else rng.choice(WORDS)
+            for _ in range(rng.randint(3, 12))
+        ) + rng.choice(PUNCTUATION)
+        for _ in range(count)
+    ]
+
+
+def split_word_counts(texts, min_length=text_analytics.MIN_WORD_LENGTH):
+    """
+    The original per-answer `str.split` implementation, kept as the baseline.
+    """
+    counts = Counter()
+    for text in texts:
+        counts.update(word.lower() for word in text.split() if len(word) >= min_length)
+    return counts
+
+
+def per_answer_word_counts(texts, tokenizer):
+    counts = Counter()
+    for text in texts:
+        counts.update(tokenizer.tokenize(text))
+    return counts
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark text answer tokenization and word counting in memory, "
+        "reporting answers per second."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--answers',
+            type=int,
+            default=1_000_000,
+            help="Number of short text answers to tokenize."
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=text_analytics.BATCH_SIZE,
+            help="Answers tokenized per translate pass."
+        )
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        answers = options['answers']
+        texts = short_texts(answers)
+        tokenizer = text_analytics.default_tokenizer()
+
+        runs = {
+            'split_per_answer': lambda: split_word_counts(texts),
+            'tokenizer_per_answer': lambda: per_answer_word_counts(texts, tokenizer),
+            'tokenizer_batched': lambda: text_analytics.top_k(
+                tokenizer.count(texts, batch_size=options['batch_size'])
+            ),
+        }
+        results = {'answers': answers}
+        for name, run in runs.items():
+            timing = measure(run, options['repeat'])
+            timing['answers_per_second'] = round(answers / (timing['median_ms'] / 1000))
+            results[name] = timing
+            self.stderr.write(
+                f"{name}: {timing['median_ms']} ms, {timing['answers_per_second']} answers/s"
+            )
+        self.stdout.write(json.dumps(results, indent=2))
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from form_stuff import aggregates, sharding
+from form_stuff.models import Form
+
+
+class Command(BaseCommand):
+    help = "Check the pre-aggregated analytics counts against the raw answers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'form_ids',
+            nargs='*',
+            type=int,
+            help="Forms to check. Defaults to every form."
+        )
+        parser.add_argument(
+            '--fix',
+            action='store_true',
+            help="Rebuild the counts of every form found out of sync."
+        )
+
+    def handle(self, *args, **options):
+        form_ids = options['form_ids'] or Form.objects.values_list('id', flat=True)
+        drifted = []
+        for form_id in form_ids:
+            using = sharding.get_form_db(form_id)
+            mismatches = aggregates.check_form(form_id, using)
+            if not mismatches:
+                continue
+            drifted.append(form_id)
+            for question_id, value, stored, expected in mismatches:
+                self.stdout.write(
+                    f"Form {form_id}, question {question_id}: {value!r} "
+                    f"stored {stored}, expected {expected}"
+                )
+            if options['fix']:
+                aggregates.rebuild_form(form_id, using)
+                self.stdout.write(f"Form {form_id}: rebuilt")
+
+        if drifted and not options['fix']:
+            raise CommandError(
+                f"{len(drifted)} form(s) out of sync: "
+                + ", ".join(str(form_id) for form_id in drifted)
+            )
+        self.stdout.write(self.style.SUCCESS("Analytics aggregates are consistent."))
@@ -0,0 +1,77 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from form_stuff import aggregates, idempotency, rollups, sharding
+from form_stuff.models import Answer, Form, Response
+
+
+class Command(BaseCommand):
+    help = (
+        "Find responses repeating an earlier response of the same form (same "
+        "IP address, user agent and answers), e.g. retried submissions, and "
+        "with --delete remove them and rebuild the form's analytics."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'form_ids',
+            nargs='*',
+            type=int,
+            help="Forms to check. Defaults to every form."
+        )
+        parser.add_argument(
+            '--within',
+            type=int,
+            help="Only count a response as a repeat when it was submitted within "
+                 "this many seconds of the one it repeats. Defaults to any time."
+        )
+        parser.add_argument(
+            '--delete',
+            action='store_true',
+            help="Delete the repeats, keeping the earliest response."
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=2000,
+            help="Rows read, and repeats deleted, at a time."
+        )
+
+    def handle(self, *args, **options):
+        if options['within'] is not None and options['within'] < 0:
+            raise CommandError("--within must not be negative.")
+        within = None if options['within'] is None else timedelta(seconds=options['within'])
+        chunk_size = options['chunk_size']
+
+        form_ids = options['form_ids'] or Form.objects.values_list('id', flat=True)
+        total = 0
+        for form_id in form_ids:
+            using = sharding.get_form_db(form_id)
+            duplicates = idempotency.find_duplicates(form_id, within, chunk_size, using=using)
+            if not duplicates:
+                continue
+            total += len(duplicates)
+            if not options['delete']:
+                for duplicate_id, original_id in duplicates:
+                    self.stdout.write(f"Form {form_id}: response {duplicate_id} repeats response {original_id}")
+                continue
+            ids = [duplicate_id for duplicate_id, _ in duplicates]
+            for start in range(0, len(ids), chunk_size):
+                chunk = ids[start:start + chunk_size]
+                with transaction.atomic(using=using):
+                    Answer.objects.using(using).filter(response_id__in=chunk).delete()
+                    Response.objects.using(using).filter(id__in=chunk).delete()
+            aggregates.rebuild_form(form_id, using=using)
+            rollups.backfill_form(form_id, using=using)
+            self.stdout.write(f"Form {form_id}: {len(ids)} repeated responses deleted, analytics rebuilt")
+
+        if options['delete']:
+            if total:
+                self.stdout.write(
+                    "Run `update_sketches --rebuild` to drop the deleted answers from the approximate analytics."
+                )
+            self.stdout.write(self.style.SUCCESS(f"{total} repeated response(s) deleted."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{total} repeated response(s) found."))
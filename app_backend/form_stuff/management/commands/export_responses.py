@@ -0,0 +1,49 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from form_stuff import exports, sharding
+from form_stuff.models import Form
+
+
+class Command(BaseCommand):
+    help = "Export every response of a form as a wide table (one column per question)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('form_id', type=int)
+        parser.add_argument(
+            '--format',
+            dest='export_format',
+            choices=exports.FORMATS,
+            default='csv'
+        )
+        parser.add_argument(
+            '--output',
+            help="File to write to. Defaults to standard output."
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=exports.CHUNK_SIZE,
+            help="Rows fetched from the database cursor at a time."
+        )
+
+    def handle(self, *args, **options):
+        form = Form.objects.filter(id=options['form_id']).first()
+        if form is None:
+            raise CommandError(f"Form {options['form_id']} does not exist.")
+
+        chunks = exports.export_form(
+            form.id, options['export_format'], options['chunk_size'], sharding.form_db(form)
+        )
+        binary = options['export_format'] == 'columnar'
+        if options['output']:
+            mode, kwargs = ('wb', {}) if binary else ('w', {'newline': '', 'encoding': 'utf-8'})
+            with open(options['output'], mode, **kwargs) as output:
+                output.writelines(chunks)
+        elif binary:
+            sys.stdout.buffer.writelines(chunks)
+        else:
+            self.stdout.ending = ''
+            for chunk in chunks:
+                self.stdout.write(chunk)
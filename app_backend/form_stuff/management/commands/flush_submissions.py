@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from form_stuff import ingest
+
+
+class Command(BaseCommand):
+    help = (
+        "Write queued submissions to the database in batches. "
+        "Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help="Submissions written per transaction."
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=0.5,
+            help="Seconds to wait when the queue is empty."
+        )
+        parser.add_argument(
+            '--retention',
+            type=float,
+            default=24 * 3600,
+            help="Seconds to keep settled receipts pollable before pruning them."
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Drain the queue once and exit."
+        )
+
+    def handle(self, *args, **options):
+        queue = ingest.get_queue()
+        last_prune = 0
+        while True:
+            stored, failed = ingest.flush(queue, options['batch_size'])
+            if stored or failed:
+                self.stdout.write(f"Stored {stored}, failed {failed}")
+                continue
+
+            if time.monotonic() - last_prune > 60:
+                queue.prune(options['retention'])
+                last_prune = time.monotonic()
+            if options['once']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,54 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from form_stuff.benchmarks import generate_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the configured database with synthetic published forms, each "
+        "with a mix of text, dropdown and checkbox questions and answered "
+        "responses, and build their analytics. The same options always "
+        "generate the same data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--forms', type=int, default=10)
+        parser.add_argument('--questions', type=int, default=10,
+                            help="Questions per form.")
+        parser.add_argument('--responses', type=int, default=100000,
+                            help="Responses per form.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help="Responses inserted per bulk insert.")
+        parser.add_argument('--owner', default='benchmark',
+                            help="Username owning the forms; created if missing.")
+
+    def handle(self, *args, **options):
+        owner, _ = User.objects.get_or_create(username=options['owner'])
+        start = time.perf_counter()
+
+        def progress(generated):
+            form, questions = generated
+            self.stdout.write(
+                f"Form {form.id}: {len(questions)} questions, "
+                f"{options['responses']} responses"
+            )
+
+        dataset = generate_dataset(
+            options['forms'],
+            options['questions'],
+            options['responses'],
+            seed=options['seed'],
+            created_by=owner,
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        elapsed = time.perf_counter() - start
+        answers = sum(len(questions) for _, questions in dataset) * options['responses']
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {len(dataset)} forms, {len(dataset) * options['responses']} responses "
+            f"and {answers} answers in {elapsed:.1f}s."
+        ))
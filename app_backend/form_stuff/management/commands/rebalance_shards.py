@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from form_stuff import sharding
+from form_stuff.models import Form
+
+
+class Command(BaseCommand):
+    help = (
+        "Move forms, with their responses and analytics, onto the shard the "
+        "hash ring assigns them (e.g. after adding a shard to "
+        "FORM_STUFF_SHARDS), or move one form to a given shard."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--form',
+            type=int,
+            help="Only move this form."
+        )
+        parser.add_argument(
+            '--to',
+            help="Shard to move --form to. Defaults to its shard on the hash ring; "
+                 "a later full rebalance moves the form back there."
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="List the moves without making them."
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=sharding.CHUNK_SIZE,
+            help="Responses copied per transaction."
+        )
+
+    def handle(self, *args, **options):
+        if not sharding.enabled():
+            raise CommandError("Sharding is off: FORM_STUFF_SHARDS lists fewer than two databases.")
+        if options['to'] is not None:
+            if options['form'] is None:
+                raise CommandError("--to requires --form.")
+            if options['to'] not in sharding.shards():
+                raise CommandError(f"{options['to']!r} is not in FORM_STUFF_SHARDS.")
+
+        forms = Form.objects.only('id', 'shard').order_by('id')
+        if options['form'] is not None:
+            forms = forms.filter(id=options['form'])
+            if not forms.exists():
+                raise CommandError(f"Form {options['form']} does not exist.")
+
+        moved = 0
+        for form in forms.iterator():
+            source = form.shard or DEFAULT_DB_ALIAS
+            target = options['to'] or sharding.ring_shard(form.id)
+            if source == target:
+                continue
+            if options['dry_run']:
+                self.stdout.write(f"Form {form.id}: {source} -> {target}")
+                continue
+            responses = sharding.move_form(form, target, options['chunk_size'])
+            self.stdout.write(f"Form {form.id}: {source} -> {target}, {responses} responses moved")
+            moved += 1
+        self.stdout.write(self.style.SUCCESS(f"{moved} form(s) moved."))
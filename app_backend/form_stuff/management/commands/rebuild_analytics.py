@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from form_stuff import aggregates, sharding
+from form_stuff.models import Form
+
+
+class Command(BaseCommand):
+    help = "Rebuild the pre-aggregated analytics counts from the raw answers."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'form_ids',
+            nargs='*',
+            type=int,
+            help="Forms to rebuild. Defaults to every form."
+        )
+
+    def handle(self, *args, **options):
+        form_ids = options['form_ids'] or Form.objects.values_list('id', flat=True)
+        for form_id in form_ids:
+            rows = aggregates.rebuild_form(form_id, using=sharding.get_form_db(form_id))
+            self.stdout.write(f"Form {form_id}: {rows} value counts rebuilt")
+        self.stdout.write(self.style.SUCCESS("Analytics aggregates rebuilt."))
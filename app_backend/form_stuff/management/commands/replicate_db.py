@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from form_stuff import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        "Stand in for replication in local testing: copy the primary SQLite "
+        "database into the replica configured by DJANGO_SQLITE_REPLICA_PATH. "
+        "Runs until interrupted unless --once is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help="Seconds between copies, i.e. the replication lag."
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Copy once and exit."
+        )
+
+    def handle(self, *args, **options):
+        alias = replicas.replica_alias()
+        if alias is None:
+            raise CommandError("No replica database is configured.")
+        primary = connections[replicas.PRIMARY].settings_dict
+        replica = connections[alias].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3' or replica['ENGINE'] != primary['ENGINE']:
+            raise CommandError("replicate_db only copies SQLite databases.")
+
+        while True:
+            start = time.perf_counter()
+            replicas.copy_sqlite(str(primary['NAME']), str(replica['NAME']))
+            self.stdout.write(f"Replicated in {(time.perf_counter() - start) * 1000:.1f} ms")
+            if options['once']:
+                break
+            time.sleep(options['interval'])
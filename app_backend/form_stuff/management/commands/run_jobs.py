@@ -0,0 +1,80 @@
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+
+from form_stuff import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (exports, analytics snapshots) in a "
+        "process pool, using the database as the job queue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=2,
+            help="Jobs run concurrently."
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=1.0,
+            help="Seconds to wait for work when the queue is empty."
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help="Exit once the queue is empty and every job has finished."
+        )
+
+    def requeue_interrupted(self):
+        requeued = jobs.requeue_interrupted()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} interrupted job(s)")
+
+    def handle(self, *args, **options):
+        worker = jobs.worker_name()
+        # Beat well within the stale period so a slow loop is not taken for
+        # a dead worker; each beat also sweeps up jobs of dead workers.
+        beat_every = jobs.stale_after().total_seconds() / 4
+        self.requeue_interrupted()
+        last_beat = time.monotonic()
+
+        processes = options['processes']
+        # Workers are spawned rather than forked so they never share this
+        # process's database connections; each one sets up Django itself.
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup
+        )
+        running = {}
+        with pool:
+            while True:
+                if time.monotonic() - last_beat >= beat_every:
+                    jobs.heartbeat(worker)
+                    self.requeue_interrupted()
+                    last_beat = time.monotonic()
+
+                while len(running) < processes:
+                    job_id = jobs.claim_next(worker)
+                    if job_id is None:
+                        break
+                    running[pool.submit(jobs.run_job, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+
+                done, _ = wait(running, timeout=options['interval'], return_when=FIRST_COMPLETED)
+                for future in done:
+                    job_id = running.pop(future)
+                    self.stdout.write(f"Job {job_id}: {future.result()}")
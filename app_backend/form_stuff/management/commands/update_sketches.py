@@ -0,0 +1,60 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from form_stuff import sharding, sketches
+from form_stuff.models import Form, Question, QuestionSketch
+
+
+class Command(BaseCommand):
+    help = (
+        "Fold new answers into the approximate analytics sketches served by "
+        "`response_analytics/<form_id>/?mode=approximate`."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'form_ids',
+            nargs='*',
+            type=int,
+            help="Forms to update. Defaults to every form."
+        )
+        parser.add_argument(
+            '--partitions',
+            type=int,
+            default=1,
+            help="Number of partitions the answers are split into. Sketches "
+                 "folded with another count are rebuilt."
+        )
+        parser.add_argument(
+            '--partition',
+            type=int,
+            help="Only update this partition, so partitions can be built by "
+                 "separate workers. Defaults to all of them."
+        )
+        parser.add_argument(
+            '--rebuild',
+            action='store_true',
+            help="Drop the existing sketches and fold every answer again."
+        )
+
+    def handle(self, *args, **options):
+        partitions = options['partitions']
+        if partitions < 1:
+            raise CommandError("--partitions must be at least 1.")
+        if options['partition'] is None:
+            selected = range(partitions)
+        elif 0 <= options['partition'] < partitions:
+            selected = [options['partition']]
+        else:
+            raise CommandError("--partition must be between 0 and --partitions - 1.")
+
+        form_ids = options['form_ids'] or Form.objects.values_list('id', flat=True)
+        for form_id in form_ids:
+            using = sharding.get_form_db(form_id)
+            if options['rebuild']:
+                QuestionSketch.objects.using(using).filter(
+                    question_id__in=list(Question.objects.filter(form_id=form_id).values_list('id', flat=True))
+                ).delete()
+            for partition in selected:
+                folded = sketches.fold_answers(form_id, partition, partitions, using=using)
+                self.stdout.write(f"Form {form_id} [{partition}]: {folded} answers folded")
+        self.stdout.write(self.style.SUCCESS("Analytics sketches updated."))
@@ -0,0 +1,267 @@
+"""
+Per-endpoint request metrics.
+
+With `FORM_STUFF_METRICS` on (`DJANGO_METRICS=1`), `RequestMetricsMiddleware`
+records for every request, labelled by route and method:
+
+* the latency, as a histogram over `LATENCY_BUCKETS`,
+* the number of database queries and the time spent running them,
+* the time spent building serializer output (see `timed`),
+* the size of the response body.
+
+`/metrics` serves the totals in the Prometheus text format, and with
+`FORM_STUFF_METRICS_LOG` on every request is also logged as one JSON line on
+the `form_stuff.metrics` logger.
+
+Queries are counted by an execute wrapper installed on every new database
+connection. The per-request totals live in a context variable, so queries
+run by the async ORM's worker thread are counted against the request that
+started them. Work done while a streamed response is sent, after the
+middleware has seen the response, is not counted. With metrics off the
+wrapper only reads that variable, and the middleware only reads the
+setting.
+
+The totals are kept per process: under several workers each one serves its
+own, which Prometheus sums across scrape targets.
+"""
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger('form_stuff.metrics')
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_current = ContextVar('form_stuff_request_stats', default=None)
+
+
+def enabled():
+    return getattr(settings, 'FORM_STUFF_METRICS', False)
+
+
+def log_enabled():
+    return getattr(settings, 'FORM_STUFF_METRICS_LOG', False)
+
+
+class RequestStats:
+    """
+    What a single request has spent so far.
+    """
+    __slots__ = ('started', 'queries', 'db_seconds', 'serializer_seconds')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+
+def start_request():
+    """
+    Start recording the current request.
+
+    Returns:
+    RequestStats: The totals that queries and `timed` blocks add to.
+    """
+    stats = RequestStats()
+    _current.set(stats)
+    return stats
+
+
+def finish_request():
+    """
+    Stop recording the current request.
+
+    Returns:
+    RequestStats: The request's totals, or None if it was not recorded.
+    """
+    stats = _current.get()
+    _current.set(None)
+    return stats
+
+
+def _record_query(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.db_seconds += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+@contextmanager
+def timed(stage='serializer'):
+    """
+    Count the time spent in the block against the current request.
+
+    Parameters:
+    stage (str): The `RequestStats` total to add to; only "serializer" for
+                 now.
+    """
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        name = f'{stage}_seconds'
+        setattr(stats, name, getattr(stats, name) + time.perf_counter() - started)
+
+
+class Registry:
+    """
+    Totals of the requests served by this process, by `(route, method)`.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._statuses = {}
+
+    def observe(self, route, method, status, seconds, stats, response_bytes):
+        key = (route, method)
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            totals = self._routes.get(key)
+            if totals is None:
+                totals = self._routes[key] = {
+                    'buckets': [0] * (len(self.buckets) + 1),
+                    'seconds': 0.0,
+                    'count': 0,
+                    'queries': 0,
+                    'db_seconds': 0.0,
+                    'serializer_seconds': 0.0,
+                    'bytes': 0,
+                }
+            totals['buckets'][index] += 1
+            totals['seconds'] += seconds
+            totals['count'] += 1
+            totals['queries'] += stats.queries
+            totals['db_seconds'] += stats.db_seconds
+            totals['serializer_seconds'] += stats.serializer_seconds
+            totals['bytes'] += response_bytes
+            status_key = (route, method, str(status))
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+            self._statuses.clear()
+
+    def render(self):
+        """
+        Render the totals in the Prometheus text exposition format.
+
+        Returns:
+        str: The exposition, ending with a newline.
+        """
+        with self._lock:
+            routes = {key: {**totals, 'buckets': list(totals['buckets'])} for key, totals in self._routes.items()}
+            statuses = dict(self._statuses)
+
+        lines = [
+            '# HELP form_stuff_requests_total Requests served, by route, method and status.',
+            '# TYPE form_stuff_requests_total counter',
+        ]
+        for (route, method, status), n in sorted(statuses.items()):
+            lines.append(f'form_stuff_requests_total{_labels(route, method, status=status)} {n}')
+
+        lines += [
+            '# HELP form_stuff_request_duration_seconds Request latency, by route and method.',
+            '# TYPE form_stuff_request_duration_seconds histogram',
+        ]
+        for (route, method), totals in sorted(routes.items()):
+            cumulative = 0
+            for bound, n in zip((*self.buckets, '+Inf'), totals['buckets']):
+                cumulative += n
+                labels = _labels(route, method, le=bound)
+                lines.append(f'form_stuff_request_duration_seconds_bucket{labels} {cumulative}')
+            labels = _labels(route, method)
+            lines.append(f'form_stuff_request_duration_seconds_sum{labels} {totals["seconds"]!r}')
+            lines.append(f'form_stuff_request_duration_seconds_count{labels} {totals["count"]}')
+
+        for name, field, description in COUNTERS:
+            lines += [
+                f'# HELP {name} {description}',
+                f'# TYPE {name} counter',
+            ]
+            for (route, method), totals in sorted(routes.items()):
+                lines.append(f'{name}{_labels(route, method)} {totals[field]!r}')
+        return '\n'.join(lines) + '\n'
+
+
+COUNTERS = (
+    ('form_stuff_db_queries_total', 'queries', 'Database queries run, by route and method.'),
+    ('form_stuff_db_seconds_total', 'db_seconds', 'Time spent running database queries, by route and method.'),
+    ('form_stuff_serializer_seconds_total', 'serializer_seconds',
+     'Time spent building serializer output, by route and method.'),
+    ('form_stuff_response_bytes_total', 'bytes', 'Response body bytes, by route and method; streamed bodies count as 0.'),
+)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(route, method, **extra):
+    labels = {'route': route, 'method': method, **extra}
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+registry = Registry()
+
+
+def route_name(request):
+    """
+    Name the route a request resolved to: its view name, or its pattern for
+    unnamed routes. Unresolved requests share "unmatched", which keeps the
+    number of label values bounded.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match.route or 'unmatched'
+
+
+def observe(request, response, stats):
+    """
+    Add a finished request to the registry, and log it if enabled.
+    """
+    seconds = time.perf_counter() - stats.started
+    route = route_name(request)
+    response_bytes = 0 if response.streaming else len(response.content)
+    registry.observe(route, request.method, response.status_code, seconds, stats, response_bytes)
+    if log_enabled():
+        logger.info(json.dumps({
+            'route': route,
+            'method': request.method,
+            'status': response.status_code,
+            'seconds': round(seconds, 6),
+            'queries': stats.queries,
+            'db_seconds': round(stats.db_seconds, 6),
+            'serializer_seconds': round(stats.serializer_seconds, 6),
+            'bytes': response_bytes,
+        }))
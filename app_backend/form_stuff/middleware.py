@@ -0,0 +1,50 @@
+from django.utils.deprecation import MiddlewareMixin
+
+from . import metrics, replicas
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    """
+    Let safe requests to the routes in `FORM_STUFF_REPLICA_ROUTES` read from
+    the replica (see `form_stuff/replicas.py`), unless the client is pinned
+    to the primary after a recent write.
+    """
+
+    def process_request(self, request):
+        replicas.start_request(False)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (
+            request.method in ('GET', 'HEAD')
+            and request.resolver_match.url_name in replicas.replica_routes()
+            and replicas.PIN_COOKIE not in request.COOKIES
+            and replicas.replica_alias()
+        ):
+            replicas.start_request(True)
+
+    def process_response(self, request, response):
+        seconds = replicas.pin_seconds()
+        if replicas.wrote() and seconds and replicas.replica_alias():
+            response.set_cookie(
+                replicas.PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax'
+            )
+        return response
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """
+    Record the latency, database work, serializer time and response size of
+    every request when `FORM_STUFF_METRICS` is on (see
+    `form_stuff/metrics.py`). Listed first in `MIDDLEWARE`, so the latency
+    covers the other middleware too.
+    """
+
+    def process_request(self, request):
+        if metrics.enabled():
+            metrics.start_request()
+
+    def process_response(self, request, response):
+        stats = metrics.finish_request()
+        if stats is not None:
+            metrics.observe(request, response, stats)
+        return response
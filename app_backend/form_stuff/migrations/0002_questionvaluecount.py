@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:53
+
+import json
+from collections import Counter
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_value_counts(apps, schema_editor):
+    """
+    Seed the analytics counts from the answers collected so far.
+    """
+    Answer = apps.get_model('form_stuff', 'Answer')
+    QuestionValueCount = apps.get_model('form_stuff', 'QuestionValueCount')
+    counts = Counter()
+    rows = Answer.objects.values_list(
+        'question_id', 'question__question_type', 'text_answer'
+    )
+    for question_id, question_type, text_answer in rows.iterator():
+        if text_answer is None:
+            continue
+        if question_type == 'text':
+            if not isinstance(text_answer, str):
+                continue
+            keys = [word.lower() for word in text_answer.split() if len(word) >= 5]
+        elif question_type == 'checkbox':
+            keys = [sorted(text_answer)]
+        elif question_type == 'dropdown':
+            keys = [text_answer]
+        else:
+            continue
+        for key in keys:
+            value = json.dumps(key, sort_keys=True, separators=(',', ':'))
+            counts[(question_id, value)] += 1
+    QuestionValueCount.objects.bulk_create(
+        [
+            QuestionValueCount(question_id=question_id, value=value, count=n)
+            for (question_id, value), n in counts.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='answer',
+            name='text_answer',
+            field=models.JSONField(blank=True, help_text='Answer text for Text questions', null=True),
+        ),
+        migrations.CreateModel(
+            name='QuestionValueCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.TextField(help_text='JSON-encoded word, option or option combination')),
+                ('count', models.PositiveBigIntegerField(default=0, help_text='Number of answers contributing this value')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='value_counts', to='form_stuff.question')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('question', 'value'), name='unique_value_count_per_question')],
+            },
+        ),
+        migrations.RunPython(backfill_value_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0002_questionvaluecount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='ingest_receipt',
+            field=models.CharField(blank=True, editable=False, help_text='Receipt id of the queued submission this response was written from', max_length=32, null=True, unique=True),
+        ),
+    ]
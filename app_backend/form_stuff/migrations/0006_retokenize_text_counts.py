@@ -0,0 +1,54 @@
+import json
+from collections import Counter
+
+from django.db import migrations
+
+
+# Frozen copy of `text_analytics.Tokenizer` with its default settings, so that
+# replaying this migration always produces the same counts. Run
+# `rebuild_analytics` to recount with the tokenizer currently configured.
+MIN_WORD_LENGTH = 5
+JOINERS = "'’-"
+
+
+def tokenize(text):
+    if not isinstance(text, str):
+        return []
+    text = ''.join(char if char.isalnum() or char in JOINERS else ' ' for char in text.lower())
+    words = (token.strip(JOINERS) for token in text.split())
+    return [word for word in words if len(word) >= MIN_WORD_LENGTH]
+
+
+def retokenize_text_counts(apps, schema_editor):
+    """
+    Recount the words of text questions with the punctuation-aware tokenizer.
+    """
+    Answer = apps.get_model('form_stuff', 'Answer')
+    QuestionValueCount = apps.get_model('form_stuff', 'QuestionValueCount')
+    counts = Counter()
+    rows = Answer.objects.filter(question__question_type='text').values_list(
+        'question_id', 'text_answer'
+    )
+    for question_id, text_answer in rows.iterator():
+        for word in tokenize(text_answer):
+            value = json.dumps(word, sort_keys=True, separators=(',', ':'))
+            counts[(question_id, value)] += 1
+    QuestionValueCount.objects.filter(question__question_type='text').delete()
+    QuestionValueCount.objects.bulk_create(
+        [
+            QuestionValueCount(question_id=question_id, value=value, count=n)
+            for (question_id, value), n in counts.items()
+        ],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0005_job'),
+    ]
+
+    operations = [
+        migrations.RunPython(retokenize_text_counts, migrations.RunPython.noop),
+    ]
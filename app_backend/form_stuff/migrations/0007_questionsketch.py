@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0006_retokenize_text_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuestionSketch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('partition', models.PositiveSmallIntegerField(default=0, help_text='Partition of the answers (answer id modulo the partition count)')),
+                ('partitions', models.PositiveSmallIntegerField(default=1, help_text='Number of partitions the answers were split into')),
+                ('last_answer_id', models.PositiveBigIntegerField(default=0, help_text='Highest answer id folded into the sketches')),
+                ('answers', models.PositiveBigIntegerField(default=0, help_text='Number of answers folded into the sketches')),
+                ('heavy_hitters', models.JSONField(help_text='Space-Saving summary of the top values')),
+                ('count_min', models.BinaryField(help_text='Count-Min sketch of value counts')),
+                ('respondents', models.BinaryField(help_text='HyperLogLog registers of distinct respondents')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sketches', to='form_stuff.question')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('question', 'partition'), name='unique_sketch_per_question_partition')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0007_questionsketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormSubmissionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(help_text='Start of the hour counted')),
+                ('count', models.PositiveBigIntegerField(default=0, help_text='Number of responses submitted in the hour')),
+                ('form', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='submission_rollups', to='form_stuff.form')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('form', 'bucket_start'), name='unique_submission_rollup_per_hour')],
+            },
+        ),
+        migrations.CreateModel(
+            name='QuestionValueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket_start', models.DateTimeField(help_text='Start of the hour counted')),
+                ('value', models.TextField(help_text='JSON-encoded word, option or option combination')),
+                ('count', models.PositiveBigIntegerField(default=0, help_text='Number of answers contributing this value in the hour')),
+                ('question', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='value_rollups', to='form_stuff.question')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('question', 'bucket_start', 'value'), name='unique_value_rollup_per_hour')],
+            },
+        ),
+    ]
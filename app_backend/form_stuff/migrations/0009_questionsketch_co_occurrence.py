@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+def drop_checkbox_sketches(apps, schema_editor):
+    # Existing checkbox sketches hold no option pairs; the next
+    # update_sketches rebuilds them
+    QuestionSketch = apps.get_model('form_stuff', 'QuestionSketch')
+    QuestionSketch.objects.using(schema_editor.connection.alias).filter(
+        question__question_type='checkbox'
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0008_time_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='questionsketch',
+            name='co_occurrence',
+            field=models.JSONField(blank=True, default=dict, help_text='Checkbox questions: how often each pair of options was selected together'),
+        ),
+        migrations.RunPython(drop_checkbox_sketches, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,175 @@
+from itertools import islice
+
+from django.db import migrations, models
+
+
+CHUNK_SIZE = 2000
+# `value_choice` is a signed 64-bit column
+MAX_CHOICE_BITS = 63
+
+
+# Frozen copies of `answer_storage.merge_options` and `AnswerCodec` as of this
+# migration, so that replaying it always stores the same values
+
+def merge_options(stored_options, options):
+    stored = list(stored_options or [])
+    known = set(stored)
+    for option in options or []:
+        if isinstance(option, str) and option not in known:
+            known.add(option)
+            stored.append(option)
+    return stored
+
+
+class AnswerCodec:
+
+    def __init__(self, question_type, stored_options):
+        self.question_type = question_type
+        self.options = list(stored_options or [])
+        self.positions = {option: index for index, option in enumerate(self.options)}
+
+    def encode(self, value):
+        if self.question_type == 'text':
+            if isinstance(value, str):
+                return value, None, None
+        elif self.question_type == 'dropdown':
+            index = self.positions.get(value) if isinstance(value, str) else None
+            if index is not None:
+                return None, index, None
+        elif self.question_type == 'checkbox':
+            mask = self.encode_mask(value)
+            if mask is not None:
+                return None, mask, None
+        return None, None, value
+
+    def encode_mask(self, value):
+        if not isinstance(value, list):
+            return None
+        mask = 0
+        for option in value:
+            index = self.positions.get(option) if isinstance(option, str) else None
+            if index is None or index >= MAX_CHOICE_BITS or mask >> index & 1:
+                return None
+            mask |= 1 << index
+        return mask
+
+    def decode(self, value_text, value_choice, value_json):
+        if value_text is not None:
+            return value_text
+        if value_choice is None:
+            return value_json
+        if self.question_type == 'checkbox':
+            return [self.options[index] for index in range(MAX_CHOICE_BITS) if value_choice >> index & 1]
+        return self.options[value_choice]
+
+
+def _chunks(rows):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _submitted_options(question_type, values):
+    """
+    Collect the option strings found in stored dropdown and checkbox
+    answers, so answers given to since-removed options stay compact.
+    """
+    found = []
+    for value in values:
+        if question_type == 'dropdown' and isinstance(value, str):
+            found.append(value)
+        elif question_type == 'checkbox' and isinstance(value, list):
+            found.extend(option for option in value if isinstance(option, str))
+    return found
+
+
+def compact_answers(apps, schema_editor):
+    """
+    Move every answer from JSON into the compact columns.
+    """
+    Question = apps.get_model('form_stuff', 'Question')
+    Answer = apps.get_model('form_stuff', 'Answer')
+    for question in Question.objects.iterator():
+        answers = Answer.objects.filter(question_id=question.id)
+        stored_options = merge_options([], question.options)
+        if question.question_type in ('dropdown', 'checkbox'):
+            stored_options = merge_options(stored_options, _submitted_options(
+                question.question_type,
+                (
+                    value_json if value_json is not None else selected_options
+                    for value_json, selected_options in answers.values_list(
+                        'value_json', 'selected_options'
+                    ).iterator(chunk_size=CHUNK_SIZE)
+                )
+            ))
+        question.stored_options = stored_options
+        question.save(update_fields=['stored_options'])
+
+        codec = AnswerCodec(question.question_type, stored_options)
+        rows = answers.only('id', 'value_json', 'selected_options').order_by('id')
+        for chunk in _chunks(rows.iterator(chunk_size=CHUNK_SIZE)):
+            for answer in chunk:
+                value = answer.value_json if answer.value_json is not None else answer.selected_options
+                answer.value_text, answer.value_choice, answer.value_json = codec.encode(value)
+            Answer.objects.bulk_update(chunk, ['value_text', 'value_choice', 'value_json'])
+
+
+def expand_answers(apps, schema_editor):
+    """
+    Move every answer back into the JSON column.
+    """
+    Question = apps.get_model('form_stuff', 'Question')
+    Answer = apps.get_model('form_stuff', 'Answer')
+    for question in Question.objects.iterator():
+        codec = AnswerCodec(question.question_type, question.stored_options)
+        rows = Answer.objects.filter(question_id=question.id).only(
+            'id', 'value_text', 'value_choice', 'value_json'
+        ).order_by('id')
+        for chunk in _chunks(rows.iterator(chunk_size=CHUNK_SIZE)):
+            for answer in chunk:
+                answer.value_json = codec.decode(answer.value_text, answer.value_choice, answer.value_json)
+                answer.value_text = answer.value_choice = None
+            Answer.objects.bulk_update(chunk, ['value_text', 'value_choice', 'value_json'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0009_questionsketch_co_occurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='question',
+            name='stored_options',
+            field=models.JSONField(blank=True, default=list, editable=False, help_text='Every option the question has had; stored answers index into it'),
+        ),
+        migrations.RenameField(
+            model_name='answer',
+            old_name='text_answer',
+            new_name='value_json',
+        ),
+        migrations.AlterField(
+            model_name='answer',
+            name='value_json',
+            field=models.JSONField(blank=True, help_text='Any other answer value, as JSON', null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='value_text',
+            field=models.TextField(blank=True, help_text='Answer text for Text questions', null=True),
+        ),
+        migrations.AddField(
+            model_name='answer',
+            name='value_choice',
+            field=models.BigIntegerField(blank=True, help_text='Option index (Dropdown) or option bitmask (Checkbox) into Question.stored_options', null=True),
+        ),
+        migrations.RunPython(compact_answers, expand_answers),
+        migrations.RemoveField(
+            model_name='answer',
+            name='selected_options',
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:41
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0010_compact_answers'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='form',
+            name='shard',
+            field=models.CharField(blank=True, default='', editable=False, help_text="Database alias holding the form's responses; empty for the default database", max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='answer',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='answers', to='form_stuff.question'),
+        ),
+        migrations.AlterField(
+            model_name='formsubmissionrollup',
+            name='form',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='submission_rollups', to='form_stuff.form'),
+        ),
+        migrations.AlterField(
+            model_name='questionsketch',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sketches', to='form_stuff.question'),
+        ),
+        migrations.AlterField(
+            model_name='questionvaluecount',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='value_counts', to='form_stuff.question'),
+        ),
+        migrations.AlterField(
+            model_name='questionvaluerollup',
+            name='question',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='value_rollups', to='form_stuff.question'),
+        ),
+        migrations.AlterField(
+            model_name='response',
+            name='form',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='responses', to='form_stuff.form'),
+        ),
+        migrations.AlterField(
+            model_name='response',
+            name='submitted_by',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='form_responses', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
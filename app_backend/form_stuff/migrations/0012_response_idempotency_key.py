@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:58
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('form_stuff', '0011_form_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='response',
+            name='idempotency_key',
+            field=models.CharField(blank=True, editable=False, help_text='Idempotency-Key header the response was submitted with', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='response',
+            constraint=models.UniqueConstraint(fields=('form', 'idempotency_key'), name='unique_response_idempotency_key'),
+        ),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError
+from django.utils.functional import cached_property
 
 
 class Form(models.Model):
@@ -17,6 +18,8 @@ class Form(models.Model):
         (CLOSED, 'Closed'),
     ]
 
+    MAX_QUESTIONS = 100
+
     title = models.CharField(max_length=200, help_text="Enter the form title")
     description = models.TextField(blank=True, null=True, help_text="Form description")
     created_by = models.ForeignKey(
@@ -37,6 +40,21 @@ class Form(models.Model):
         blank=True, 
         help_text="Optional deadline for form submission"
     )
+    shard = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        editable=False,
+        help_text="Database alias holding the form's responses; empty for the default database"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['created_by', 'status'],
+                name='form_created_by_status_idx'
+            )
+        ]
 
     def __str__(self):
         return self.title
@@ -45,15 +63,20 @@ class Form(models.Model):
         return self.questions.count()
 
     def clean(self):
-        # Ensure no more than 100 questions per form
+        # Ensure no more than MAX_QUESTIONS questions per form
         # Ensure the instance is already saved before checking the question count
         if self.pk:  # Check if the instance has a primary key
-            if self.question_count() > 100:
-              raise ValidationError("A form cannot have more than 100 questions.")
+            if self.question_count() > self.MAX_QUESTIONS:
+              raise ValidationError(f"A form cannot have more than {self.MAX_QUESTIONS} questions.")
 
     def save(self, *args, **kwargs):
         self.clean()
+        adding = self._state.adding
         super().save(*args, **kwargs)
+        if adding and not self.shard:
+            # Placement hashes the id, known only once the form is inserted
+            from .sharding import place_form
+            place_form(self)
 
 
 class Question(models.Model):
@@ -101,6 +124,12 @@ class Question(models.Model):
         null=True,
         help_text="Additional help text for respondents"
     )
+    stored_options = models.JSONField(
+        default=list,
+        blank=True,
+        editable=False,
+        help_text="Every option the question has had; stored answers index into it"
+    )
 
     class Meta:
         ordering = ['order']
@@ -114,19 +143,74 @@ class Question(models.Model):
     def __str__(self):
         return f"{self.text} ({self.get_question_type_display()})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        question = super().from_db(db, field_names, values)
+        # Remembered so that a save can tell whether the type changed
+        question._stored_question_type = question.__dict__.get('question_type')
+        return question
+
+    @staticmethod
+    def answered(form_id, question_ids):
+        """
+        Return the ids, among `question_ids` of a form, of the questions
+        that have answers.
+        """
+        from .sharding import get_form_db
+        return set(
+            Answer.objects.using(get_form_db(form_id)).filter(
+                question_id__in=question_ids
+            ).values_list('question_id', flat=True).distinct()
+        )
+
+    def type_change_error(self, question_type):
+        """
+        Return why this question cannot change to `question_type`, or None.
+
+        Stored answers are encoded for the question's type (a dropdown
+        answer is an option index, a checkbox answer a bitmask, see
+        `answer_storage`) and counted by it in the analytics, so the type
+        is fixed once the question has answers.
+        """
+        stored_type = getattr(self, '_stored_question_type', None)
+        if self.pk is None or stored_type is None or question_type == stored_type:
+            return None
+        if self.pk in self.answered(self.form_id, [self.pk]):
+            return "The type of a question cannot change once it has answers."
+        return None
+
     def clean(self):
         """
         Validation for question data based on type.
         """
         if self.question_type == self.TEXT and self.options:
             raise ValidationError("options are not allowed for Text questions.")
+        error = self.type_change_error(self.question_type)
+        if error:
+            raise ValidationError({'question_type': error})
 
     def save(self, *args, **kwargs):
         # Clear options for Text questions
         if self.question_type == self.TEXT:
           self.options = None
         self.clean()
+        from .answer_storage import merge_options
+        # Options are only ever appended so stored answers keep their indexes
+        self.stored_options = merge_options(self.stored_options, self.options)
+        self.__dict__.pop('codec', None)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'options' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'stored_options'}
         super().save(*args, **kwargs)
+        self._stored_question_type = self.question_type
+
+    @cached_property
+    def codec(self):
+        """
+        The `answer_storage.AnswerCodec` of this question's answers.
+        """
+        from .answer_storage import AnswerCodec
+        return AnswerCodec(self.question_type, self.stored_options)
 
 
 class Response(models.Model):
@@ -136,14 +220,18 @@ class Response(models.Model):
     form = models.ForeignKey(
         Form, 
         related_name='responses', 
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        # May live on another database than its target (see `sharding`)
+        db_constraint=False
     )
     submitted_by = models.ForeignKey(
         User,
         related_name='form_responses',
         null=True,
         blank=True,
-        on_delete=models.SET_NULL
+        on_delete=models.SET_NULL,
+        # May live on another database than its target (see `sharding`)
+        db_constraint=False
     )
     submitted_at = models.DateTimeField(auto_now_add=True)
     ip_address = models.GenericIPAddressField(
@@ -156,6 +244,35 @@ class Response(models.Model):
         blank=True,
         help_text="Browser user agent information"
     )
+    ingest_receipt = models.CharField(
+        max_length=32,
+        unique=True,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Receipt id of the queued submission this response was written from"
+    )
+    idempotency_key = models.CharField(
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Idempotency-Key header the response was submitted with"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['form', 'submitted_at', 'id'],
+                name='response_form_submitted_idx'
+            )
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['form', 'idempotency_key'],
+                name='unique_response_idempotency_key'
+            )
+        ]
 
 class Answer(models.Model):
     """
@@ -169,15 +286,275 @@ class Answer(models.Model):
     question = models.ForeignKey(
         Question, 
         related_name='answers', 
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        # May live on another database than its target (see `sharding`)
+        db_constraint=False
     )
-    text_answer = models.JSONField(
-        blank=True, 
-        null=True, 
+    value_text = models.TextField(
+        blank=True,
+        null=True,
         help_text="Answer text for Text questions"
     )
-    selected_options = models.JSONField(
-        blank=True, 
-        null=True, 
-        help_text="Selected options for Dropdown or Checkbox questions"
+    value_choice = models.BigIntegerField(
+        blank=True,
+        null=True,
+        help_text="Option index (Dropdown) or option bitmask (Checkbox) into Question.stored_options"
+    )
+    value_json = models.JSONField(
+        blank=True,
+        null=True,
+        help_text="Any other answer value, as JSON"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['question', 'response'],
+                name='answer_question_response_idx'
+            )
+        ]
+
+    @property
+    def text_answer(self):
+        """
+        The submitted answer value, decoded from the compact columns (see
+        `answer_storage`).
+        """
+        return self.question.codec.decode(self.value_text, self.value_choice, self.value_json)
+
+    @text_answer.setter
+    def text_answer(self, value):
+        self.value_text, self.value_choice, self.value_json = self.question.codec.encode(value)
+
+
+class QuestionValueCount(models.Model):
+    """
+    Pre-aggregated count of one answer value for a question.
+
+    Text questions store one row per word, dropdown questions one row per
+    option and checkbox questions one row per option combination. Rows are
+    maintained incrementally on submission so analytics reads never touch
+    the raw answers.
+    """
+    question = models.ForeignKey(
+        Question,
+        related_name='value_counts',
+        on_delete=models.CASCADE,
+        # May live on another database than its target (see `sharding`)
+        db_constraint=False
     )
+    value = models.TextField(
+        help_text="JSON-encoded word, option or option combination"
+    )
+    count = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Number of answers contributing this value"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['question', 'value'],
+                name='unique_value_count_per_question'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.value} ({self.count})"
+
+
+class FormSubmissionRollup(models.Model):
+    """
+    Number of responses submitted to a form within one hour.
+    """
+    form = models.ForeignKey(
+        Form,
+        related_name='submission_rollups',
+        on_delete=models.CASCADE,
+        # May live on another database than its target (see `sharding`)
+        db_constraint=False
+    )
+    bucket_start = models.DateTimeField(help_text="Start of the hour counted")
+    count = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Number of responses submitted in the hour"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['form', 'bucket_start'],
+                name='unique_submission_rollup_per_hour'
+            )
+        ]
+
+    def __str__(self):
+        return f"Form {self.form_id} @ {self.bucket_start:%Y-%m-%d %H:00} ({self.count})"
+
+
+class QuestionValueRollup(models.Model):
+    """
+    Hourly counterpart of `QuestionValueCount`: the count of one answer value
+    among the responses submitted within one hour.
+    """
+    question = models.ForeignKey(
+        Question,
+        related_name='value_rollups',
+        on_delete=models.CASCADE,
+        # May live on another database than its target (see `sharding`)
+        db_constraint=False
+    )
+    bucket_start = models.DateTimeField(help_text="Start of the hour counted")
+    value = models.TextField(
+        help_text="JSON-encoded word, option or option combination"
+    )
+    count = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Number of answers contributing this value in the hour"
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['question', 'bucket_start', 'value'],
+                name='unique_value_rollup_per_hour'
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.value} @ {self.bucket_start:%Y-%m-%d %H:00} ({self.count})"
+
+
+class QuestionSketch(models.Model):
+    """
+    Approximate analytics of one question over one partition of its answers.
+
+    Holds fixed-size, mergeable sketches (see `sketches`) so that the memory
+    needed for analytics of very large free-text questions does not grow with
+    the number of distinct words.
+    """
+    question = models.ForeignKey(
+        Question,
+        related_name='sketches',
+        on_delete=models.CASCADE,
+        # May live on another database than its target (see `sharding`)
+        db_constraint=False
+    )
+    partition = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Partition of the answers (answer id modulo the partition count)"
+    )
+    partitions = models.PositiveSmallIntegerField(
+        default=1,
+        help_text="Number of partitions the answers were split into"
+    )
+    last_answer_id = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Highest answer id folded into the sketches"
+    )
+    answers = models.PositiveBigIntegerField(
+        default=0,
+        help_text="Number of answers folded into the sketches"
+    )
+    heavy_hitters = models.JSONField(help_text="Space-Saving summary of the top values")
+    count_min = models.BinaryField(help_text="Count-Min sketch of value counts")
+    respondents = models.BinaryField(help_text="HyperLogLog registers of distinct respondents")
+    co_occurrence = models.JSONField(
+        default=dict,
+        blank=True,
+        help_text="Checkbox questions: how often each pair of options was selected together"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['question', 'partition'],
+                name='unique_sketch_per_question_partition'
+            )
+        ]
+
+    def __str__(self):
+        return f"Sketch of question {self.question_id} [{self.partition}]"
+
+
+class Job(models.Model):
+    """
+    A background job producing a file for a form, such as a large export or
+    an analytics snapshot. The table doubles as the job queue polled by the
+    `run_jobs` worker.
+    """
+    EXPORT = 'export'
+    ANALYTICS_SNAPSHOT = 'analytics_snapshot'
+
+    KINDS = [
+        (EXPORT, 'Export'),
+        (ANALYTICS_SNAPSHOT, 'Analytics snapshot'),
+    ]
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=30, choices=KINDS)
+    form = models.ForeignKey(
+        Form,
+        related_name='jobs',
+        on_delete=models.CASCADE
+    )
+    export_format = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        help_text="Output format of export jobs"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=QUEUED
+    )
+    created_by = models.ForeignKey(
+        User,
+        related_name='jobs',
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="Worker that claimed the job"
+    )
+    heartbeat_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="Last time the claiming worker reported the job alive"
+    )
+    artifact = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        help_text="File name of the produced artifact, relative to FORM_STUFF_JOB_ROOT"
+    )
+    artifact_size = models.PositiveBigIntegerField(null=True, blank=True)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of form {self.form_id} ({self.status})"
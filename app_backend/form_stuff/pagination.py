@@ -0,0 +1,220 @@
+"""
+Keyset pagination and streaming output for form responses.
+
+Responses are walked in `(submitted_at, id)` order. A page is fetched with a
+`WHERE (submitted_at, id) > cursor` filter instead of an OFFSET, so every page
+costs the same regardless of how deep into a form's responses it is.
+"""
+import base64
+import json
+from datetime import datetime
+from operator import attrgetter, itemgetter
+
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+from rest_framework.utils.urls import replace_query_param
+
+
+STREAM_QUERY_PARAM = 'stream'
+STREAM_CHUNK_SIZE = 2000
+KEYSET_ORDERING = ('submitted_at', 'id')
+
+
+def query_params(request):
+    """
+    The query parameters of a DRF `Request` or a plain `HttpRequest`.
+    """
+    return getattr(request, 'query_params', request.GET)
+
+
+def is_stream_requested(request):
+    """
+    Whether the client asked for JSON lines output with `?stream=true`.
+    """
+    value = query_params(request).get(STREAM_QUERY_PARAM, '')
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def encode_cursor(submitted_at, pk):
+    raw = f"{submitted_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor into its `(submitted_at, id)` position.
+
+    Raises:
+    NotFound: If the cursor is malformed.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        submitted_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        return datetime.fromisoformat(submitted_at), int(pk)
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise NotFound("Invalid cursor")
+
+
+def after_position(queryset, position):
+    """
+    Restrict a queryset to rows strictly after a `(submitted_at, id)` position.
+    """
+    submitted_at, pk = position
+    return queryset.filter(
+        Q(submitted_at__gt=submitted_at) | Q(submitted_at=submitted_at, id__gt=pk)
+    )
+
+
+class ResponseCursorPagination(BasePagination):
+    """
+    Forward-only keyset pagination over `(submitted_at, id)`.
+
+    Pagination is opt-in: it only applies when the request carries a `cursor`
+    or `page_size` query parameter, so existing clients that expect a plain
+    list keep working.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def _page_queryset(self, queryset, request):
+        """
+        Return the queryset of the requested page plus one row, or None if
+        pagination was not requested.
+        """
+        params = query_params(request)
+        if self.cursor_query_param not in params and self.page_size_query_param not in params:
+            return None
+
+        self.request = request
+        self.current_page_size = self.get_page_size(request)
+        cursor = params.get(self.cursor_query_param)
+        if cursor:
+            queryset = after_position(queryset, decode_cursor(cursor))
+        return queryset.order_by(*KEYSET_ORDERING)[:self.current_page_size + 1]
+
+    def _trim_page(self, page, position=attrgetter('submitted_at', 'id')):
+        self.next_cursor = None
+        if len(page) > self.current_page_size:
+            page = page[:self.current_page_size]
+            self.next_cursor = encode_cursor(*position(page[-1]))
+        return page
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self._page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self._trim_page(list(queryset))
+
+    async def apaginate_queryset(self, queryset, request):
+        """
+        Async counterpart of `paginate_queryset`, using the async ORM.
+        """
+        queryset = self._page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self._trim_page([instance async for instance in queryset])
+
+    def paginate_rows(self, queryset, request, columns):
+        """
+        Like `paginate_queryset`, but return the page as
+        `values_list(*columns)` tuples. `columns` must include
+        "submitted_at" and "pk".
+        """
+        queryset = self._page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        position = itemgetter(columns.index('submitted_at'), columns.index('pk'))
+        return self._trim_page(list(queryset.values_list(*columns)), position)
+
+    async def apaginate_rows(self, queryset, request, columns):
+        """
+        Async counterpart of `paginate_rows`.
+        """
+        queryset = self._page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        position = itemgetter(columns.index('submitted_at'), columns.index('pk'))
+        return self._trim_page([row async for row in queryset.values_list(*columns)], position)
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.get_next_link(),
+            'next_cursor': self.next_cursor,
+            'results': data
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+def stream_json_lines(queryset, serializer_class, request=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Stream a queryset as JSON lines, one serialized object per line.
+
+    Rows are read through `.iterator(chunk_size=...)` and serialized one at a
+    time, so memory use stays flat regardless of the number of rows. An
+    optional `cursor` query parameter resumes after a previous position.
+    """
+    queryset = _stream_queryset(queryset, request)
+
+    def lines():
+        for instance in queryset.iterator(chunk_size=chunk_size):
+            yield _json_line(serializer_class(instance).data)
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
+def astream_json_lines(queryset, serializer_class, request=None, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    Async counterpart of `stream_json_lines`: rows are read with the async
+    ORM's `aiterator`, so under ASGI the stream does not hold a thread.
+    """
+    queryset = _stream_queryset(queryset, request)
+
+    async def lines():
+        async for instance in queryset.aiterator(chunk_size=chunk_size):
+            yield _json_line(serializer_class(instance).data)
+
+    return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+
+def _stream_queryset(queryset, request):
+    if request is not None:
+        cursor = query_params(request).get(ResponseCursorPagination.cursor_query_param)
+        if cursor:
+            queryset = after_position(queryset, decode_cursor(cursor))
+    return queryset.order_by(*KEYSET_ORDERING)
+
+
+def _json_line(data):
+    return json.dumps(data, cls=encoders.JSONEncoder) + '\n'
@@ -0,0 +1,129 @@
+"""
+Read replica routing.
+
+When a database alias named by `FORM_STUFF_REPLICA_ALIAS` ("replica" by
+default) is configured, `ReplicaRoutingMiddleware` lets the read-only routes
+in `FORM_STUFF_REPLICA_ROUTES` (analytics, response listing, form questions
+and the list endpoints) read `form_stuff` models from it. Everything else,
+and every write, uses the primary.
+
+Routing is sticky after a write: once a request writes, the rest of it
+reads from the primary, so it sees its own changes. A request that wrote
+also sets a cookie sending the same client's requests to the primary for
+`FORM_STUFF_REPLICA_PIN_SECONDS`, which covers replication lag for a
+submit-then-view round trip.
+
+The routing state lives in context variables, so it follows a request into
+its streamed response and through the async ORM's worker thread.
+
+On PostgreSQL the replica is a streaming replica of the primary. For local
+testing with SQLite, `python manage.py replicate_db` stands in for
+replication by copying the primary file into the replica with
+`copy_sqlite`, which lags the primary by its interval like a real replica
+would.
+"""
+import sqlite3
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+
+PRIMARY = 'default'
+PIN_COOKIE = 'form_stuff_primary'
+
+DEFAULT_ROUTES = (
+    'analytics',
+    'analytics-live',
+    'form-responses',
+    'form-questions',
+    'form-list',
+    'question-list',
+    'response-list',
+    'answer-list',
+)
+
+_use_replica = ContextVar('form_stuff_use_replica', default=False)
+_wrote = ContextVar('form_stuff_wrote', default=False)
+
+
+def replica_alias():
+    """
+    Return the configured replica alias, or None without a replica.
+    """
+    alias = getattr(settings, 'FORM_STUFF_REPLICA_ALIAS', 'replica')
+    return alias if alias in connections.settings else None
+
+
+def replica_routes():
+    return getattr(settings, 'FORM_STUFF_REPLICA_ROUTES', DEFAULT_ROUTES)
+
+
+def pin_seconds():
+    return getattr(settings, 'FORM_STUFF_REPLICA_PIN_SECONDS', 5)
+
+
+def start_request(use_replica):
+    """
+    Reset the routing state at the start of a request.
+    """
+    _use_replica.set(use_replica)
+    _wrote.set(False)
+
+
+def wrote():
+    """
+    Whether the current request has written to the database.
+    """
+    return _wrote.get()
+
+
+def copy_sqlite(source, target):
+    """
+    Copy the SQLite database `source` into `target` with the online backup
+    API: readers of `target` see either the previous copy or the new one,
+    and `source` is only read-locked while it is copied.
+
+    Parameters:
+    source (str): Path of the primary database.
+    target (str): Path of the replica database.
+    """
+    primary = sqlite3.connect(source)
+    replica = sqlite3.connect(target)
+    try:
+        primary.backup(replica)
+    finally:
+        replica.close()
+        primary.close()
+
+
+class ReadReplicaRouter:
+    """
+    Route reads of `form_stuff` models to the replica when the current
+    request allows it and has not written yet; route all writes to the
+    primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label != 'form_stuff':
+            return None
+        if _use_replica.get() and not _wrote.get():
+            return replica_alias() or PRIMARY
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        aliases = {PRIMARY, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica is a copy of the primary, never migrated on its own
+        if db == replica_alias():
+            return False
+        return None
@@ -0,0 +1,265 @@
+"""
+Time-bucketed analytics rollups.
+
+Every submission adds one to the hourly response count of its form
+(`FormSubmissionRollup`) and folds the keys of its answers (see `analytics`)
+into hourly value counts per question (`QuestionValueRollup`). Windowed
+analytics and submission-rate time series are then answered by summing
+hourly rows, never by scanning responses. Day buckets are built from the
+hours they contain, in UTC.
+
+Like `aggregates`, the rollups only see submissions written through
+`ResponseSerializer` and the ingest flusher, and responses deleted through
+the API (`forget_submissions`); `backfill_rollups` rebuilds them from the
+raw rows.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.db import connections, router, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .aggregates import count_answers, subtract_counts, upsert_counts
+from .analytics import (
+    AGGREGATORS,
+    TOP_K,
+    decode_key,
+    encode_key,
+    form_aggregators,
+    render_analytics,
+)
+from .answer_storage import ANSWER_COLUMNS
+from .models import Answer, FormSubmissionRollup, Question, QuestionValueRollup, Response
+
+
+BUCKETS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+# Longest time series served in one request
+MAX_BUCKETS = 5000
+CHUNK_SIZE = 2000
+
+
+def truncate(moment, bucket='hour'):
+    """
+    Return the start of the `bucket` containing `moment`, in UTC.
+    """
+    moment = moment.astimezone(dt_timezone.utc)
+    if bucket == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _submission_counts(submissions, using):
+    ops = connections[using or router.db_for_write(FormSubmissionRollup)].ops
+    responses = Counter()
+    values = Counter()
+    for form_id, submitted_at, answers in submissions:
+        hour = ops.adapt_datetimefield_value(truncate(submitted_at))
+        responses[(form_id, hour)] += 1
+        for (question_id, value), n in count_answers(answers).items():
+            values[(question_id, hour, value)] += n
+    return responses, values
+
+
+def record_submissions(submissions, using=None):
+    """
+    Fold freshly created responses into the hourly rollups.
+
+    Parameters:
+    submissions (iterable): `(form_id, submitted_at, answers)` tuples, where
+                            `answers` are `(question_id, question_type,
+                            text_answer)` tuples.
+    using (str): The shard of the forms (see `sharding`).
+    """
+    responses, values = _submission_counts(submissions, using)
+    upsert_counts(FormSubmissionRollup, ('form_id', 'bucket_start'), responses, using)
+    upsert_counts(QuestionValueRollup, ('question_id', 'bucket_start', 'value'), values, using)
+
+
+def forget_submissions(submissions, using=None):
+    """
+    Take deleted responses back out of the hourly rollups.
+
+    Parameters:
+    submissions (iterable): `(form_id, submitted_at, answers)` tuples, as
+                            for `record_submissions`.
+    using (str): The shard of the forms (see `sharding`).
+    """
+    responses, values = _submission_counts(submissions, using)
+    subtract_counts(FormSubmissionRollup, ('form_id', 'bucket_start'), responses, using)
+    subtract_counts(QuestionValueRollup, ('question_id', 'bucket_start', 'value'), values, using)
+
+
+def backfill_form(form_id, chunk_size=CHUNK_SIZE, using=None):
+    """
+    Replace the rollups of a form with ones recomputed from its responses.
+
+    Returns:
+    tuple: `(submission rows, value rows)` written.
+    """
+    submissions = Counter(
+        truncate(submitted_at)
+        for submitted_at in Response.objects.using(using).filter(form_id=form_id).values_list(
+            'submitted_at', flat=True
+        ).iterator(chunk_size=chunk_size)
+    )
+
+    questions = {
+        question_id: (question_type, options, stored_options)
+        for question_id, question_type, options, stored_options in Question.objects.filter(
+            form_id=form_id
+        ).values_list('id', 'question_type', 'options', 'stored_options')
+        if question_type in AGGREGATORS
+    }
+    values = Counter()
+    rows = Answer.objects.using(using).filter(
+        question_id__in=list(questions)
+    ).values_list(
+        'question_id', 'response__submitted_at', *ANSWER_COLUMNS
+    ).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        pending = defaultdict(list)
+        for question_id, submitted_at, *stored in chunk:
+            pending[(question_id, truncate(submitted_at))].append(stored)
+        for (question_id, hour), stored in pending.items():
+            question_type, options, stored_options = questions[question_id]
+            aggregator = AGGREGATORS[question_type](options, stored_options)
+            aggregator.add_stored(stored)
+            for key, n in aggregator.key_counts().items():
+                values[(question_id, hour, encode_key(key))] += n
+
+    with transaction.atomic(using=using):
+        FormSubmissionRollup.objects.using(using).filter(form_id=form_id).delete()
+        QuestionValueRollup.objects.using(using).filter(
+            question_id__in=list(
+                Question.objects.filter(form_id=form_id).values_list('id', flat=True)
+            )
+        ).delete()
+        FormSubmissionRollup.objects.using(using).bulk_create(
+            [
+                FormSubmissionRollup(form_id=form_id, bucket_start=hour, count=n)
+                for hour, n in submissions.items()
+            ],
+            batch_size=1000
+        )
+        QuestionValueRollup.objects.using(using).bulk_create(
+            [
+                QuestionValueRollup(question_id=question_id, bucket_start=hour, value=value, count=n)
+                for (question_id, hour, value), n in values.items()
+            ],
+            batch_size=1000
+        )
+    return len(submissions), len(values)
+
+
+WINDOW_PARAMS = ('from', 'to', 'bucket')
+
+
+def _parse_moment(value, name):
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"'{name}' must be an ISO 8601 date or datetime.")
+        moment = datetime.combine(day, time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, dt_timezone.utc)
+    return moment
+
+
+def parse_window(params):
+    """
+    Read the `from`, `to` and `bucket` query parameters.
+
+    `from` is inclusive and `to` exclusive; both accept a date or datetime,
+    naive values being taken as UTC. `bucket` is "hour" or "day" (default).
+
+    Returns:
+    tuple: `(start, end, bucket)`, with None for a missing bound.
+
+    Raises:
+    ValueError: If a parameter is invalid.
+    """
+    start = _parse_moment(params['from'], 'from') if params.get('from') else None
+    end = _parse_moment(params['to'], 'to') if params.get('to') else None
+    bucket = params.get('bucket') or 'day'
+    if bucket not in BUCKETS:
+        raise ValueError(f"'bucket' must be one of: {', '.join(BUCKETS)}.")
+    if start is not None and end is not None and start >= end:
+        raise ValueError("'from' must be before 'to'.")
+    return start, end, bucket
+
+
+def _window(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(bucket_start__gte=truncate(start))
+    if end is not None:
+        queryset = queryset.filter(bucket_start__lt=end)
+    return queryset
+
+
+def submission_series(form_id, start=None, end=None, bucket='day', using=None):
+    """
+    Count the responses of a form per bucket.
+
+    Buckets without submissions between the first and last bucket of the
+    window are included with a zero count. Without `start` and `end` the
+    series spans the form's first to last submission.
+
+    Returns:
+    list: `{'bucket': start of the bucket, 'count': ...}` dicts in time order.
+
+    Raises:
+    ValueError: If the series would have more than `MAX_BUCKETS` buckets.
+    """
+    counts = Counter()
+    rows = _window(
+        FormSubmissionRollup.objects.using(using).filter(form_id=form_id), start, end
+    ).values_list('bucket_start', 'count')
+    for hour, n in rows:
+        counts[truncate(hour, bucket)] += n
+
+    first = truncate(start, bucket) if start is not None else min(counts, default=None)
+    if first is None:
+        return []
+    step = BUCKETS[bucket]
+    if end is not None:
+        stop = end
+    elif counts:
+        stop = max(counts) + step
+    else:
+        return []
+    if (stop - first) / step > MAX_BUCKETS:
+        raise ValueError(f"The window spans more than {MAX_BUCKETS} buckets.")
+
+    series = []
+    moment = first
+    while moment < stop:
+        series.append({'bucket': moment, 'count': counts[moment]})
+        moment += step
+    return series
+
+
+def windowed_analytics(form_id, start=None, end=None, k=TOP_K, using=None):
+    """
+    Build the analytics payload of a form over the responses submitted in
+    `[start, end)`, rounded out to whole hours.
+
+    Returns:
+    dict: Mapping of question id to `{'type': ..., 'data': ...}` in the shape
+          served by `AnalyticsView`.
+    """
+    aggregators = form_aggregators(form_id)
+    rows = _window(
+        QuestionValueRollup.objects.using(using).filter(question_id__in=list(aggregators)), start, end
+    ).values_list('question_id', 'value', 'count')
+    for question_id, value, n in rows.iterator(chunk_size=CHUNK_SIZE):
+        aggregators[question_id][1].counts[decode_key(value)] += n
+    return render_analytics(aggregators, k)
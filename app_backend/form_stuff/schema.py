@@ -0,0 +1,198 @@
+"""
+Cached, versioned form schema.
+
+Every form has a schema version token stored in Django's cache framework.
+The token is replaced whenever the form or one of its questions is saved or
+deleted (see `signals`), and every cached artefact of the form (the question
+map used to validate submissions, the rendered question list and form
+detail) is keyed by it, so a bump makes all of them unreachable at once.
+Rendered schemas are served with a strong ETag derived from the version, so
+respondent traffic for an unchanged form needs no database queries and
+revalidations are answered with `304 Not Modified`.
+
+Entries expire after `FORM_STUFF_SCHEMA_CACHE_TIMEOUT` seconds as a safety
+net for per-process caches such as locmem, where a bump in one worker is not
+seen by the others.
+"""
+import uuid
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified, JsonResponse
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils import encoders
+
+from .models import Question
+
+
+# `stored_options` is a tuple (see `answer_storage`); it defaults to None for
+# specs cached before it was added, whose answers are then stored as JSON
+QuestionSpec = namedtuple(
+    'QuestionSpec', ['id', 'question_type', 'is_required', 'options', 'stored_options'],
+    defaults=(None,)
+)
+
+
+def _timeout():
+    return getattr(settings, 'FORM_STUFF_SCHEMA_CACHE_TIMEOUT', 300)
+
+
+def _version_key(form_id):
+    return f'form_stuff:schema_version:{form_id}'
+
+
+def schema_version(form_id):
+    """
+    Return the current schema version token of a form.
+    """
+    key = _version_key(form_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, _timeout()):
+            version = cache.get(key, version)
+    return version
+
+
+async def aschema_version(form_id):
+    """
+    Async counterpart of `schema_version`.
+    """
+    key = _version_key(form_id)
+    version = await cache.aget(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not await cache.aadd(key, version, _timeout()):
+            version = await cache.aget(key, version)
+    return version
+
+
+def invalidate_form(form_id):
+    """
+    Bump the schema version of a form, orphaning everything cached for it.
+    """
+    cache.set(_version_key(form_id), uuid.uuid4().hex, _timeout())
+
+
+def _cache_key(form_id, version, kind):
+    return f'form_stuff:schema:{form_id}:{version}:{kind}'
+
+
+def question_map(form_id):
+    """
+    Return the questions of a form keyed by id.
+
+    Returns:
+    dict: Mapping of question id to `QuestionSpec`, in question order.
+    """
+    key = _cache_key(form_id, schema_version(form_id), 'question_map')
+    questions = cache.get(key)
+    if questions is None:
+        rows = Question.objects.filter(form_id=form_id).values_list(
+            'id', 'question_type', 'is_required', 'options', 'stored_options'
+        )
+        questions = {
+            row[0]: QuestionSpec(*row[:4], tuple(row[4] or ()))
+            for row in rows
+        }
+        cache.set(key, questions, _timeout())
+    return questions
+
+
+def cached_schema_response(request, form_id, kind, build):
+    """
+    Serve a rendered piece of a form's schema from the cache.
+
+    Parameters:
+    request (Request): The incoming request, checked for `If-None-Match`.
+    form_id (int): The form the schema belongs to.
+    kind (str): Name of the rendering, e.g. "questions" or "form".
+    build (callable): Produces the response data on a cache miss. May raise
+                      `Http404`, in which case nothing is cached.
+
+    Returns:
+    Response: 304 NOT MODIFIED if the client's ETag is current, otherwise
+              200 OK with the cached data. Both carry the strong ETag.
+    """
+    version = schema_version(form_id)
+    headers = _schema_headers(form_id, kind, version)
+
+    if _is_current(request, headers):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    key = _cache_key(form_id, version, kind)
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, _timeout())
+    return Response(data, headers=headers)
+
+
+async def acached_schema_response(request, form_id, kind, build):
+    """
+    Async counterpart of `cached_schema_response` for plain Django async
+    views. `build` is a coroutine function; the rendering is shared with the
+    sync views through the same cache entries.
+
+    Returns:
+    HttpResponse: 304 NOT MODIFIED or a 200 OK `JsonResponse`.
+    """
+    version = await aschema_version(form_id)
+    headers = _schema_headers(form_id, kind, version)
+
+    if _is_current(request, headers):
+        return HttpResponseNotModified(headers=headers)
+
+    key = _cache_key(form_id, version, kind)
+    data = await cache.aget(key)
+    if data is None:
+        data = await build()
+        await cache.aset(key, data, _timeout())
+    return JsonResponse(data, encoder=encoders.JSONEncoder, safe=False, headers=headers)
+
+
+def _schema_headers(form_id, kind, version):
+    return {'ETag': f'"{kind}-{form_id}-{version}"', 'Cache-Control': 'no-cache'}
+
+
+def _is_current(request, headers):
+    return headers['ETag'] in parse_etags(request.headers.get('If-None-Match', ''))
+
+
+def _is_blank(value):
+    return value is None or value == '' or value == []
+
+
+def answer_error(question, value):
+    """
+    Check an answer value against its question.
+
+    Parameters:
+    question (QuestionSpec): The question being answered.
+    value: The submitted `text_answer`.
+
+    Returns:
+    str: A description of the problem, or None if the answer is acceptable.
+    """
+    if _is_blank(value):
+        return "This question is required." if question.is_required else None
+
+    options = question.options or []
+    if question.question_type == Question.TEXT:
+        if not isinstance(value, str):
+            return "Text answers must be a string."
+    elif question.question_type == Question.DROPDOWN:
+        if isinstance(value, (list, dict)):
+            return "Dropdown answers must be a single option."
+        if options and value not in options:
+            return f"{value!r} is not a valid option."
+    elif question.question_type == Question.CHECKBOX:
+        if not isinstance(value, list):
+            return "Checkbox answers must be a list of options."
+        invalid = [option for option in value if option not in options]
+        if options and invalid:
+            return f"{invalid!r} are not valid options."
+    return None
@@ -1,14 +1,41 @@
+from functools import partial
+
 from rest_framework import serializers
+from django.db import transaction
 from django.utils import timezone
-from .models import Form, Question, Response, Answer
+from .models import Form, Question, Response, Answer, Job
+from . import aggregates, exports, live, metrics, rollups, schema, sharding
+from .answer_storage import answer_columns, merge_options
+
 
-class QuestionSerializer(serializers.ModelSerializer):
+class TimedSerializerMixin:
+    """
+    Count validation and output building as serializer time in the request
+    metrics (see `metrics`). Nested serializers are covered by their parent.
+    """
+
+    def is_valid(self, *, raise_exception=False):
+        with metrics.timed():
+            return super().is_valid(raise_exception=raise_exception)
+
+    @property
+    def data(self):
+        with metrics.timed():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, serializers.ListSerializer):
+    pass
+
+
+class QuestionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Question model.
     Handles serialization and deserialization of question data.
     """
     class Meta:
         model = Question
+        list_serializer_class = TimedListSerializer
         fields = [
             'id',
             'form',
@@ -20,23 +47,219 @@ class QuestionSerializer(serializers.ModelSerializer):
             'help_text'
         ]
 
-class AnswerSerializer(serializers.ModelSerializer):
+    def validate(self, data):
+        """
+        Reject a type change of a question that has answers.
+        """
+        if self.instance is not None and 'question_type' in data:
+            error = self.instance.type_change_error(data['question_type'])
+            if error:
+                raise serializers.ValidationError({'question_type': error})
+        return data
+
+
+class QuestionSetItemSerializer(serializers.ModelSerializer):
+    """
+    Serializer for one question of a bulk question set edit.
+    An item with an `id` changes the fields it gives of that question, an
+    item without one adds a question to the form.
+    """
+    id = serializers.IntegerField(required=False)
+
+    class Meta:
+        model = Question
+        fields = [
+            'id',
+            'text',
+            'question_type',
+            'options',
+            'order',
+            'is_required',
+            'help_text'
+        ]
+        extra_kwargs = {
+            'text': {'required': False},
+            'question_type': {'required': False},
+        }
+
+
+class QuestionSetSerializer(serializers.Serializer):
+    """
+    Serializer for bulk edits of the questions of the form in
+    `context['form']`.
+
+    The whole resulting question set is validated in memory against the
+    form's current questions (ids, types and options, the question cap and
+    unique orders), then written with one bulk insert and one bulk update,
+    so adding, editing and reordering any number of questions takes a fixed
+    number of queries. Bulk writes skip `Question.save`, whose work (clearing
+    the options of text questions, recording `stored_options`) is done here.
+    """
+    questions = QuestionSetItemSerializer(many=True, allow_empty=False)
+
+    def validate(self, data):
+        """
+        Validate the question set the edit would leave the form with.
+        """
+        self.existing = {question.id: question for question in self.context['form'].questions.all()}
+        orders = {question.id: question.order for question in self.existing.values()}
+        added = 0
+        listed = set()
+        retyped = {}
+        errors = []
+        for index, item in enumerate(data['questions']):
+            item_errors = {}
+            question = None
+            if 'id' in item:
+                question = self.existing.get(item['id'])
+                if question is None:
+                    item_errors['id'] = [f"Question {item['id']} does not belong to this form."]
+                elif question.id in listed:
+                    item_errors['id'] = [f"Question {question.id} is listed more than once."]
+                else:
+                    listed.add(question.id)
+                    orders[question.id] = item.get('order', question.order)
+                    if item.get('question_type', question.question_type) != question.question_type:
+                        retyped[index] = question.id
+            else:
+                for name in ('text', 'question_type'):
+                    if name not in item:
+                        item_errors[name] = ["This field is required."]
+                added += 1
+                orders[('new', index)] = item.get('order', 0)
+
+            # Options are checked when they or the type change, so that
+            # reordering never fails on questions stored before this check
+            if question is None or 'options' in item or 'question_type' in item:
+                question_type = item.get('question_type', question and question.question_type)
+                options = item.get('options', question and question.options)
+                error = self.options_error(question_type, options)
+                if error:
+                    item_errors['options'] = [error]
+            errors.append(item_errors)
+
+        # Answered questions keep their type (see `Question.type_change_error`)
+        if retyped:
+            answered = Question.answered(self.context['form'].id, list(retyped.values()))
+            for index, question_id in retyped.items():
+                if question_id in answered:
+                    errors[index]['question_type'] = ["The type of a question cannot change once it has answers."]
+
+        if any(errors):
+            raise serializers.ValidationError({'questions': errors})
+        if len(self.existing) + added > Form.MAX_QUESTIONS:
+            raise serializers.ValidationError(
+                f"A form cannot have more than {Form.MAX_QUESTIONS} questions."
+            )
+        seen = set()
+        for order in orders.values():
+            if order in seen:
+                raise serializers.ValidationError(f"Order {order} is used by more than one question.")
+            seen.add(order)
+        return data
+
+    @staticmethod
+    def options_error(question_type, options):
+        """
+        Return why `options` are invalid for a question type, or None.
+        """
+        if question_type in (None, Question.TEXT):
+            return None
+        if not isinstance(options, list) or not options:
+            return f"{question_type.capitalize()} questions need a list of options."
+        if not all(isinstance(option, str) and option for option in options):
+            return "Options must be non-empty strings."
+        if len(set(options)) != len(options):
+            return "Options must be unique."
+        return None
+
+    def create(self, validated_data):
+        """
+        Apply the edit with bulk writes.
+
+        The unique `(form, order)` constraint is checked row by row, so when
+        moved questions trade places, or a new question takes the place of a
+        moved one, the moved questions are first parked past every order in
+        use, with one more bulk update.
+
+        Returns:
+        list: Every question of the form, in order.
+        """
+        form = self.context['form']
+        created, updated = [], []
+        fields = set()
+        moved, vacated = [], set()
+        for item in validated_data['questions']:
+            item = dict(item)
+            question_id = item.pop('id', None)
+            if question_id is None:
+                question = Question(form=form, **item)
+                created.append(question)
+            else:
+                question = self.existing[question_id]
+                if item.get('order', question.order) != question.order:
+                    moved.append(question)
+                    vacated.add(question.order)
+                for name, value in item.items():
+                    setattr(question, name, value)
+                fields |= item.keys()
+                updated.append(question)
+            # What Question.save does
+            if question.question_type == Question.TEXT:
+                question.options = None
+            question.stored_options = merge_options(question.stored_options, question.options)
+        if fields & {'options', 'question_type'}:
+            fields |= {'options', 'stored_options'}
+
+        with transaction.atomic():
+            if vacated & {question.order for question in moved + created}:
+                final_orders = [question.order for question in moved]
+                parked = max(vacated | {question.order for question in self.existing.values()}
+                             | {question.order for question in created}) + 1
+                for offset, question in enumerate(moved):
+                    question.order = parked + offset
+                Question.objects.bulk_update(moved, ['order'])
+                for question, order in zip(moved, final_orders):
+                    question.order = order
+            if created:
+                Question.objects.bulk_create(created)
+            if updated and fields:
+                Question.objects.bulk_update(updated, sorted(fields))
+            # Bulk writes send no signals
+            transaction.on_commit(partial(schema.invalidate_form, form.id))
+        return sorted([*self.existing.values(), *created], key=lambda question: question.order)
+
+class AnswerSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Answer model.
     Handles validation and creation of answers.
     """
+    text_answer = serializers.JSONField(required=False, allow_null=True)
+
     class Meta:
         model = Answer
+        list_serializer_class = TimedListSerializer
         fields = ['question', 'text_answer']
 
-class ResponseSerializer(serializers.ModelSerializer):
+class ResponseAnswerSerializer(serializers.Serializer):
+    """
+    Serializer for answers nested in a response submission.
+    Questions are resolved in bulk by ResponseSerializer rather than one
+    lookup per answer.
+    """
+    question = serializers.IntegerField()
+    text_answer = serializers.JSONField(required=False, allow_null=True)
+
+
+class ResponseSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Response model.
     Handles nested answers during creation.
     """
-    answers = AnswerSerializer(many=True, write_only=True)
+    answers = ResponseAnswerSerializer(many=True, write_only=True)
     class Meta:
         model = Response
+        list_serializer_class = TimedListSerializer
         fields = [
             'id',
             'form',
@@ -46,18 +269,89 @@ class ResponseSerializer(serializers.ModelSerializer):
             'user_agent',
             'answers'
         ]
+
+    def get_fields(self):
+        """
+        A stored response keeps its form and answers: the analytics count
+        them once, when the response is created.
+        """
+        fields = super().get_fields()
+        if self.instance is not None:
+            fields['form'] = serializers.PrimaryKeyRelatedField(read_only=True)
+            del fields['answers']
+        return fields
+
+    def validate(self, data):
+        """
+        Validate every answer against the form's cached question map.
+
+        Partial updates that leave the answers alone are not checked.
+        """
+        if 'answers' not in data:
+            return data
+        form = data['form'] if 'form' in data else self.instance.form
+        questions = schema.question_map(form.id)
+        errors = []
+        answered = set()
+        for answer in data['answers']:
+            question = questions.get(answer['question'])
+            if question is None:
+                errors.append(
+                    f"Question {answer['question']} does not belong to this form."
+                )
+                continue
+            if question.id in answered:
+                errors.append(f"Question {question.id} is answered more than once.")
+                continue
+            answered.add(question.id)
+            error = schema.answer_error(question, answer.get('text_answer'))
+            if error:
+                errors.append(f"Question {question.id}: {error}")
+
+        for question in questions.values():
+            if question.is_required and question.id not in answered:
+                errors.append(f"Question {question.id}: This question is required.")
+
+        if errors:
+            raise serializers.ValidationError({'answers': errors})
+        return data
+
     def create(self, validated_data):
         """
         Override create method to handle nested answers.
+
+        The response and all of its answers are written in one transaction
+        on the form's shard, with a single bulk insert for the answers.
         """
         answers_data = validated_data.pop('answers')
-        response = Response.objects.create(**validated_data)
-        for answer_data in answers_data:
-            Answer.objects.create(response=response, **answer_data)
+        questions = schema.question_map(validated_data['form'].id)
+        using = sharding.form_db(validated_data['form'])
+        with transaction.atomic(using=using):
+            response = Response.objects.using(using).create(**validated_data)
+            Answer.objects.using(using).bulk_create([
+                Answer(
+                    response=response,
+                    question_id=answer_data['question'],
+                    **answer_columns(questions[answer_data['question']], answer_data.get('text_answer'))
+                )
+                for answer_data in answers_data
+            ])
+            counted = [
+                (
+                    answer_data['question'],
+                    questions[answer_data['question']].question_type,
+                    answer_data.get('text_answer')
+                )
+                for answer_data in answers_data
+            ]
+            # Keep the pre-aggregated analytics counts in step with the answers
+            aggregates.record_answers(counted, using)
+            rollups.record_submissions([(response.form_id, response.submitted_at, counted)], using)
+            transaction.on_commit(partial(live.publish, [(response.form_id, counted)]), using)
         return response
 
 
-class FormSerializer(serializers.ModelSerializer):
+class FormSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     """
     Serializer for the Form model.
     Handles form creation and validation.
@@ -67,6 +361,7 @@ class FormSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Form
+        list_serializer_class = TimedListSerializer
         fields = [
             'id',
             'title',
@@ -121,3 +416,47 @@ class FormDetailSerializer(FormSerializer):
 
     class Meta(FormSerializer.Meta):
         fields = FormSerializer.Meta.fields + ['responses']
+
+
+class JobSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Serializer for the Job model.
+    Handles queuing of background exports and analytics snapshots.
+    """
+    class Meta:
+        model = Job
+        list_serializer_class = TimedListSerializer
+        fields = [
+            'id',
+            'kind',
+            'form',
+            'export_format',
+            'status',
+            'created_at',
+            'started_at',
+            'finished_at',
+            'artifact_size',
+            'error'
+        ]
+        read_only_fields = [
+            'status',
+            'created_at',
+            'started_at',
+            'finished_at',
+            'artifact_size',
+            'error'
+        ]
+
+    def validate(self, data):
+        """
+        Require a supported output format for export jobs.
+        """
+        if data['kind'] == Job.EXPORT:
+            data.setdefault('export_format', 'csv')
+            if data['export_format'] not in exports.FORMATS:
+                raise serializers.ValidationError(
+                    f"Unknown export format. Choose one of: {', '.join(exports.FORMATS)}."
+                )
+        else:
+            data['export_format'] = ''
+        return data
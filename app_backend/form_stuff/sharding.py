@@ -0,0 +1,297 @@
+"""
+Sharded response storage.
+
+When `FORM_STUFF_SHARDS` lists several database aliases, everything written
+per submission (`Response`, `Answer` and the analytics derived from them:
+`QuestionValueCount`, the hourly rollups and the sketches) is stored on a
+single shard per form. A busy form then loads only its own shard. Forms,
+questions and jobs stay on the default database, which is itself one of the
+shards.
+
+A form's shard is stored in `Form.shard`, empty meaning the default
+database. New forms are placed by consistent hashing of their id over
+`HashRing`, so adding a shard changes the placement of only about 1/N of
+the forms. Existing forms stay where they are until `rebalance_shards`
+moves them (`move_form`).
+
+The data access functions of `aggregates`, `analytics`, `rollups`,
+`sketches` and `exports` take a `using` alias. Callers resolve it with
+`form_db` or `get_form_db`. Both return None when sharding is off, which
+leaves the choice to the database routers, replicas included. Forms are
+looked up on the default database, so a sharded read never fans out across
+shards.
+"""
+import bisect
+import hashlib
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from .models import (
+    Answer,
+    Form,
+    FormSubmissionRollup,
+    Question,
+    QuestionSketch,
+    QuestionValueCount,
+    QuestionValueRollup,
+    Response,
+)
+
+
+SHARDED_MODELS = (
+    Response, Answer, QuestionValueCount, FormSubmissionRollup, QuestionValueRollup, QuestionSketch
+)
+# Points per shard on the ring; more points spread forms more evenly
+VIRTUAL_NODES = 64
+CHUNK_SIZE = 2000
+RESPONSE_FIELDS = (
+    'submitted_by_id', 'submitted_at', 'ip_address', 'user_agent', 'ingest_receipt', 'idempotency_key'
+)
+
+
+def shards():
+    return list(getattr(settings, 'FORM_STUFF_SHARDS', None) or [])
+
+
+def enabled():
+    return len(shards()) > 1
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), 'big')
+
+
+class HashRing:
+    """
+    Consistent hashing of keys onto nodes.
+
+    Every node is hashed onto the ring at `replicas` points; a key belongs
+    to the first node point at or after its own hash.
+
+    Parameters:
+    nodes (iterable): Names of the nodes.
+    replicas (int): Number of points per node.
+    """
+
+    def __init__(self, nodes, replicas=VIRTUAL_NODES):
+        points = sorted(
+            (_hash(f'{node}#{index}'), node)
+            for node in nodes for index in range(replicas)
+        )
+        self.hashes = [point for point, _ in points]
+        self.nodes = [node for _, node in points]
+
+    def node_for(self, key):
+        index = bisect.bisect_left(self.hashes, _hash(str(key)))
+        return self.nodes[index % len(self.nodes)]
+
+
+@lru_cache(maxsize=8)
+def _ring(aliases):
+    return HashRing(aliases)
+
+
+def ring_shard(form_id):
+    """
+    Return the alias the hash ring assigns a form to.
+    """
+    return _ring(tuple(shards())).node_for(form_id)
+
+
+def stored_shard(alias):
+    """
+    Return the `Form.shard` value of an alias.
+    """
+    return '' if alias == DEFAULT_DB_ALIAS else alias
+
+
+def form_db(form):
+    """
+    Return the alias holding a form's responses, or None when sharding is
+    off.
+    """
+    if not enabled():
+        return None
+    return form.shard or DEFAULT_DB_ALIAS
+
+
+def get_form_db(form_id):
+    """
+    Look up the alias holding a form's responses, without a query when
+    sharding is off.
+
+    Returns:
+    str: The alias, or None when sharding is off.
+
+    Raises:
+    Form.DoesNotExist: If sharding is on and the form does not exist.
+    """
+    if not enabled():
+        return None
+    shard = Form.objects.filter(id=form_id).values_list('shard', flat=True).get()
+    return shard or DEFAULT_DB_ALIAS
+
+
+def place_form(form):
+    """
+    Store the hash ring's shard of a newly created form.
+    """
+    if not enabled():
+        return
+    form.shard = stored_shard(ring_shard(form.id))
+    if form.shard:
+        Form.objects.filter(id=form.id).update(shard=form.shard)
+
+
+def _copy_responses(form_id, source, target, after_id, chunk_size):
+    """
+    Copy the responses of a form with an id above `after_id`, and their
+    answers, from `source` to `target`. Responses get new ids on the target,
+    whose id sequence is its own.
+
+    Returns:
+    tuple: `(responses copied, highest source id copied)`.
+    """
+    copied = 0
+    while True:
+        responses = list(
+            Response.objects.using(source).filter(form_id=form_id, id__gt=after_id).order_by('id')[:chunk_size]
+        )
+        if not responses:
+            return copied, after_id
+        answers = Answer.objects.using(source).filter(
+            response_id__in=[response.id for response in responses]
+        ).values_list('response_id', 'question_id', 'value_text', 'value_choice', 'value_json')
+        with transaction.atomic(using=target):
+            copies = Response.objects.using(target).bulk_create([
+                Response(form_id=form_id, **{field: getattr(response, field) for field in RESPONSE_FIELDS})
+                for response in responses
+            ])
+            # auto_now_add overwrote submitted_at on insert
+            for copy, response in zip(copies, responses):
+                copy.submitted_at = response.submitted_at
+            Response.objects.using(target).bulk_update(copies, ['submitted_at'], batch_size=chunk_size)
+            new_ids = {response.id: copy.id for response, copy in zip(responses, copies)}
+            Answer.objects.using(target).bulk_create(
+                [
+                    Answer(
+                        response_id=new_ids[response_id],
+                        question_id=question_id,
+                        value_text=value_text,
+                        value_choice=value_choice,
+                        value_json=value_json
+                    )
+                    for response_id, question_id, value_text, value_choice, value_json in answers
+                ],
+                batch_size=chunk_size
+            )
+        copied += len(responses)
+        after_id = responses[-1].id
+
+
+def delete_form_rows(form_id, question_ids, using):
+    """
+    Delete every sharded row of a form from one database.
+    """
+    with transaction.atomic(using=using):
+        Answer.objects.using(using).filter(response__form_id=form_id).delete()
+        Response.objects.using(using).filter(form_id=form_id).delete()
+        FormSubmissionRollup.objects.using(using).filter(form_id=form_id).delete()
+        delete_question_rows(question_ids, using)
+
+
+def delete_question_rows(question_ids, using):
+    """
+    Delete the answers and analytics of questions from one database.
+    """
+    with transaction.atomic(using=using):
+        for model in (Answer, QuestionValueCount, QuestionValueRollup, QuestionSketch):
+            model.objects.using(using).filter(question_id__in=question_ids).delete()
+
+
+def move_form(form, target, chunk_size=CHUNK_SIZE):
+    """
+    Move the responses of a form, and its analytics, to the `target` alias.
+
+    Responses are copied in chunks. The form is then switched to the target,
+    so new submissions go there, and the responses that reached the source
+    during the copy are copied after it. The counts, rollups and sketches
+    are rebuilt on the target from the copied answers, and the form's rows
+    are deleted from the source. A submission whose transaction is still
+    open on the source when the move ends is lost. Pause submissions to the
+    form, or use queued ingest, for a lossless move.
+
+    Returns:
+    int: The number of responses moved.
+    """
+    from . import aggregates, rollups, sketches
+
+    source = form.shard or DEFAULT_DB_ALIAS
+    if source == target:
+        return 0
+    question_ids = list(Question.objects.filter(form_id=form.id).values_list('id', flat=True))
+    partitions = max(
+        QuestionSketch.objects.using(source).filter(
+            question_id__in=question_ids
+        ).values_list('partition', flat=True),
+        default=-1
+    ) + 1
+
+    # A move that was interrupted left partial copies behind
+    delete_form_rows(form.id, question_ids, target)
+    moved, last_id = _copy_responses(form.id, source, target, 0, chunk_size)
+    form.shard = stored_shard(target)
+    Form.objects.filter(id=form.id).update(shard=form.shard)
+    late, _ = _copy_responses(form.id, source, target, last_id, chunk_size)
+
+    aggregates.rebuild_form(form.id, using=target)
+    rollups.backfill_form(form.id, using=target)
+    for partition in range(partitions):
+        sketches.fold_answers(form.id, partition, partitions, using=target)
+    delete_form_rows(form.id, question_ids, source)
+    return moved + late
+
+
+# The database `migrate` is running on, if any
+_migrating = None
+
+
+def pin_migrations(using):
+    """
+    Route every query to `using` while it is being migrated, so data
+    migrations read and write the database they migrate (e.g. with
+    `migrate --database=shard1`) rather than wherever the routers would
+    send them. None lifts the pin.
+    """
+    global _migrating
+    _migrating = using
+
+
+class ShardRouter:
+    """
+    Keep related lookups from a sharded row on its shard, e.g.
+    `response.answers.all()`. Other queries are left to the next router.
+    During `migrate` every query goes to the database being migrated (see
+    `pin_migrations`).
+    """
+
+    def db_for_read(self, model, **hints):
+        if _migrating is not None:
+            return _migrating
+        instance = hints.get('instance')
+        if (
+            model in SHARDED_MODELS
+            and isinstance(instance, SHARDED_MODELS)
+            and instance._state.db in shards()
+        ):
+            return instance._state.db
+        return None
+
+    db_for_write = db_for_read
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db in shards() and obj2._state.db in shards():
+            return True
+        return None
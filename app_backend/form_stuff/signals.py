@@ -0,0 +1,59 @@
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete, pre_migrate
+from django.dispatch import receiver
+
+from . import schema, sharding
+from .models import Form, Question
+
+
+@receiver(post_save, sender=Question)
+@receiver(post_delete, sender=Question)
+def invalidate_question_schema(sender, instance, **kwargs):
+    """
+    Bump the schema version of the form a question belongs to.
+    """
+    schema.invalidate_form(instance.form_id)
+
+
+@receiver(post_save, sender=Form)
+@receiver(post_delete, sender=Form)
+def invalidate_form_schema(sender, instance, **kwargs):
+    """
+    Bump the schema version of a saved or deleted form.
+    """
+    schema.invalidate_form(instance.pk)
+
+
+@receiver(pre_delete, sender=Form)
+def delete_sharded_form_rows(sender, instance, using, **kwargs):
+    """
+    Delete the responses of a form stored on another shard, which the
+    cascade on the form's database does not reach.
+    """
+    if sharding.enabled() and instance.shard:
+        question_ids = list(instance.questions.values_list('id', flat=True))
+        sharding.delete_form_rows(instance.pk, question_ids, instance.shard)
+
+
+@receiver(pre_delete, sender=Question)
+def delete_sharded_question_rows(sender, instance, using, **kwargs):
+    """
+    Delete the answers of a question stored on another shard.
+    """
+    if not sharding.enabled():
+        return
+    shard = Form.objects.filter(id=instance.form_id).values_list('shard', flat=True).first()
+    if shard:
+        sharding.delete_question_rows([instance.pk], shard)
+
+
+@receiver(pre_migrate)
+def pin_migration_queries(sender, using, **kwargs):
+    """
+    Run data migrations against the database being migrated.
+    """
+    sharding.pin_migrations(using)
+
+
+@receiver(post_migrate)
+def unpin_migration_queries(sender, **kwargs):
+    sharding.pin_migrations(None)
@@ -0,0 +1,514 @@
+"""
+Approximate analytics with fixed-size, mergeable sketches.
+
+Exact counts (`aggregates`) keep one row per distinct word, which grows
+without bound on large free-text forms. The sketches here use constant
+memory per question whatever the number of answers:
+
+* `SpaceSaving` keeps the heavy hitters (top words, options and option
+  combinations) in `capacity` counters. Every reported count overestimates
+  the true count by at most `error`, itself at most N / capacity where N is
+  the number of counted keys; any key occurring more than N / capacity times
+  is guaranteed to be reported.
+* `CountMinSketch` estimates the count of any key. With width
+  w = ceil(e / epsilon) and depth d = ceil(ln(1 / delta)), an estimate
+  exceeds the true count by more than epsilon * N with probability at most
+  delta, and never underestimates. Reported counts are the smaller of the
+  Space-Saving and Count-Min estimates.
+* `HyperLogLog` estimates the number of distinct respondents (IP address
+  and user agent) who answered a question, with a relative standard error
+  of 1.04 / sqrt(2 ** precision), about 1.6% at the default precision.
+
+All three merge losslessly with another sketch of the same size (the merged
+sketch has the same error bounds as one built over the combined input), so
+they are persisted per question and partition (`QuestionSketch`) and merged
+at read time. `update_sketches` folds new answers into them incrementally;
+answers submitted since are folded in memory when they are read, up to
+`FORM_STUFF_SKETCH_CATCH_UP` of them, and any beyond are reported as lag.
+
+Checkbox questions also keep exact per-option and pairwise counts, which
+take options squared counters whatever the number of answers.
+"""
+import hashlib
+import math
+import struct
+from array import array
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from .analytics import AGGREGATORS, TOP_K, decode_key, encode_key
+from .answer_storage import ANSWER_COLUMNS, set_bits
+from .models import Answer, Question, QuestionSketch
+
+
+EPSILON = 0.002
+DELTA = 0.01
+CAPACITY = 200
+PRECISION = 12
+CHUNK_SIZE = 2000
+CATCH_UP = 10000
+
+_HEADER = struct.Struct('<II')
+
+
+def _hash(value, salt=b''):
+    digest = hashlib.blake2b(value.encode(), digest_size=16, salt=salt).digest()
+    return struct.unpack('<QQ', digest)
+
+
+class CountMinSketch:
+    """
+    Count-Min sketch of `depth` rows of `width` counters.
+    """
+
+    def __init__(self, width=None, depth=None, epsilon=EPSILON, delta=DELTA, counters=None):
+        self.width = width or math.ceil(math.e / epsilon)
+        self.depth = depth or math.ceil(math.log(1 / delta))
+        if counters is None:
+            counters = array('Q', bytes(8 * self.width * self.depth))
+        self.counters = counters
+        self.total = 0
+
+    def _cells(self, key):
+        # Double hashing: row i uses h1 + i * h2
+        h1, h2 = _hash(key)
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        for cell in self._cells(key):
+            self.counters[cell] += count
+        self.total += count
+
+    def estimate(self, key):
+        return min(self.counters[cell] for cell in self._cells(key))
+
+    def merge(self, other):
+        if (self.width, self.depth) != (other.width, other.depth):
+            raise ValueError("Count-Min sketches of different sizes cannot be merged.")
+        counters = self.counters
+        for cell, count in enumerate(other.counters):
+            if count:
+                counters[cell] += count
+        self.total += other.total
+        return self
+
+    def to_bytes(self):
+        return _HEADER.pack(self.width, self.depth) + self.counters.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        width, depth = _HEADER.unpack_from(data)
+        counters = array('Q')
+        counters.frombytes(bytes(data[_HEADER.size:]))
+        sketch = cls(width, depth, counters=counters)
+        sketch.total = sum(counters[:width])
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters summary of at most `capacity` keys.
+
+    `counts` maps each monitored key to its (over)estimated count and
+    `errors` to the amount by which that count may overestimate.
+    """
+
+    def __init__(self, capacity=CAPACITY, counts=None, errors=None):
+        self.capacity = capacity
+        self.counts = counts or {}
+        self.errors = errors or {}
+
+    def _floor(self):
+        # Count any unmonitored key may have; zero while there is room
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+    def add(self, key, count=1):
+        counts = self.counts
+        if key in counts:
+            counts[key] += count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+        else:
+            evicted = min(counts, key=counts.get)
+            floor = counts.pop(evicted)
+            self.errors.pop(evicted)
+            counts[key] = floor + count
+            self.errors[key] = floor
+
+    def merge(self, other):
+        if self.capacity != other.capacity:
+            raise ValueError("Space-Saving summaries of different sizes cannot be merged.")
+        floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for key in self.counts.keys() | other.counts.keys():
+            count = self.counts.get(key, floor) + other.counts.get(key, other_floor)
+            error = self.errors.get(key, floor) + other.errors.get(key, other_floor)
+            merged[key] = (count, error)
+        kept = sorted(merged.items(), key=lambda item: item[1][0], reverse=True)[:self.capacity]
+        self.counts = {key: count for key, (count, _) in kept}
+        self.errors = {key: error for key, (_, error) in kept}
+        return self
+
+    def top(self, k=TOP_K):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def to_json(self):
+        return {
+            'capacity': self.capacity,
+            'counts': {key: [count, self.errors[key]] for key, count in self.counts.items()},
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(
+            data['capacity'],
+            {key: count for key, (count, _) in data['counts'].items()},
+            {key: error for key, (_, error) in data['counts'].items()},
+        )
+
+
+class HyperLogLog:
+    """
+    HyperLogLog distinct counter with 2 ** `precision` registers.
+    """
+
+    def __init__(self, precision=PRECISION, registers=None):
+        self.precision = precision
+        self.registers = registers or bytearray(1 << precision)
+
+    def add(self, value):
+        h, _ = _hash(value, b'hll')
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & 0xFFFFFFFFFFFFFFFF
+        rank = 64 - self.precision + 1 if not rest else 65 - rest.bit_length()
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def merge(self, other):
+        if self.precision != other.precision:
+            raise ValueError("HyperLogLog counters of different precision cannot be merged.")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def to_bytes(self):
+        return bytes(self.registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        return cls(len(data).bit_length() - 1, bytearray(data))
+
+
+class QuestionSummary:
+    """
+    The three sketches of one question, plus the number of answers folded
+    and, for checkbox questions, how often each pair of options was
+    selected together (`{option: {option: count}}`, the same option twice
+    counting the option itself).
+    """
+
+    def __init__(self, heavy_hitters=None, count_min=None, respondents=None, answers=0, co_occurrence=None):
+        self.heavy_hitters = heavy_hitters or SpaceSaving()
+        self.count_min = count_min or CountMinSketch()
+        self.respondents = respondents or HyperLogLog()
+        self.answers = answers
+        self.co_occurrence = co_occurrence or {}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            SpaceSaving.from_json(row.heavy_hitters),
+            CountMinSketch.from_bytes(row.count_min),
+            HyperLogLog.from_bytes(row.respondents),
+            row.answers,
+            row.co_occurrence,
+        )
+
+    def add_counts(self, counts):
+        for key, count in counts.items():
+            value = encode_key(key)
+            self.heavy_hitters.add(value, count)
+            self.count_min.add(value, count)
+
+    def add_aggregator(self, aggregator):
+        """
+        Fold the counts of an aggregator, and for checkbox questions the
+        option pairs of its combinations.
+        """
+        self.add_counts(aggregator.key_counts())
+        if aggregator.question_type != Question.CHECKBOX:
+            return
+        masks, _ = aggregator.split_counts()
+        for mask, count in masks.items():
+            selected = [aggregator.options[index] for index in set_bits(mask)]
+            for first in selected:
+                pairs = self.co_occurrence.setdefault(first, {})
+                for second in selected:
+                    pairs[second] = pairs.get(second, 0) + count
+
+    def merge(self, other):
+        self.heavy_hitters.merge(other.heavy_hitters)
+        self.count_min.merge(other.count_min)
+        self.respondents.merge(other.respondents)
+        self.answers += other.answers
+        for first, other_pairs in other.co_occurrence.items():
+            pairs = self.co_occurrence.setdefault(first, {})
+            for second, count in other_pairs.items():
+                pairs[second] = pairs.get(second, 0) + count
+        return self
+
+    def result(self, aggregator, k=TOP_K):
+        """
+        Render the summary in the shape of `Aggregator.result`, with the
+        error bounds of the reported counts.
+        """
+        top = [
+            (value, min(count, self.count_min.estimate(value)))
+            for value, count in self.heavy_hitters.top(k)
+        ]
+        total = self.count_min.total
+        data = {
+            aggregator.result_key: [
+                {aggregator.label: aggregator.render(decode_key(value)), 'count': count}
+                for value, count in top
+            ],
+            'others': max(total - sum(count for _, count in top), 0),
+        }
+        if aggregator.question_type == Question.CHECKBOX:
+            options = aggregator.options
+            matrix = [
+                [self.co_occurrence.get(first, {}).get(second, 0) for second in options]
+                for first in options
+            ]
+            data['option_counts'] = [
+                {'option': option, 'count': matrix[index][index]}
+                for index, option in enumerate(options)
+            ]
+            data['co_occurrence'] = {'options': options, 'matrix': matrix}
+        data.update({
+            'distinct_respondents': self.respondents.count(),
+            'error': {
+                # Reported counts overestimate by at most this much
+                'max_overestimate': min(
+                    max((self.heavy_hitters.errors[value] for value, _ in top), default=0),
+                    math.ceil(total / self.heavy_hitters.capacity)
+                ),
+                'count_min_epsilon': round(math.e / self.count_min.width, 6),
+                'count_min_delta': round(math.exp(-self.count_min.depth), 6),
+                'respondents_relative_error': round(1.04 / math.sqrt(len(self.respondents.registers)), 4),
+            },
+        })
+        return data
+
+
+def respondent(ip_address, user_agent):
+    return f"{ip_address or ''}|{user_agent or ''}"
+
+
+def catch_up_limit():
+    return getattr(settings, 'FORM_STUFF_SKETCH_CATCH_UP', CATCH_UP)
+
+
+def _answer_rows(answers):
+    return answers.values_list(
+        'id', 'question_id', 'response__ip_address', 'response__user_agent', *ANSWER_COLUMNS
+    )
+
+
+def _fold_rows(rows, questions, summaries, is_folded):
+    """
+    Fold answer rows read by `_answer_rows` into `summaries`, skipping those
+    for which `is_folded(question_id, answer_id)` holds.
+
+    Returns:
+    int: The number of answers folded.
+    """
+    pending = defaultdict(list)
+    for answer_id, question_id, ip_address, user_agent, *stored in rows:
+        if is_folded(question_id, answer_id):
+            continue
+        pending[question_id].append(stored)
+        summary = summaries[question_id]
+        summary.respondents.add(respondent(ip_address, user_agent))
+        summary.answers += 1
+    for question_id, stored in pending.items():
+        question_type, options, stored_options = questions[question_id]
+        aggregator = AGGREGATORS[question_type](options, stored_options)
+        aggregator.add_stored(stored)
+        summaries[question_id].add_aggregator(aggregator)
+    return sum(len(stored) for stored in pending.values())
+
+
+def _form_questions(form_id):
+    return {
+        question_id: (question_type, options, stored_options)
+        for question_id, question_type, options, stored_options in Question.objects.filter(
+            form_id=form_id
+        ).order_by('order').values_list('id', 'question_type', 'options', 'stored_options')
+        if question_type in AGGREGATORS
+    }
+
+
+def fold_answers(form_id, partition=0, partitions=1, chunk_size=CHUNK_SIZE, using=None):
+    """
+    Fold the answers of a form added since the last run into the sketches of
+    one partition.
+
+    Partitions split the answers by id (`id % partitions == partition`), so
+    several workers can build the sketches of a large form in parallel;
+    readers merge the partitions. Answers are streamed in chunks and each
+    chunk is pre-counted, so memory is bounded by the chunk and the sketch
+    sizes.
+
+    Every sketch records the partition count it was folded with. Sketches of
+    the form folded with another count are dropped first, so changing
+    `partitions` rebuilds the sketches instead of folding answers twice.
+
+    Returns:
+    int: The number of answers folded.
+    """
+    questions = _form_questions(form_id)
+    QuestionSketch.objects.using(using).filter(
+        question_id__in=list(questions)
+    ).exclude(partitions=partitions).delete()
+    rows = {
+        row.question_id: row
+        for row in QuestionSketch.objects.using(using).filter(
+            question_id__in=list(questions), partition=partition
+        )
+    }
+    summaries = {
+        question_id: QuestionSummary.from_row(rows[question_id]) if question_id in rows else QuestionSummary()
+        for question_id in questions
+    }
+    watermark = min(
+        (rows[question_id].last_answer_id if question_id in rows else 0)
+        for question_id in summaries
+    ) if summaries else 0
+
+    answers = _answer_rows(Answer.objects.using(using).filter(
+        question_id__in=list(summaries), id__gt=watermark
+    ).annotate(
+        partition=F('id') % partitions
+    ).filter(partition=partition).order_by('id')).iterator(chunk_size=chunk_size)
+
+    def is_folded(question_id, answer_id):
+        row = rows.get(question_id)
+        return row is not None and answer_id <= row.last_answer_id
+
+    folded = 0
+    last_answer_id = watermark
+    while True:
+        chunk = list(islice(answers, chunk_size))
+        if not chunk:
+            break
+        folded += _fold_rows(chunk, questions, summaries, is_folded)
+        last_answer_id = chunk[-1][0]
+
+    with transaction.atomic(using=using):
+        for question_id, summary in summaries.items():
+            QuestionSketch.objects.using(using).update_or_create(
+                question_id=question_id,
+                partition=partition,
+                defaults={
+                    'partitions': partitions,
+                    'last_answer_id': max(
+                        last_answer_id, rows[question_id].last_answer_id if question_id in rows else 0
+                    ),
+                    'answers': summary.answers,
+                    'heavy_hitters': summary.heavy_hitters.to_json(),
+                    'count_min': summary.count_min.to_bytes(),
+                    'respondents': summary.respondents.to_bytes(),
+                    'co_occurrence': summary.co_occurrence,
+                }
+            )
+    return folded
+
+
+def form_analytics(form_id, k=TOP_K, using=None):
+    """
+    Build the approximate analytics payload of a form by merging the
+    sketches of every partition.
+
+    Answers submitted since the sketches were last folded are folded in
+    memory (not saved) when there are at most `FORM_STUFF_SKETCH_CATCH_UP`
+    of them. Otherwise they are left out, and each question reports how
+    many were.
+
+    Returns:
+    dict: Mapping of question id to `{'type': ..., 'data': ...}`, where
+          `data` has the keys of the exact payload plus
+          `distinct_respondents`, `error` and `sketch`: the highest answer
+          id folded into the stored sketches (`watermark`), and the number
+          of later answers folded at read time (`caught_up`) or left out
+          (`lag`).
+    """
+    questions = _form_questions(form_id)
+    summaries = {}
+    folded_through = defaultdict(dict)
+    partitions = {}
+    for row in QuestionSketch.objects.using(using).filter(question_id__in=list(questions)):
+        summary = QuestionSummary.from_row(row)
+        if row.question_id in summaries:
+            summaries[row.question_id].merge(summary)
+        else:
+            summaries[row.question_id] = summary
+        folded_through[row.question_id][row.partition] = row.last_answer_id
+        partitions[row.question_id] = row.partitions
+    for question_id in questions:
+        summaries.setdefault(question_id, QuestionSummary())
+    watermarks = {
+        question_id: min(
+            folded_through[question_id].get(partition, 0)
+            for partition in range(partitions.get(question_id, 1))
+        )
+        for question_id in questions
+    }
+
+    def is_folded(question_id, answer_id):
+        count = partitions.get(question_id)
+        return count is not None and answer_id <= folded_through[question_id].get(answer_id % count, 0)
+
+    limit = catch_up_limit()
+    newer = Answer.objects.using(using).filter(
+        question_id__in=list(questions), id__gt=min(watermarks.values(), default=0)
+    )
+    rows = list(_answer_rows(newer.order_by('id'))[:limit + 1])
+    caught_up = dict.fromkeys(questions, 0)
+    lag = dict.fromkeys(questions, 0)
+    if len(rows) <= limit:
+        _fold_rows(rows, questions, summaries, is_folded)
+        for answer_id, question_id, *_ in rows:
+            caught_up[question_id] += not is_folded(question_id, answer_id)
+    else:
+        # Too far behind to catch up. Answers already folded into some of
+        # the partitions are counted too, so this is an upper bound.
+        for question_id, watermark in watermarks.items():
+            lag[question_id] = newer.filter(question_id=question_id, id__gt=watermark).count()
+
+    payload = {}
+    for question_id, (question_type, options, stored_options) in questions.items():
+        data = summaries[question_id].result(AGGREGATORS[question_type](options, stored_options), k)
+        data['sketch'] = {
+            'watermark': watermarks[question_id],
+            'caught_up': caught_up[question_id],
+            'lag': lag[question_id],
+        }
+        payload[question_id] = {'type': question_type, 'data': data}
+    return payload
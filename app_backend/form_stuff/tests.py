@@ -1,3 +1,2072 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import random
+import sqlite3
+import tempfile
+from collections import Counter
+from contextlib import closing
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, URLResolver, resolve
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import (
+    aggregates,
+    analytics as analytics_module,
+    benchmarks,
+    db,
+    exports,
+    fast_serializers,
+    idempotency,
+    ingest,
+    jobs,
+    live,
+    metrics,
+    replicas,
+    rollups,
+    schema,
+    sharding,
+    sketches,
+    text_analytics,
+    urls as form_stuff_urls,
+)
+from .answer_storage import AnswerCodec
+from .async_views import (
+    AsyncAnalyticsLiveView,
+    AsyncAnalyticsView,
+    AsyncFormQuestionsView,
+    AsyncFormResponsesView,
+)
+from .middleware import ReplicaRoutingMiddleware
+from .models import (
+    Answer,
+    Form,
+    FormSubmissionRollup,
+    Job,
+    Question,
+    QuestionSketch,
+    QuestionValueCount,
+    QuestionValueRollup,
+    Response,
+)
+from .serializers import FormSerializer, ResponseSerializer
+
+
+class AnalyticsCountTests(TestCase):
+    """
+    The pre-aggregated counts and rollups must match the raw answers through
+    every write the API allows.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.text = Question.objects.create(form=self.form, text="Say", question_type=Question.TEXT, order=0)
+        self.dropdown = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['red', 'blue'], order=1
+        )
+        self.checkbox = Question.objects.create(
+            form=self.form, text="Tick", question_type=Question.CHECKBOX, options=['x', 'y', 'z'], order=2
+        )
+
+    def submit(self, text, choice, ticks):
+        response = self.client.post('/api/responses/', {
+            'form': self.form.id,
+            'answers': [
+                {'question': self.text.id, 'text_answer': text},
+                {'question': self.dropdown.id, 'text_answer': choice},
+                {'question': self.checkbox.id, 'text_answer': ticks},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        return response.json()['id']
+
+    def rollup_rows(self):
+        return (
+            sorted(FormSubmissionRollup.objects.filter(count__gt=0).values_list('form_id', 'bucket_start', 'count')),
+            sorted(QuestionValueRollup.objects.filter(count__gt=0).values_list(
+                'question_id', 'bucket_start', 'value', 'count'
+            )),
+        )
+
+    def assertCountsMatchAnswers(self):
+        self.assertEqual(aggregates.check_form(self.form.id), [])
+        self.assertEqual(
+            aggregates.form_analytics(self.form.id), analytics_module.compute_form_analytics(self.form.id)
+        )
+        incremental = self.rollup_rows()
+        rollups.backfill_form(self.form.id)
+        self.assertEqual(incremental, self.rollup_rows())
+
+    def test_submissions_are_counted(self):
+        self.submit("Lovely weather today", 'red', ['x', 'y'])
+        self.submit("Lovely weather", 'red', ['y'])
+        self.submit("Weather", 'blue', ['x', 'y'])
+        self.assertCountsMatchAnswers()
+        counts = dict(QuestionValueCount.objects.filter(question=self.dropdown).values_list('value', 'count'))
+        self.assertEqual(counts, {analytics_module.encode_key('red'): 2, analytics_module.encode_key('blue'): 1})
+
+    def test_upsert_counts(self):
+        key = (self.text.id, analytics_module.encode_key('weather'))
+        aggregates.upsert_counts(QuestionValueCount, ('question_id', 'value'), {key: 2})
+        aggregates.upsert_counts(QuestionValueCount, ('question_id', 'value'), {key: 3})
+        self.assertEqual(QuestionValueCount.objects.get(question=self.text).count, 5)
+        aggregates.subtract_counts(QuestionValueCount, ('question_id', 'value'), {key: 4})
+        self.assertEqual(QuestionValueCount.objects.get(question=self.text).count, 1)
+
+    def test_check_and_rebuild_repair_drift(self):
+        response_id = self.submit("Lovely weather", 'red', ['x'])
+        # Answers written around the API are not counted
+        Answer.objects.create(response_id=response_id, question=self.text, text_answer="Sunny")
+        QuestionValueCount.objects.filter(question=self.dropdown).update(count=7)
+
+        with self.assertRaisesMessage(CommandError, "1 form(s) out of sync"):
+            call_command('check_analytics', stdout=StringIO())
+        out = StringIO()
+        call_command('check_analytics', self.form.id, fix=True, stdout=out)
+        self.assertIn(f"Form {self.form.id}: rebuilt", out.getvalue())
+        self.assertEqual(aggregates.check_form(self.form.id), [])
+
+        QuestionValueCount.objects.all().delete()
+        self.assertNotEqual(aggregates.check_form(self.form.id), [])
+        call_command('rebuild_analytics', stdout=StringIO())
+        call_command('check_analytics', stdout=StringIO())
+        self.assertEqual(
+            aggregates.form_analytics(self.form.id), analytics_module.compute_form_analytics(self.form.id)
+        )
+
+    def test_deleting_a_response_forgets_its_answers(self):
+        first = self.submit("Lovely weather today", 'blue', ['x', 'z'])
+        self.submit("Lovely weather", 'red', ['y'])
+        self.submit("Weather", 'red', ['y'])
+        response = self.client.delete(f'/api/responses/{first}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Answer.objects.filter(response_id=first).exists())
+        self.assertCountsMatchAnswers()
+
+    def test_answers_are_only_written_with_their_response(self):
+        response_id = self.submit("Lovely weather", 'red', ['x'])
+        answer = Answer.objects.filter(response_id=response_id).first()
+        self.assertEqual(self.client.post('/api/answers/', {
+            'response': response_id, 'question': self.text.id, 'text_answer': "again"
+        }, format='json').status_code, 405)
+        for method in ('put', 'patch'):
+            response = getattr(self.client, method)(
+                f'/api/answers/{answer.id}/', {'text_answer': "changed"}, format='json'
+            )
+            self.assertEqual(response.status_code, 405)
+        self.assertEqual(self.client.delete(f'/api/answers/{answer.id}/').status_code, 405)
+        self.assertEqual(self.client.get(f'/api/answers/{answer.id}/').status_code, 200)
+        self.assertCountsMatchAnswers()
+
+    def test_response_updates_keep_form_and_answers(self):
+        other = Form.objects.create(title="Other")
+        response_id = self.submit("Lovely weather", 'red', ['x'])
+        response = self.client.patch(f'/api/responses/{response_id}/', {
+            'form': other.id,
+            'answers': [{'question': self.dropdown.id, 'text_answer': 'blue'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['form'], self.form.id)
+        self.assertEqual(Answer.objects.get(question=self.dropdown).text_answer, 'red')
+        self.assertCountsMatchAnswers()
+
+
+class AnalyticsEngineTests(TestCase):
+    """
+    The batched analytics engine must count exactly what the original
+    per-question loop over `Answer` models counted, in a fixed number of
+    queries.
+    """
+
+    def setUp(self):
+        self.form, self.questions = benchmarks.create_form(question_count=9, seed=1)
+        benchmarks.seed_responses(self.form, self.questions, 40, seed=1)
+        # Answers stored as JSON, which the engine decodes one by one
+        response = Response.objects.create(form=self.form)
+        for question, value in zip(self.questions, ["Great service, great price!", 'Unknown', ['Option 1', 'Option 1']]):
+            Answer.objects.create(response=response, question=question, text_answer=value)
+
+    def per_question_counts(self):
+        counts = {}
+        for question in Question.objects.filter(form=self.form):
+            keys = analytics_module.AGGREGATORS[question.question_type].keys
+            counts[question.id] = Counter(
+                key for answer in question.answers.all() for key in keys(answer.text_answer)
+            )
+        return counts
+
+    def test_matches_the_per_question_path(self):
+        aggregators = analytics_module.aggregate_answers(
+            analytics_module.form_aggregators(self.form.id), chunk_size=7
+        )
+        self.assertEqual(
+            {question_id: aggregator.key_counts() for question_id, (_, aggregator) in aggregators.items()},
+            self.per_question_counts()
+        )
+
+    def test_query_count_is_independent_of_question_count(self):
+        with self.assertNumQueries(2):
+            analytics_module.compute_form_analytics(self.form.id)
+
+
+class ResponsePaginationTests(TestCase):
+    """
+    Keyset pages must neither skip nor repeat responses while new ones are
+    submitted, and streamed output must be one JSON object per line.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.start = timezone.now() - timedelta(days=1)
+        # Pairs of responses share a timestamp, so ids break the ties
+        self.ids = [self.create_response(self.start + timedelta(minutes=i // 2)) for i in range(10)]
+
+    def create_response(self, submitted_at):
+        response = Response.objects.create(form=self.form)
+        Response.objects.filter(id=response.id).update(submitted_at=submitted_at)
+        return response.id
+
+    def test_pages_are_stable_across_inserts(self):
+        seen, submitted = [], []
+        url = f'/api/responses/?form={self.form.id}&page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            seen += [response['id'] for response in page['results']]
+            if len(submitted) < 3:
+                # New submissions land after the cursor, backdated ones before it
+                submitted.append(self.create_response(timezone.now()))
+                self.create_response(self.start - timedelta(days=1))
+            url = page['next']
+        self.assertEqual(seen, self.ids + submitted)
+
+    def test_last_page_has_no_cursor(self):
+        page = self.client.get(f'/api/responses/?form={self.form.id}&page_size=10').json()
+        self.assertEqual([response['id'] for response in page['results']], self.ids)
+        self.assertIsNone(page['next'])
+        self.assertIsNone(page['next_cursor'])
+        self.assertEqual(self.client.get(f'/api/responses/?form={self.form.id}&cursor=bogus').status_code, 404)
+
+    def test_stream_is_well_formed_json_lines(self):
+        response = self.client.get(f'/api/responses/?form={self.form.id}&stream=true')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.endswith('\n'))
+        lines = body.splitlines()
+        self.assertEqual([json.loads(line)['id'] for line in lines], self.ids)
+
+        cursor = self.client.get(f'/api/responses/?form={self.form.id}&page_size=4').json()['next_cursor']
+        response = self.client.get(f'/api/responses/?form={self.form.id}&stream=true&cursor={cursor}')
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual([json.loads(line)['id'] for line in body.splitlines()], self.ids[4:])
+
+
+class SubmissionTests(TestCase):
+    """
+    Submitted answers are validated against the cached question map and
+    written in bulk.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.question = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b'], is_required=True
+        )
+
+    def submit(self, answers, form=None):
+        return self.client.post('/api/responses/', {
+            'form': (form or self.form).id,
+            'answers': answers,
+        }, format='json')
+
+    def test_invalid_answers_are_rejected(self):
+        other = Question.objects.create(form=Form.objects.create(title="Other"), text="Say", question_type=Question.TEXT)
+        for answers in (
+            [],
+            [{'question': self.question.id, 'text_answer': 'z'}],
+            [{'question': other.id, 'text_answer': 'hello'}],
+            [{'question': self.question.id, 'text_answer': 'a'}, {'question': self.question.id, 'text_answer': 'b'}],
+        ):
+            with self.subTest(answers=answers):
+                response = self.submit(answers)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('answers', response.json())
+        self.assertFalse(Response.objects.exists())
+
+    def test_partial_update_without_answers(self):
+        response_id = self.submit([{'question': self.question.id, 'text_answer': 'a'}]).json()['id']
+        response = self.client.patch(f'/api/responses/{response_id}/', {'user_agent': 'x'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(Response.objects.get(id=response_id).user_agent, 'x')
+        self.assertEqual(Answer.objects.get(response_id=response_id).text_answer, 'a')
+
+
+class QueuedIngestTests(TestCase):
+    """
+    Submissions flushed from the ingest queue must be stored exactly like
+    ones written synchronously.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.text = Question.objects.create(form=self.form, text="Say", question_type=Question.TEXT, order=0)
+        self.dropdown = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['red', 'blue'], order=1
+        )
+        self.checkbox = Question.objects.create(
+            form=self.form, text="Tick", question_type=Question.CHECKBOX, options=['x', 'y', 'z'], order=2
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.queue_path = os.path.join(directory.name, 'queue.sqlite3')
+
+    def submit_all(self):
+        responses = []
+        for i, (text, choice, ticks) in enumerate([
+            ("Lovely weather today", 'red', ['x', 'y']),
+            ("Terrible weather", 'blue', ['z']),
+            ("Weather", 'red', ['y', 'x']),
+        ]):
+            responses.append(self.client.post('/api/responses/', {
+                'form': self.form.id,
+                'user_agent': f'browser {i}',
+                'answers': [
+                    {'question': self.text.id, 'text_answer': text},
+                    {'question': self.dropdown.id, 'text_answer': choice},
+                    {'question': self.checkbox.id, 'text_answer': ticks},
+                ],
+            }, format='json'))
+        return responses
+
+    def stored_rows(self):
+        responses = list(Response.objects.order_by('id').values_list('id', 'user_agent'))
+        answers = {
+            response_id: list(Answer.objects.filter(response_id=response_id).order_by('question_id').values_list(
+                'question_id', 'value_text', 'value_choice', 'value_json'
+            ))
+            for response_id, _ in responses
+        }
+        return (
+            [(user_agent, answers[response_id]) for response_id, user_agent in responses],
+            sorted(QuestionValueCount.objects.values_list('question_id', 'value', 'count')),
+            sorted(FormSubmissionRollup.objects.values_list('form_id', 'count')),
+            sorted(QuestionValueRollup.objects.values_list('question_id', 'value', 'count')),
+        )
+
+    def test_flush_stores_the_same_rows_as_sync_writes(self):
+        for response in self.submit_all():
+            self.assertEqual(response.status_code, 201)
+        expected = self.stored_rows()
+        for model in (Response, QuestionValueCount, FormSubmissionRollup, QuestionValueRollup):
+            model.objects.all().delete()
+
+        with override_settings(FORM_STUFF_INGEST_MODE='queued', FORM_STUFF_INGEST_QUEUE_PATH=self.queue_path):
+            receipts = []
+            for response in self.submit_all():
+                self.assertEqual(response.status_code, 202)
+                receipts.append(response.json()['receipt'])
+            self.assertFalse(Response.objects.exists())
+            self.assertEqual(
+                self.client.get(f'/api/submissions/{receipts[0]}/').json()['status'], ingest.QUEUED
+            )
+            self.assertEqual(ingest.flush(ingest.get_queue(), batch_size=2), (2, 0))
+            self.assertEqual(ingest.flush(ingest.get_queue(), batch_size=2), (1, 0))
+            self.assertEqual(ingest.flush(ingest.get_queue()), (0, 0))
+            statuses = [self.client.get(f'/api/submissions/{receipt}/').json() for receipt in receipts]
+
+        self.assertEqual(self.stored_rows(), expected)
+        self.assertEqual(
+            [(status['status'], status['response']) for status in statuses],
+            [(ingest.STORED, pk) for pk in Response.objects.order_by('id').values_list('id', flat=True)]
+        )
+
+    def test_submissions_invalidated_while_queued_fail(self):
+        with override_settings(FORM_STUFF_INGEST_MODE='queued', FORM_STUFF_INGEST_QUEUE_PATH=self.queue_path):
+            receipt = self.submit_all()[1].json()['receipt']
+            self.dropdown.options = ['red']
+            self.dropdown.save()
+            self.assertEqual(ingest.flush(ingest.get_queue()), (2, 1))
+            status = self.client.get(f'/api/submissions/{receipt}/').json()
+            self.assertEqual(status['status'], ingest.FAILED)
+            self.assertIn('answers', status['errors'])
+            self.assertEqual(self.client.get('/api/submissions/unknown/').status_code, 404)
+        self.assertEqual(Response.objects.count(), 2)
+
+
+class SchemaCacheTests(TestCase):
+    """
+    Form schemas are served from the cache with ETags until the form or one
+    of its questions changes.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='admin', password='x')
+        self.form = Form.objects.create(title="Survey", created_by=self.user)
+        self.question = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b'], order=0
+        )
+        self.url = f'/api/form_questions/{self.form.id}/'
+
+    def test_unchanged_schemas_are_revalidated(self):
+        for url in (self.url, f'/api/forms/{self.form.id}/'):
+            with self.subTest(url=url):
+                first = self.client.get(url)
+                self.assertEqual(first.status_code, 200)
+                self.assertEqual(first['Cache-Control'], 'no-cache')
+                etag = first['ETag']
+                with self.assertNumQueries(0):
+                    cached = self.client.get(url)
+                    not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=f'"stale", {etag}')
+                self.assertEqual((cached.json(), cached['ETag']), (first.json(), etag))
+                self.assertEqual(not_modified.status_code, 304)
+                self.assertEqual(not_modified['ETag'], etag)
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def assertVersionBumped(self, change):
+        etag = self.client.get(self.url)['ETag']
+        change()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        return response.json()
+
+    def test_question_edits_bump_the_version(self):
+        def edit():
+            self.question.options = ['a', 'b', 'c']
+            self.question.save()
+        questions = self.assertVersionBumped(edit)
+        self.assertEqual(questions[0]['options'], ['a', 'b', 'c'])
+        self.assertEqual(schema.question_map(self.form.id)[self.question.id].options, ['a', 'b', 'c'])
+
+        questions = self.assertVersionBumped(lambda: Question.objects.create(
+            form=self.form, text="Say", question_type=Question.TEXT, order=1
+        ))
+        self.assertEqual(len(questions), 2)
+        self.assertVersionBumped(lambda: Question.objects.filter(order=1).first().delete())
+
+        def rename():
+            self.form.title = "Renamed"
+            self.form.save()
+        self.assertVersionBumped(rename)
+
+    def test_question_set_edits_bump_the_version(self):
+        self.client.force_authenticate(self.user)
+
+        def edit():
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.patch(f'/api/forms/{self.form.id}/questions/', {'questions': [
+                    {'id': self.question.id, 'text': "Pick one"},
+                ]}, format='json')
+            self.assertEqual(response.status_code, 200)
+        questions = self.assertVersionBumped(edit)
+        self.assertEqual(questions[0]['text'], "Pick one")
+
+
+class QueryBudgetMixin:
+    """
+    Test helpers asserting that an endpoint stays within a query budget.
+
+    A budget is the maximum number of queries a request may run. Endpoints
+    are exercised at two dataset sizes so that any per-row query (an N+1)
+    shows up as a budget overrun on the larger dataset.
+    """
+
+    def assertQueryBudget(self, budget, method, url, data=None, status_code=200, client=None):
+        """
+        Perform a request and fail if it runs more than `budget` queries.
+        """
+        client = client or self.client
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url, data=data, format='json')
+            if response.streaming:
+                # Streamed bodies query lazily; drain them inside the budget
+                b''.join(response.streaming_content)
+        self.assertEqual(
+            response.status_code, status_code,
+            f"{method.upper()} {url} returned {response.status_code}"
+        )
+        executed = len(queries)
+        self.assertLessEqual(
+            executed, budget,
+            f"{method.upper()} {url} ran {executed} queries, budget is {budget}:\n"
+            + "\n".join(query['sql'] for query in queries.captured_queries)
+        )
+        return response
+
+
+def route_names(patterns):
+    """
+    Collect the names of every route in a URL configuration.
+    """
+    names = set()
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            names |= route_names(pattern.url_patterns)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(pattern.name)
+    return names
+
+
+# Live feeds end right after their opening snapshot so they can be drained
+@override_settings(FORM_STUFF_LIVE_MAX_SECONDS=0)
+class EndpointQueryBudgetTests(QueryBudgetMixin, TestCase):
+    """
+    Every endpoint in `form_stuff/urls.py` must run a fixed number of queries
+    whatever the number of forms, questions and responses.
+    """
+
+    # Route name -> (query budget, URL template, expected status)
+    BUDGETS = {
+        'api-root': (0, '/api/', 200),
+        'form-list': (2, '/api/forms/', 200),
+        'form-detail': (3, '/api/forms/{form}/', 200),
+        'question-list': (1, '/api/questions/', 200),
+        'question-detail': (1, '/api/questions/{question}/', 200),
+        'response-list': (1, '/api/responses/?form={form}', 200),
+        'response-detail': (1, '/api/responses/{response}/', 200),
+        'answer-list': (1, '/api/answers/', 200),
+        'answer-detail': (1, '/api/answers/{answer}/', 200),
+        'analytics': (3, '/api/response_analytics/{form}/', 200),
+        'analytics-live': (3, '/api/response_analytics/{form}/live/', 200),
+        'form-responses': (2, '/api/form_responses/{form}/', 200),
+        'form-questions': (1, '/api/form_questions/{form}/', 200),
+        'form-export': (3, '/api/form_export/{form}/', 200),
+        'submission-receipt': (0, '/api/submissions/unknown/', 404),
+        'job-list': (0, '/api/jobs/', 405),
+        'job-detail': (1, '/api/jobs/{job}/', 200),
+        'job-artifact': (1, '/api/jobs/{job}/artifact/', 409),
+        'form-question-set': (0, '/api/forms/{form}/questions/', 405),
+    }
+
+    ANSWERS = {
+        Question.TEXT: 'lovely weather today',
+        Question.DROPDOWN: 'a',
+        Question.CHECKBOX: ['a', 'c'],
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('admin', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_forms(self, form_count, question_count, response_count):
+        """
+        Create forms with questions and answered responses, and remember the
+        ids of the last ones for the detail routes.
+        """
+        for _ in range(form_count):
+            form = Form.objects.create(title="Survey", created_by=self.user)
+            questions = [
+                Question.objects.create(
+                    form=form,
+                    text=f"Question {order}",
+                    question_type=[Question.TEXT, Question.DROPDOWN, Question.CHECKBOX][order % 3],
+                    options=None if order % 3 == 0 else ['a', 'b', 'c'],
+                    order=order
+                )
+                for order in range(question_count)
+            ]
+            for _ in range(response_count):
+                response = Response.objects.create(form=form)
+                for question in questions:
+                    Answer.objects.create(
+                        response=response,
+                        question=question,
+                        text_answer=self.ANSWERS[question.question_type]
+                    )
+        answer = Answer.objects.filter(question__form=form).last()
+        job = Job.objects.create(kind=Job.EXPORT, form=form, export_format='csv', created_by=self.user)
+        self.ids = {
+            'form': form.id,
+            'question': questions[0].id,
+            'response': answer and answer.response_id,
+            'answer': answer and answer.id,
+            'job': job.id,
+        }
+        return form
+
+    def check_budgets(self):
+        for name, (budget, url, status_code) in self.BUDGETS.items():
+            with self.subTest(route=name):
+                cache.clear()
+                self.assertQueryBudget(budget, 'get', url.format(**self.ids), status_code=status_code)
+
+    def test_every_route_has_a_budget(self):
+        missing = route_names(form_stuff_urls.urlpatterns) - set(self.BUDGETS)
+        self.assertFalse(missing, f"Routes without a query budget: {sorted(missing)}")
+
+    def test_budgets_small_dataset(self):
+        self.create_forms(form_count=2, question_count=3, response_count=2)
+        self.check_budgets()
+
+    def test_budgets_large_dataset(self):
+        self.create_forms(form_count=10, question_count=12, response_count=10)
+        self.check_budgets()
+
+    def test_submission_budget_is_independent_of_question_count(self):
+        for question_count in (3, 30):
+            form = self.create_forms(form_count=1, question_count=question_count, response_count=0)
+            answers = [
+                {'question': question.id, 'text_answer': self.ANSWERS[question.question_type]}
+                for question in form.questions.all()
+            ]
+            cache.clear()
+            self.assertQueryBudget(
+                9, 'post', '/api/responses/',
+                {'form': form.id, 'answers': answers}, status_code=201
+            )
+
+
+class ExportTests(TestCase):
+    """
+    Every export format must hold one row per response, in submission order,
+    and one column per question.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='admin'))
+        self.form = Form.objects.create(title="Survey")
+        self.comment = Question.objects.create(form=self.form, text="Comment", question_type=Question.TEXT, order=0)
+        self.colour = Question.objects.create(
+            form=self.form, text="Colour", question_type=Question.DROPDOWN, options=['red', 'blue'], order=1
+        )
+        self.ticks = Question.objects.create(
+            form=self.form, text="Comment", question_type=Question.CHECKBOX, options=['x', 'y'], order=2
+        )
+        start = timezone.now().replace(microsecond=0)
+        self.first = Response.objects.create(form=self.form, ip_address='10.0.0.1', user_agent='A')
+        self.second = Response.objects.create(form=self.form)
+        # The second response was submitted first
+        Response.objects.filter(id=self.first.id).update(submitted_at=start)
+        Response.objects.filter(id=self.second.id).update(submitted_at=start - timedelta(hours=1))
+        for question, value in ((self.comment, 'Said "hi",\nthen left'), (self.colour, 'blue'), (self.ticks, ['x', 'y'])):
+            Answer.objects.create(response=self.first, question=question, text_answer=value)
+        Answer.objects.create(response=self.second, question=self.colour, text_answer='red')
+        self.columns = exports.META_COLUMNS + ['Comment [%d]' % self.comment.id, 'Colour', 'Comment [%d]' % self.ticks.id]
+        self.start = start
+
+    def export(self, output):
+        response = self.client.get(f'/api/form_export/{self.form.id}/?output={output}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], exports.CONTENT_TYPES[output])
+        self.assertIn(exports.export_filename(self.form.id, output), response['Content-Disposition'])
+        return b''.join(response.streaming_content)
+
+    def test_csv(self):
+        rows = list(csv.reader(StringIO(self.export('csv').decode())))
+        self.assertEqual(rows, [
+            self.columns,
+            [str(self.second.id), (self.start - timedelta(hours=1)).isoformat(), '', '', '', 'red', ''],
+            [str(self.first.id), self.start.isoformat(), '10.0.0.1', 'A', 'Said "hi",\nthen left', 'blue', 'x; y'],
+        ])
+
+    @staticmethod
+    def iso(moment):
+        # DRF's JSON encoder writes UTC as "Z"
+        return moment.isoformat().replace('+00:00', 'Z')
+
+    def test_ndjson(self):
+        lines = self.export('ndjson').decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], [
+            dict(zip(self.columns, [self.second.id, self.iso(self.start - timedelta(hours=1)), None, None, None, 'red', None])),
+            dict(zip(self.columns, [self.first.id, self.iso(self.start), '10.0.0.1', 'A', 'Said "hi",\nthen left', 'blue', ['x', 'y']])),
+        ])
+
+    def test_columnar(self):
+        groups = list(exports.read_columnar(BytesIO(self.export('columnar'))))
+        self.assertEqual(len(groups), 1)
+        self.assertEqual(list(groups[0]), self.columns)
+        self.assertEqual(groups[0]['response_id'], [self.second.id, self.first.id])
+        self.assertEqual(groups[0]['Comment [%d]' % self.ticks.id], [None, ['x', 'y']])
+
+        questions = exports.export_questions(self.form.id)
+        chunks = exports.columnar_chunks(
+            exports.export_columns(questions), exports.iter_rows(self.form.id, questions), row_group_size=1
+        )
+        groups = list(exports.read_columnar(BytesIO(b''.join(chunks))))
+        self.assertEqual([group['Colour'] for group in groups], [['red'], ['blue']])
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get(f'/api/form_export/{self.form.id}/?output=xml').status_code, 400)
+        self.assertEqual(self.client.get('/api/form_export/0/').status_code, 404)
+
+
+# Jobs run in this process; the pool's connection cleanup is skipped
+@mock.patch.object(jobs.connections, 'close_all')
+class JobTests(TestCase):
+    """
+    Jobs are queued through the API, run by a worker and their artifacts
+    downloaded, in whole or by range.
+    """
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(FORM_STUFF_JOB_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create(username='admin')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.form = Form.objects.create(title="Survey", created_by=self.user)
+        question = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['red', 'blue'], order=0
+        )
+        for option in ('red', 'red', 'blue'):
+            Answer.objects.create(
+                response=Response.objects.create(form=self.form), question=question, text_answer=option
+            )
+
+    def queue(self, **data):
+        response = self.client.post('/api/jobs/', {'form': self.form.id, **data}, format='json')
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response.json()['status'], Job.QUEUED)
+        return response.json()['id']
+
+    def run_next(self):
+        job_id = jobs.claim_next()
+        self.assertEqual(Job.objects.get(id=job_id).status, Job.RUNNING)
+        return jobs.run_job(job_id)
+
+    def test_export_job(self, close_all):
+        job_id = self.queue(kind=Job.EXPORT, export_format='csv')
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/artifact/').status_code, 409)
+        self.assertEqual(self.run_next(), Job.DONE)
+        self.assertIsNone(jobs.claim_next())
+
+        job = self.client.get(f'/api/jobs/{job_id}/').json()
+        self.assertEqual(job['status'], Job.DONE)
+        expected = ''.join(exports.export_form(self.form.id, 'csv')).encode()
+        self.assertEqual(job['artifact_size'], len(expected))
+        response = self.client.get(f'/api/jobs/{job_id}/artifact/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), expected)
+
+        url = f'/api/jobs/{job_id}/artifact/'
+        response = self.client.get(url, HTTP_RANGE='bytes=5-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 5-14/{len(expected)}')
+        self.assertEqual(b''.join(response.streaming_content), expected[5:15])
+        response = self.client.get(url, HTTP_RANGE='bytes=-4')
+        self.assertEqual(b''.join(response.streaming_content), expected[-4:])
+        response = self.client.get(url, HTTP_RANGE=f'bytes={len(expected)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(expected)}')
+
+    def test_analytics_snapshot_job(self, close_all):
+        job_id = self.queue(kind=Job.ANALYTICS_SNAPSHOT)
+        self.assertEqual(self.run_next(), Job.DONE)
+        response = self.client.get(f'/api/jobs/{job_id}/artifact/')
+        snapshot = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(snapshot['form'], self.form.id)
+        self.assertEqual(
+            snapshot['analytics'],
+            json.loads(json.dumps(analytics_module.compute_form_analytics(self.form.id)))
+        )
+
+    def test_failed_job(self, close_all):
+        job_id = self.queue(kind=Job.EXPORT, export_format='ndjson')
+        with mock.patch.object(jobs.exports, 'export_form', side_effect=RuntimeError("disk full")), \
+                mock.patch.object(jobs.logger, 'exception'):
+            self.assertEqual(self.run_next(), Job.FAILED)
+        job = self.client.get(f'/api/jobs/{job_id}/').json()
+        self.assertEqual((job['status'], job['error']), (Job.FAILED, "disk full"))
+        self.assertEqual(self.client.get(f'/api/jobs/{job_id}/artifact/').status_code, 409)
+
+    def test_missing_artifact(self, close_all):
+        job_id = self.queue(kind=Job.EXPORT, export_format='columnar')
+        self.run_next()
+        os.remove(jobs.artifact_path(Job.objects.get(id=job_id)))
+        for headers in ({}, {'HTTP_RANGE': 'bytes=0-9'}):
+            self.assertEqual(self.client.get(f'/api/jobs/{job_id}/artifact/', **headers).status_code, 404)
+
+    def test_interrupted_jobs_are_requeued(self, close_all):
+        job_id = self.queue(kind=Job.ANALYTICS_SNAPSHOT)
+        self.assertEqual(jobs.claim_next('dead'), job_id)
+        self.assertEqual(Job.objects.get(id=job_id).worker, 'dead')
+        # A freshly claimed job belongs to a live worker
+        self.assertEqual(jobs.requeue_interrupted(), 0)
+        self.assertIsNone(jobs.claim_next('other'))
+
+        stale = timezone.now() - jobs.stale_after() - timedelta(seconds=1)
+        Job.objects.filter(id=job_id).update(heartbeat_at=stale)
+        self.assertEqual(jobs.requeue_interrupted(), 1)
+        self.assertEqual(jobs.claim_next('other'), job_id)
+        self.assertEqual(Job.objects.get(id=job_id).worker, 'other')
+
+    def test_heartbeat_keeps_running_jobs(self, close_all):
+        job_id = self.queue(kind=Job.ANALYTICS_SNAPSHOT)
+        jobs.claim_next('live')
+        stale = timezone.now() - jobs.stale_after() - timedelta(seconds=1)
+        Job.objects.filter(id=job_id).update(heartbeat_at=stale)
+        self.assertEqual(jobs.heartbeat('live'), 1)
+        self.assertEqual(jobs.requeue_interrupted(), 0)
+        self.assertEqual(Job.objects.get(id=job_id).status, Job.RUNNING)
+        self.assertEqual(jobs.run_job(job_id), Job.DONE)
+        self.assertEqual(jobs.heartbeat('live'), 0)
+
+    def test_jobs_are_private(self, close_all):
+        job_id = self.queue(kind=Job.EXPORT)
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username='other'))
+        self.assertEqual(other.get(f'/api/jobs/{job_id}/').status_code, 404)
+        response = self.client.post('/api/jobs/', {'form': self.form.id, 'kind': Job.EXPORT, 'export_format': 'xml'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class TokenizerTests(SimpleTestCase):
+    """
+    Words are counted case-insensitively and without surrounding
+    punctuation, and batched counting matches tokenizing answer by answer.
+    """
+
+    ANSWERS = [
+        "Great! GREAT, great... and 'great'",
+        "Don't forget the follow-up -- really (really) fast",
+        "Café naïve—résumé; trailing-",
+        "‘Quoted’ words\nacross\tlines",
+        None,
+        ['not', 'text'],
+        "",
+        "tiny ok",
+    ]
+
+    def test_punctuation_and_case(self):
+        tokenizer = text_analytics.Tokenizer()
+        self.assertEqual(tokenizer.tokenize(self.ANSWERS[0]), ['great', 'great', 'great', 'great'])
+        self.assertEqual(
+            tokenizer.tokenize(self.ANSWERS[1]), ["don't", 'forget', 'follow-up', 'really', 'really']
+        )
+        self.assertEqual(tokenizer.tokenize(self.ANSWERS[2]), ['naïve', 'résumé', 'trailing'])
+        self.assertEqual(tokenizer.tokenize(self.ANSWERS[3]), ['quoted', 'words', 'across', 'lines'])
+        self.assertEqual(tokenizer.tokenize(None), [])
+
+    def test_stop_words_and_min_length(self):
+        tokenizer = text_analytics.Tokenizer(min_length=3, stop_words=['The', 'AND'])
+        self.assertEqual(tokenizer.tokenize("The cat and THE dog"), ['cat', 'dog'])
+        with override_settings(FORM_STUFF_TEXT_MIN_WORD_LENGTH=2, FORM_STUFF_TEXT_STOP_WORDS=['ok']):
+            self.assertEqual(text_analytics.default_tokenizer().tokenize(self.ANSWERS[-1]), ['tiny'])
+
+    def test_batches_match_answer_by_answer(self):
+        tokenizer = text_analytics.Tokenizer()
+        expected = Counter(word for answer in self.ANSWERS for word in tokenizer.tokenize(answer))
+        for batch_size in (1, 2, 3, len(self.ANSWERS)):
+            with self.subTest(batch_size=batch_size):
+                self.assertEqual(tokenizer.count(self.ANSWERS, batch_size=batch_size), expected)
+        # Answers are never joined into one word across a batch separator
+        self.assertEqual(tokenizer.count(["hello", "world"]), Counter({'hello': 1, 'world': 1}))
+
+    def test_word_frequencies(self):
+        result = text_analytics.word_frequencies(self.ANSWERS, k=2)
+        self.assertEqual(result['top_words'], [{'word': 'great', 'count': 4}, {'word': 'really', 'count': 2}])
+        self.assertEqual(result['others'], 10)
+
+
+class SketchTests(TestCase):
+    """
+    The approximate analytics sketches must keep their error bounds, merge
+    across partitions and fold answers incrementally.
+    """
+
+    def setUp(self):
+        self.form = Form.objects.create(title="Survey")
+        self.text = Question.objects.create(form=self.form, text="Say", question_type=Question.TEXT, order=0)
+        self.dropdown = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['red', 'blue', 'green'], order=1
+        )
+
+    def answer(self, count, start=0):
+        for i in range(start, start + count):
+            response = Response.objects.create(form=self.form, ip_address=f'10.0.0.{i % 50}', user_agent='test')
+            # Distinct counts, so the top values have a single order
+            Answer.objects.create(
+                response=response, question=self.text, text_answer=' '.join(['lovely', 'weather', 'today'][:i % 3 + 1])
+            )
+            Answer.objects.create(
+                response=response, question=self.dropdown, text_answer=['red', 'red', 'red', 'blue', 'blue', 'green'][i % 6]
+            )
+
+    def folded_answers(self):
+        return dict(
+            QuestionSketch.objects.values('question_id').annotate(total=Sum('answers')).values_list('question_id', 'total')
+        )
+
+    def approximate(self):
+        # Without the fold bookkeeping, which depends on the partitioning
+        payload = sketches.form_analytics(self.form.id)
+        sketch = {question_id: item['data'].pop('sketch') for question_id, item in payload.items()}
+        return payload, sketch
+
+    def test_count_min_never_underestimates(self):
+        sketch = sketches.CountMinSketch(epsilon=0.01, delta=0.01)
+        counts = {f'key{i}': i % 17 + 1 for i in range(2000)}
+        for key, count in counts.items():
+            sketch.add(key, count)
+        total = sum(counts.values())
+        self.assertEqual(sketch.total, total)
+        misses = 0
+        for key, count in counts.items():
+            estimate = sketch.estimate(key)
+            self.assertGreaterEqual(estimate, count)
+            misses += estimate - count > 0.01 * total
+        self.assertLessEqual(misses, 0.01 * len(counts))
+        restored = sketches.CountMinSketch.from_bytes(sketch.to_bytes())
+        self.assertEqual(restored.total, total)
+        self.assertEqual(restored.estimate('key3'), sketch.estimate('key3'))
+
+    def test_space_saving_keeps_heavy_hitters(self):
+        summary = sketches.SpaceSaving(capacity=10)
+        counts = {'heavy': 500, 'big': 300, 'medium': 120}
+        counts.update({f'rare{i}': 1 for i in range(400)})
+        stream = [key for key, count in counts.items() for _ in range(count)]
+        random.Random(0).shuffle(stream)
+        for key in stream:
+            summary.add(key)
+        top = summary.top(3)
+        self.assertEqual([key for key, _ in top], ['heavy', 'big', 'medium'])
+        for key, count in top:
+            self.assertGreaterEqual(count, counts[key])
+            self.assertLessEqual(count - counts[key], summary.errors[key])
+            self.assertLessEqual(summary.errors[key], len(stream) / summary.capacity)
+
+    def test_hyperloglog_estimate(self):
+        counter = sketches.HyperLogLog()
+        for i in range(20000):
+            counter.add(f'respondent{i}')
+            counter.add(f'respondent{i}')
+        error = 1.04 / (len(counter.registers) ** 0.5)
+        self.assertLess(abs(counter.count() - 20000) / 20000, 3 * error)
+        self.assertEqual(sketches.HyperLogLog.from_bytes(counter.to_bytes()).count(), counter.count())
+
+    def test_partitions_merge_into_the_single_partition_result(self):
+        self.answer(60)
+        sketches.fold_answers(self.form.id)
+        single, _ = self.approximate()
+        QuestionSketch.objects.all().delete()
+        for partition in range(3):
+            sketches.fold_answers(self.form.id, partition, 3)
+        self.assertEqual(QuestionSketch.objects.count(), 6)
+        partitioned, sketch = self.approximate()
+        self.assertEqual(partitioned, single)
+        self.assertEqual(
+            sketch[self.dropdown.id],
+            {'watermark': min(QuestionSketch.objects.values_list('last_answer_id', flat=True)), 'caught_up': 0, 'lag': 0}
+        )
+        exact = analytics_module.compute_form_analytics(self.form.id)
+        self.assertEqual(
+            single[self.dropdown.id]['data']['top_options'], exact[self.dropdown.id]['data']['top_options']
+        )
+
+    def test_folding_is_incremental(self):
+        self.answer(30)
+        self.assertEqual(sketches.fold_answers(self.form.id), 60)
+        self.assertEqual(sketches.fold_answers(self.form.id), 0)
+        self.answer(20, start=30)
+        self.assertEqual(sketches.fold_answers(self.form.id), 40)
+        incremental = sketches.form_analytics(self.form.id)
+        QuestionSketch.objects.all().delete()
+        sketches.fold_answers(self.form.id)
+        self.assertEqual(sketches.form_analytics(self.form.id), incremental)
+        self.assertEqual(self.folded_answers(), {self.text.id: 50, self.dropdown.id: 50})
+
+    def test_changing_the_partition_count_rebuilds(self):
+        self.answer(30)
+        call_command('update_sketches', self.form.id, stdout=StringIO())
+        call_command('update_sketches', self.form.id, partitions=4, stdout=StringIO())
+        self.assertEqual(self.folded_answers(), {self.text.id: 30, self.dropdown.id: 30})
+        self.assertEqual(set(QuestionSketch.objects.values_list('partitions', flat=True)), {4})
+        call_command('update_sketches', self.form.id, partitions=2, partition=1, stdout=StringIO())
+        self.assertEqual(set(QuestionSketch.objects.values_list('partition', 'partitions')), {(1, 2)})
+        with self.assertRaises(CommandError):
+            call_command('update_sketches', partitions=0, stdout=StringIO())
+
+    def test_recent_answers_are_caught_up_or_reported(self):
+        self.answer(30)
+        sketches.fold_answers(self.form.id)
+        stale, _ = self.approximate()
+        watermark = Answer.objects.order_by('id').last().id
+        self.answer(20, start=30)
+
+        caught_up, sketch = self.approximate()
+        self.assertEqual(sketch[self.text.id], {'watermark': watermark, 'caught_up': 20, 'lag': 0})
+        sketches.fold_answers(self.form.id)
+        self.assertEqual(caught_up, self.approximate()[0])
+        self.assertNotEqual(caught_up, stale)
+
+        QuestionSketch.objects.update(last_answer_id=watermark)
+        with override_settings(FORM_STUFF_SKETCH_CATCH_UP=39):
+            _, sketch = self.approximate()
+        self.assertEqual(sketch[self.dropdown.id], {'watermark': watermark, 'caught_up': 0, 'lag': 20})
+
+    def test_checkbox_payload_has_the_exact_shape(self):
+        checkbox = Question.objects.create(
+            form=self.form, text="Tick", question_type=Question.CHECKBOX, options=['x', 'y', 'z'], order=2
+        )
+        combinations = [['x'], ['x', 'y'], ['x', 'y'], ['x', 'y', 'z'], ['z'], ['y', 'z'], []]
+        for i, combination in enumerate(combinations * 3):
+            response = Response.objects.create(form=self.form, ip_address=f'10.0.0.{i}')
+            Answer.objects.create(response=response, question=checkbox, text_answer=combination)
+            if i == 10:
+                for partition in range(2):
+                    sketches.fold_answers(self.form.id, partition, 2)
+        exact = analytics_module.compute_form_analytics(self.form.id)[checkbox.id]['data']
+        approximate = self.approximate()[0][checkbox.id]['data']
+        self.assertLessEqual(set(exact), set(approximate))
+        self.assertEqual(approximate['option_counts'], exact['option_counts'])
+        self.assertEqual(approximate['co_occurrence'], exact['co_occurrence'])
+
+
+class RollupTests(TestCase):
+    """
+    Windowed analytics and submission series are summed from hourly
+    rollups, with day buckets in UTC.
+    """
+
+    DAY = datetime(2026, 3, 1, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.question = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['red', 'blue'], order=0
+        )
+        for hours, option in ((-0.5, 'red'), (10 / 60, 'blue'), (50 / 60, 'blue'), (5, 'red'), (58, 'red')):
+            self.submit(self.DAY + timedelta(hours=hours), option)
+
+    def submit(self, moment, option):
+        with mock.patch('django.utils.timezone.now', return_value=moment):
+            response = self.client.post('/api/responses/', {
+                'form': self.form.id,
+                'answers': [{'question': self.question.id, 'text_answer': option}],
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def counts(self, series):
+        return [(entry['bucket'], entry['count']) for entry in series]
+
+    def test_hourly_rows(self):
+        self.assertEqual(
+            sorted(FormSubmissionRollup.objects.values_list('bucket_start', 'count')),
+            [
+                (self.DAY - timedelta(hours=1), 1),
+                (self.DAY, 2),
+                (self.DAY + timedelta(hours=5), 1),
+                (self.DAY + timedelta(hours=58), 1),
+            ]
+        )
+
+    def test_day_buckets_include_empty_days(self):
+        series = rollups.submission_series(self.form.id)
+        self.assertEqual(self.counts(series), [
+            (self.DAY - timedelta(days=1), 1),
+            (self.DAY, 3),
+            (self.DAY + timedelta(days=1), 0),
+            (self.DAY + timedelta(days=2), 1),
+        ])
+
+    def test_hour_buckets_within_a_window(self):
+        series = rollups.submission_series(
+            self.form.id, self.DAY + timedelta(minutes=30), self.DAY + timedelta(hours=6), 'hour'
+        )
+        # `from` is rounded down to the start of its hour
+        self.assertEqual([count for _, count in self.counts(series)], [2, 0, 0, 0, 0, 1])
+
+        analytics = rollups.windowed_analytics(self.form.id, self.DAY, self.DAY + timedelta(days=1))
+        self.assertEqual(
+            analytics[self.question.id]['data']['top_options'],
+            [{'option': 'blue', 'count': 2}, {'option': 'red', 'count': 1}]
+        )
+
+    def test_window_endpoint(self):
+        url = f'/api/response_analytics/{self.form.id}/'
+        response = self.client.get(url, {'from': '2026-03-01', 'to': '2026-03-03'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['bucket'], 'day')
+        self.assertEqual([entry['count'] for entry in data['submissions']], [3, 0])
+        self.assertEqual(
+            data['questions'][str(self.question.id)]['data']['top_options'][0], {'option': 'blue', 'count': 2}
+        )
+        for params in (
+            {'bucket': 'week'},
+            {'from': 'yesterday'},
+            {'from': '2026-03-02', 'to': '2026-03-01'},
+            {'from': '2026-03-01', 'mode': 'approximate'},
+            {'from': '2000-01-01', 'to': '2026-01-01', 'bucket': 'hour'},
+        ):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 400)
+
+    def test_max_buckets(self):
+        start = self.DAY - timedelta(days=1)
+        with mock.patch.object(rollups, 'MAX_BUCKETS', 4):
+            self.assertEqual(len(rollups.submission_series(self.form.id, start, start + timedelta(days=4))), 4)
+            with self.assertRaisesMessage(ValueError, "more than 4 buckets"):
+                rollups.submission_series(self.form.id, start, start + timedelta(days=5))
+            with self.assertRaises(ValueError):
+                rollups.submission_series(self.form.id, bucket='hour')
+
+
+class CheckboxAnalyticsTests(SimpleTestCase):
+    """
+    Checkbox combinations are counted as bitmasks, falling back to sorted
+    tuples for answers that cannot be encoded, and reported with per-option
+    counts and a co-occurrence matrix.
+    """
+
+    ANSWERS = [['a', 'b'], ['b', 'a'], ['c'], ['a', 'b', 'c'], ['a', 'a'], ['zzz']]
+
+    def aggregator(self, stored_options=('a', 'b', 'c')):
+        return analytics_module.CheckboxAggregator(['a', 'b', 'c'], list(stored_options))
+
+    def test_bitmasks_and_tuple_fallback(self):
+        aggregator = self.aggregator()
+        aggregator.add_many(self.ANSWERS)
+        self.assertEqual(aggregator.masks, Counter({0b011: 2, 0b100: 1, 0b111: 1}))
+        # A repeated or unknown option cannot be a bitmask
+        self.assertEqual(aggregator.counts, Counter({('a', 'a'): 1, ('zzz',): 1}))
+        self.assertEqual(aggregator.key_counts(), Counter({
+            ('a', 'b'): 2, ('c',): 1, ('a', 'b', 'c'): 1, ('a', 'a'): 1, ('zzz',): 1,
+        }))
+
+    def test_co_occurrence(self):
+        aggregator = self.aggregator()
+        aggregator.add_many(self.ANSWERS)
+        result = aggregator.result(k=2)
+        self.assertEqual(result['top_combos'], [
+            {'combination': ['a', 'b'], 'count': 2}, {'combination': ['c'], 'count': 1},
+        ])
+        self.assertEqual(result['others'], 3)
+        self.assertEqual(
+            result['option_counts'],
+            [{'option': 'a', 'count': 3}, {'option': 'b', 'count': 3}, {'option': 'c', 'count': 2}]
+        )
+        self.assertEqual(result['co_occurrence'], {'options': ['a', 'b', 'c'], 'matrix': [
+            [3, 3, 1],
+            [3, 3, 1],
+            [1, 1, 2],
+        ]})
+
+    def test_stored_masks_in_another_bit_order(self):
+        # Options were reordered and 'd' removed since these answers were stored
+        stored_options = ['c', 'a', 'b', 'd']
+        codec = AnswerCodec(Question.CHECKBOX, stored_options)
+        aggregator = self.aggregator(stored_options)
+        aggregator.add_stored([codec.encode(answer) for answer in self.ANSWERS + [['d', 'a']]])
+
+        expected = self.aggregator()
+        expected.add_many(self.ANSWERS)
+        expected.counts[('a', 'd')] += 1
+        self.assertEqual(aggregator.key_counts(), expected.key_counts())
+        for key in ('option_counts', 'co_occurrence'):
+            self.assertEqual(aggregator.result()[key], expected.result()[key])
+
+    def test_loaded_tuple_counts_join_the_matrix(self):
+        # Pre-aggregated counts are loaded as tuples
+        aggregator = self.aggregator()
+        aggregator.counts.update({('a', 'c'): 4, ('x', 'y'): 1})
+        self.assertEqual(aggregator.result()['co_occurrence']['matrix'], [[4, 0, 4], [0, 0, 0], [4, 0, 4]])
+
+
+class AsyncViewParityTests(TestCase):
+    """
+    The async public read views must answer exactly like the DRF views they
+    replace under ASGI.
+    """
+
+    VIEWS = {
+        'form_questions': AsyncFormQuestionsView,
+        'response_analytics': AsyncAnalyticsView,
+        'form_responses': AsyncFormResponsesView,
+    }
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        questions = [
+            Question.objects.create(
+                form=self.form,
+                text=f"Question {order}",
+                question_type=question_type,
+                options=None if question_type == Question.TEXT else ['a', 'b', 'c'],
+                order=order
+            )
+            for order, question_type in enumerate(
+                [Question.TEXT, Question.DROPDOWN, Question.CHECKBOX]
+            )
+        ]
+        for answers in (
+            ['lovely weather today', 'a', ['a', 'c']],
+            ['terrible weather', 'b', ['c']],
+            ['lovely people', 'a', ['a', 'b', 'c']],
+        ):
+            self.client.post('/api/responses/', {
+                'form': self.form.id,
+                'answers': [
+                    {'question': question.id, 'text_answer': answer}
+                    for question, answer in zip(questions, answers)
+                ]
+            }, format='json')
+
+    def async_get(self, endpoint, form_id, query='', **headers):
+        request = AsyncRequestFactory().get(f'/api/{endpoint}/{form_id}/{query}', headers=headers)
+        return async_to_sync(self.VIEWS[endpoint].as_view())(request, form_id=form_id)
+
+    def assertSameResponse(self, endpoint, form_id, query=''):
+        expected = self.client.get(f'/api/{endpoint}/{form_id}/{query}')
+        actual = self.async_get(endpoint, form_id, query)
+        self.assertEqual(actual.status_code, expected.status_code)
+        if expected.streaming:
+            async def drain():
+                return b''.join([chunk async for chunk in actual.streaming_content])
+            self.assertEqual(async_to_sync(drain)(), b''.join(expected.streaming_content))
+        else:
+            self.assertEqual(json.loads(actual.content), expected.json())
+
+    def test_payloads_match(self):
+        cases = [
+            ('form_questions', ''),
+            ('response_analytics', ''),
+            ('response_analytics', '?k=2'),
+            ('response_analytics', '?mode=approximate'),
+            ('response_analytics', '?bucket=hour'),
+            ('response_analytics', '?k=0'),
+            ('response_analytics', '?bucket=week'),
+            ('form_responses', ''),
+            ('form_responses', '?page_size=2'),
+            ('form_responses', '?stream=1'),
+            ('form_responses', '?cursor=not-a-cursor'),
+        ]
+        for endpoint, query in cases:
+            with self.subTest(endpoint=endpoint, query=query):
+                self.assertSameResponse(endpoint, self.form.id, query)
+
+    def test_unknown_form(self):
+        for endpoint in ('response_analytics', 'form_responses'):
+            with self.subTest(endpoint=endpoint):
+                self.assertSameResponse(endpoint, self.form.id + 1)
+
+    def test_questions_etag_revalidation(self):
+        etag = self.async_get('form_questions', self.form.id)['ETag']
+        self.assertEqual(self.client.get(f'/api/form_questions/{self.form.id}/')['ETag'], etag)
+        response = self.async_get('form_questions', self.form.id, If_None_Match=etag)
+        self.assertEqual(response.status_code, 304)
+
+
+@override_settings(FORM_STUFF_LIVE_MAX_UPDATES_PER_SECOND=1000, FORM_STUFF_LIVE_MAX_SECONDS=0)
+class LiveAnalyticsTests(TestCase):
+    """
+    Live feeds open with the analytics snapshot and then receive the
+    coalesced counts of committed submissions.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.dropdown = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b'], order=0
+        )
+        self.checkbox = Question.objects.create(
+            form=self.form, text="Tick", question_type=Question.CHECKBOX, options=['a', 'b'], order=1
+        )
+
+    def submit(self, dropdown, checkbox):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/responses/', {
+                'form': self.form.id,
+                'answers': [
+                    {'question': self.dropdown.id, 'text_answer': dropdown},
+                    {'question': self.checkbox.id, 'text_answer': checkbox},
+                ]
+            }, format='json')
+
+    def test_submissions_coalesce_into_one_delta(self):
+        subscription = live.publisher.subscribe(self.form.id)
+        try:
+            self.submit('a', ['b', 'a'])
+            self.submit('a', ['a'])
+            self.submit('b', ['a', 'b'])
+            delta = live.render_delta(*subscription.drain())
+        finally:
+            live.publisher.unsubscribe(subscription)
+        self.assertEqual(delta['responses'], 3)
+        self.assertCountEqual(delta['questions'][self.dropdown.id]['counts'], [
+            {'option': 'a', 'count': 2},
+            {'option': 'b', 'count': 1},
+        ])
+        self.assertCountEqual(delta['questions'][self.checkbox.id]['counts'], [
+            {'combination': ['a', 'b'], 'count': 2},
+            {'combination': ['a'], 'count': 1},
+        ])
+        self.assertEqual(subscription.drain()[0], 0)
+
+    def test_unwatched_forms_are_not_tracked(self):
+        self.submit('a', ['a'])
+        self.assertFalse(live.publisher.watched(self.form.id))
+
+    @override_settings(FORM_STUFF_LIVE_MAX_SECONDS=60)
+    def test_feed_sends_snapshot_then_deltas(self):
+        self.submit('a', ['a'])
+        response = self.client.get(f'/api/response_analytics/{self.form.id}/live/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        opening = next(stream).decode()
+        self.assertIn('event: snapshot', opening)
+        snapshot = json.loads(opening.split('data: ', 1)[1])
+        self.assertEqual(snapshot[str(self.dropdown.id)]['data']['top_options'], [{'option': 'a', 'count': 1}])
+
+        self.submit('b', ['b'])
+        delta = next(stream).decode()
+        self.assertTrue(delta.startswith('event: delta'))
+        self.assertEqual(json.loads(delta.split('data: ', 1)[1])['responses'], 1)
+        response.close()
+        self.assertFalse(live.publisher.watched(self.form.id))
+
+    def test_async_feed_opens_with_the_same_snapshot(self):
+        request = AsyncRequestFactory().get(f'/api/response_analytics/{self.form.id}/live/')
+        response = async_to_sync(AsyncAnalyticsLiveView.as_view())(request, form_id=self.form.id)
+
+        async def drain():
+            return b''.join([chunk async for chunk in response.streaming_content])
+        expected = b''.join(self.client.get(f'/api/response_analytics/{self.form.id}/live/').streaming_content)
+        self.assertEqual(async_to_sync(drain)(), expected)
+
+    def test_unknown_form(self):
+        response = self.client.get(f'/api/response_analytics/{self.form.id + 1}/live/')
+        self.assertEqual(response.status_code, 404)
+
+
+class AnswerStorageTests(TestCase):
+    """
+    Answers are stored as plain text, option indexes and bitmasks, yet read
+    back and analysed exactly as submitted.
+    """
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('admin', password='password'))
+        self.form = Form.objects.create(title="Survey")
+        self.text = Question.objects.create(
+            form=self.form, text="Say", question_type=Question.TEXT, order=0
+        )
+        self.dropdown = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b', 'c'], order=1
+        )
+        self.checkbox = Question.objects.create(
+            form=self.form, text="Tick", question_type=Question.CHECKBOX, options=['a', 'b', 'c'], order=2
+        )
+
+    def submit(self, text, dropdown, checkbox):
+        response = self.client.post('/api/responses/', {
+            'form': self.form.id,
+            'answers': [
+                {'question': self.text.id, 'text_answer': text},
+                {'question': self.dropdown.id, 'text_answer': dropdown},
+                {'question': self.checkbox.id, 'text_answer': checkbox},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data['id']
+
+    def stored(self, response_id):
+        return {
+            question_id: (value_text, value_choice, value_json)
+            for question_id, value_text, value_choice, value_json in Answer.objects.filter(
+                response_id=response_id
+            ).values_list('question_id', 'value_text', 'value_choice', 'value_json')
+        }
+
+    def test_answers_are_stored_compactly(self):
+        stored = self.stored(self.submit('lovely weather', 'c', ['c', 'a']))
+        self.assertEqual(stored[self.text.id], ('lovely weather', None, None))
+        self.assertEqual(stored[self.dropdown.id], (None, 2, None))
+        self.assertEqual(stored[self.checkbox.id], (None, 0b101, None))
+
+        answers = {
+            answer['question']: answer['text_answer']
+            for answer in self.client.get('/api/answers/').json()
+        }
+        self.assertEqual(answers, {
+            self.text.id: 'lovely weather',
+            self.dropdown.id: 'c',
+            self.checkbox.id: ['a', 'c'],
+        })
+
+    def test_editing_options_keeps_stored_answers(self):
+        self.submit('lovely weather', 'a', ['a', 'b'])
+        for question in (self.dropdown, self.checkbox):
+            question.options = ['d', 'b']
+            question.save()
+        self.assertEqual(self.checkbox.stored_options, ['a', 'b', 'c', 'd'])
+        stored = self.stored(self.submit('lovely people', 'd', ['d', 'b']))
+        self.assertEqual(stored[self.checkbox.id], (None, 0b1010, None))
+
+        analytics = aggregates.form_analytics(self.form.id)
+        self.assertEqual(analytics, analytics_module.compute_form_analytics(self.form.id))
+        self.assertCountEqual(analytics[self.dropdown.id]['data']['top_options'], [
+            {'option': 'a', 'count': 1},
+            {'option': 'd', 'count': 1},
+        ])
+        self.assertCountEqual(analytics[self.checkbox.id]['data']['top_combos'], [
+            {'combination': ['a', 'b'], 'count': 1},
+            {'combination': ['b', 'd'], 'count': 1},
+        ])
+
+    def test_unencodable_values_fall_back_to_json(self):
+        answer = Answer.objects.create(
+            response=Response.objects.create(form=self.form),
+            question=self.checkbox,
+            text_answer=['a', 'a', 'z']
+        )
+        answer.refresh_from_db()
+        self.assertEqual((answer.value_choice, answer.value_json), (None, ['a', 'a', 'z']))
+        self.assertEqual(answer.text_answer, ['a', 'a', 'z'])
+
+    def test_answered_questions_keep_their_type(self):
+        self.submit('lovely weather', 'c', ['a', 'c'])
+        for question, question_type in ((self.checkbox, Question.DROPDOWN), (self.dropdown, Question.CHECKBOX)):
+            with self.subTest(question_type=question_type):
+                response = self.client.patch(
+                    f'/api/questions/{question.id}/', {'question_type': question_type}, format='json'
+                )
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('question_type', response.json())
+                response = self.client.patch(f'/api/forms/{self.form.id}/questions/', {'questions': [
+                    {'id': question.id, 'question_type': question_type},
+                ]}, format='json')
+                self.assertEqual(response.status_code, 400)
+                question = Question.objects.get(id=question.id)
+                question.question_type = question_type
+                with self.assertRaises(ValidationError):
+                    question.save()
+
+        # Stored indexes and bitmasks still decode for the original types
+        answers = {answer['question']: answer['text_answer'] for answer in self.client.get('/api/answers/').json()}
+        self.assertEqual((answers[self.dropdown.id], answers[self.checkbox.id]), ('c', ['a', 'c']))
+        self.assertEqual(aggregates.form_analytics(self.form.id), analytics_module.compute_form_analytics(self.form.id))
+
+    def test_unanswered_questions_can_change_type(self):
+        response = self.client.patch(
+            f'/api/questions/{self.checkbox.id}/', {'question_type': Question.DROPDOWN}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.checkbox.refresh_from_db()
+        self.checkbox.question_type = Question.CHECKBOX
+        self.checkbox.save()
+        self.submit('lovely weather', 'c', ['b'])
+        self.assertEqual(self.stored(Response.objects.get().id)[self.checkbox.id], (None, 0b10, None))
+
+
+class DatabaseProfileTests(TestCase):
+    """
+    New SQLite connections get the pragmas of the database profile.
+    """
+
+    def pragma(self, name):
+        new_connection = connections.create_connection('default')
+        try:
+            with new_connection.cursor() as cursor:
+                cursor.execute(f'PRAGMA {name}')
+                return cursor.fetchone()[0]
+        finally:
+            new_connection.close()
+
+    @override_settings(FORM_STUFF_DB_PROFILE='production')
+    def test_production_profile_applies_pragmas(self):
+        self.assertEqual(self.pragma('busy_timeout'), db.PRODUCTION_SQLITE_PRAGMAS['busy_timeout'])
+        # synchronous=NORMAL reads back as 1
+        self.assertEqual(self.pragma('synchronous'), 1)
+
+    @override_settings(FORM_STUFF_DB_PROFILE='production', FORM_STUFF_SQLITE_PRAGMAS={'busy_timeout': 1234})
+    def test_explicit_pragmas_replace_the_profile(self):
+        self.assertEqual(self.pragma('busy_timeout'), 1234)
+
+
+@mock.patch.dict(connections.settings, {'replica': {}})
+class ReplicaRoutingTests(SimpleTestCase):
+    """
+    Safe requests to the read endpoints read from the replica until they
+    write; writes always go to the primary.
+    """
+
+    def setUp(self):
+        self.router = replicas.ReadReplicaRouter()
+
+    def serve(self, method, path, cookies=None, view=None):
+        request = getattr(RequestFactory(), method)(path)
+        request.COOKIES.update(cookies or {})
+        request.resolver_match = resolve(path)
+        read = {}
+
+        def get_response(request):
+            middleware.process_view(request, request.resolver_match.func, (), {})
+            if view:
+                view()
+            read['alias'] = self.router.db_for_read(Form)
+            return HttpResponse()
+
+        middleware = ReplicaRoutingMiddleware(get_response)
+        response = middleware(request)
+        replicas.start_request(False)
+        return read['alias'], response
+
+    def test_read_endpoints_use_the_replica(self):
+        for path in ('/api/response_analytics/1/', '/api/form_responses/1/', '/api/forms/'):
+            self.assertEqual(self.serve('get', path)[0], 'replica', path)
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_other_requests_use_the_primary(self):
+        self.assertEqual(self.serve('get', '/api/form_export/1/')[0], 'default')
+        self.assertEqual(self.serve('post', '/api/forms/')[0], 'default')
+        self.assertEqual(self.serve('get', '/api/forms/', {replicas.PIN_COOKIE: '1'})[0], 'default')
+
+    def test_reads_stick_to_the_primary_after_a_write(self):
+        alias, response = self.serve(
+            'get', '/api/response_analytics/1/', view=lambda: self.router.db_for_write(Form)
+        )
+        self.assertEqual(alias, 'default')
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+    def test_without_a_replica_everything_uses_the_primary(self):
+        with mock.patch.dict(connections.settings, clear=True, default={}):
+            self.assertEqual(self.serve('get', '/api/response_analytics/1/')[0], 'default')
+
+    def test_copy_sqlite(self):
+        with tempfile.TemporaryDirectory() as directory:
+            primary, replica = os.path.join(directory, 'primary'), os.path.join(directory, 'replica')
+            with closing(sqlite3.connect(primary)) as database, database:
+                database.execute('CREATE TABLE t (x)')
+                database.execute('INSERT INTO t VALUES (1)')
+            replicas.copy_sqlite(primary, replica)
+            with closing(sqlite3.connect(replica)) as database:
+                self.assertEqual(database.execute('SELECT x FROM t').fetchall(), [(1,)])
+
+
+# A second database stands in for a shard. It is registered when the tests
+# are collected, so the test runner creates and migrates it like `default`.
+default_settings = connections['default'].settings_dict
+connections.settings.setdefault('shard1', {
+    **default_settings,
+    'TEST': {**default_settings['TEST'], 'NAME': None, 'MIRROR': None},
+})
+
+
+@override_settings(FORM_STUFF_SHARDS=['default', 'shard1'])
+class ShardingTests(TestCase):
+    """
+    Responses and analytics of a form live on its shard, and move with it.
+    """
+
+    databases = {'default', 'shard1'}
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.dropdown = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b'], order=0
+        )
+        self.text = Question.objects.create(
+            form=self.form, text="Say", question_type=Question.TEXT, order=1
+        )
+
+    def submit(self, option, text):
+        response = self.client.post('/api/responses/', {
+            'form': self.form.id,
+            'answers': [
+                {'question': self.dropdown.id, 'text_answer': option},
+                {'question': self.text.id, 'text_answer': text},
+            ]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def analytics(self):
+        return self.client.get(f'/api/response_analytics/{self.form.id}/').json()
+
+    def test_hash_ring_moves_few_keys_when_a_node_is_added(self):
+        before = sharding.HashRing(['default', 'shard1'])
+        after = sharding.HashRing(['default', 'shard1', 'shard2'])
+        owners = [before.node_for(key) for key in range(3000)]
+        self.assertTrue(900 < owners.count('shard1') < 2100)
+        moved = [key for key, owner in enumerate(owners) if after.node_for(key) != owner]
+        self.assertTrue(all(after.node_for(key) == 'shard2' for key in moved))
+        self.assertLess(len(moved), 1500)
+
+    def test_new_forms_are_placed_by_the_ring(self):
+        for _ in range(10):
+            form = Form.objects.create(title="Survey")
+            expected = sharding.stored_shard(sharding.ring_shard(form.id))
+            self.assertEqual(form.shard, expected)
+            self.assertEqual(Form.objects.get(id=form.id).shard, expected)
+
+    def test_form_traffic_uses_its_shard(self):
+        sharding.move_form(self.form, 'shard1')
+        self.submit('a', 'lovely weather')
+        self.submit('b', 'lovely people')
+
+        self.assertEqual(Response.objects.using('shard1').filter(form=self.form).count(), 2)
+        self.assertFalse(Response.objects.filter(form=self.form).exists())
+        analytics = self.analytics()
+        self.assertCountEqual(
+            analytics[str(self.dropdown.id)]['data']['top_options'],
+            [{'option': 'a', 'count': 1}, {'option': 'b', 'count': 1}]
+        )
+        self.assertEqual(len(self.client.get(f'/api/form_responses/{self.form.id}/').json()), 2)
+        self.assertEqual(aggregates.check_form(self.form.id, 'shard1'), [])
+
+    def test_move_form_between_shards(self):
+        Form.objects.filter(id=self.form.id).update(shard='')
+        self.form.shard = ''
+        self.submit('a', 'lovely weather')
+        self.submit('a', 'terrible weather')
+        expected = self.analytics()
+        exported = self.client.get(f'/api/form_responses/{self.form.id}/').json()
+
+        self.assertEqual(sharding.move_form(self.form, 'shard1'), 2)
+        self.assertEqual(Form.objects.get(id=self.form.id).shard, 'shard1')
+        self.assertFalse(Answer.objects.filter(question=self.dropdown).exists())
+        self.assertEqual(self.analytics(), expected)
+        moved = self.client.get(f'/api/form_responses/{self.form.id}/').json()
+        self.assertEqual(
+            [(response['submitted_at'], response['ip_address']) for response in moved],
+            [(response['submitted_at'], response['ip_address']) for response in exported]
+        )
+
+        self.assertEqual(sharding.move_form(self.form, 'default'), 2)
+        self.assertFalse(Response.objects.using('shard1').exists())
+        self.assertEqual(self.analytics(), expected)
+
+
+    def test_responses_are_found_on_their_forms_shard(self):
+        other = Form.objects.create(title="Other")
+        pick = Question.objects.create(
+            form=other, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b'], order=0
+        )
+        Form.objects.filter(id=other.id).update(shard='')
+        sharding.move_form(self.form, 'shard1')
+        self.submit('a', 'lovely weather')
+        created = self.client.post('/api/responses/', {
+            'form': other.id, 'answers': [{'question': pick.id, 'text_answer': 'b'}]
+        }, format='json')
+        self.assertEqual(created.status_code, 201)
+        mine = Response.objects.using('shard1').get(form=self.form)
+        theirs = Response.objects.get(form=other)
+        # Both shards hand out ids from 1, so the same id names two responses
+        self.assertEqual(mine.id, theirs.id)
+
+        self.assertEqual(self.client.get(f'/api/responses/{mine.id}/').status_code, 400)
+        self.assertEqual(self.client.get('/api/answers/').status_code, 400)
+        fetched = self.client.get(f'/api/responses/{mine.id}/?form={self.form.id}').json()
+        self.assertEqual(fetched['form'], self.form.id)
+        answers = self.client.get(f'/api/answers/?form={other.id}&response={theirs.id}').json()
+        self.assertEqual(answers, [{'question': pick.id, 'text_answer': 'b'}])
+        answers = self.client.get(f'/api/answers/?form={self.form.id}&response={mine.id}').json()
+        self.assertEqual(len(answers), 2)
+
+        patched = self.client.patch(
+            f'/api/responses/{theirs.id}/?form={other.id}', {'ip_address': '10.0.0.9'}, format='json'
+        )
+        self.assertEqual(patched.status_code, 200)
+        self.assertEqual(Response.objects.get(id=theirs.id).ip_address, '10.0.0.9')
+        self.assertNotEqual(Response.objects.using('shard1').get(id=mine.id).ip_address, '10.0.0.9')
+
+        deleted = self.client.delete(f'/api/responses/{mine.id}/?form={self.form.id}')
+        self.assertEqual(deleted.status_code, 204)
+        self.assertFalse(Response.objects.using('shard1').exists())
+        self.assertTrue(Response.objects.filter(id=theirs.id).exists())
+        self.assertEqual(aggregates.check_form(self.form.id, 'shard1'), [])
+        self.assertEqual(aggregates.check_form(other.id, 'default'), [])
+
+
+@override_settings(FORM_STUFF_METRICS=True)
+class RequestMetricsTests(TestCase):
+    """
+    Requests are timed and their queries counted per route, and the totals
+    are served at /metrics.
+    """
+
+    def setUp(self):
+        cache.clear()
+        metrics.registry.reset()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.dropdown = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b'], order=0
+        )
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_requests_are_recorded_per_route(self):
+        submitted = self.client.post('/api/responses/', {
+            'form': self.form.id,
+            'answers': [{'question': self.dropdown.id, 'text_answer': 'a'}],
+        }, format='json')
+        self.assertEqual(submitted.status_code, 201)
+        with CaptureQueriesContext(connection) as queries:
+            analytics = self.client.get(f'/api/response_analytics/{self.form.id}/')
+        executed = len(queries)
+
+        samples = self.scrape()
+        route = '{route="analytics",method="GET"}'
+        self.assertEqual(samples['form_stuff_requests_total{route="analytics",method="GET",status="200"}'], 1)
+        self.assertEqual(samples['form_stuff_requests_total{route="response-list",method="POST",status="201"}'], 1)
+        self.assertEqual(samples[f'form_stuff_db_queries_total{route}'], executed)
+        self.assertEqual(samples[f'form_stuff_response_bytes_total{route}'], len(analytics.content))
+        self.assertEqual(samples['form_stuff_request_duration_seconds_count' + route], 1)
+        self.assertEqual(
+            samples['form_stuff_request_duration_seconds_bucket{route="analytics",method="GET",le="+Inf"}'], 1
+        )
+        self.assertGreater(samples[f'form_stuff_db_seconds_total{route}'], 0)
+        self.assertGreater(
+            samples['form_stuff_serializer_seconds_total{route="response-list",method="POST"}'], 0
+        )
+
+    def test_metrics_are_off_by_default(self):
+        with override_settings(FORM_STUFF_METRICS=False):
+            self.client.get(f'/api/response_analytics/{self.form.id}/')
+            self.assertEqual(self.client.get('/metrics').status_code, 404)
+        self.assertNotIn('route="analytics"', metrics.registry.render())
+
+
+class GenerateDatasetTests(TestCase):
+    """
+    The benchmark dataset is reproducible and its analytics match its answers.
+    """
+
+    def test_generate_dataset(self):
+        dataset = benchmarks.generate_dataset(2, 6, 30, seed=7)
+        self.assertEqual(Response.objects.count(), 60)
+        self.assertEqual(Answer.objects.count(), 360)
+        form, questions = dataset[0]
+        self.assertEqual(
+            {question.question_type for question in questions},
+            {question_type for question_type, _ in Question.QUESTION_TYPES}
+        )
+        for form, _ in dataset:
+            self.assertEqual(aggregates.check_form(form.id), [])
+
+        def answers():
+            return list(Answer.objects.order_by('id').values_list('value_text', 'value_choice', 'value_json'))
+
+        first = answers()
+        Form.objects.all().delete()
+        benchmarks.generate_dataset(2, 6, 30, seed=7)
+        self.assertEqual(answers(), first)
+
+
+class FastSerializerTests(TestCase):
+    """
+    The compiled serializers render the same bytes as the DRF path.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user('owner', password='password')
+        self.forms = [
+            Form.objects.create(title="Survey\u2028\u00e9 \u2603", created_by=self.user, deadline=None),
+            Form.objects.create(title="Anonymous", description="No owner"),
+        ]
+        for form in self.forms:
+            for order, question_type in enumerate([Question.TEXT, Question.DROPDOWN, Question.CHECKBOX]):
+                Question.objects.create(
+                    form=form, text=f"Q{order}", question_type=question_type, order=order,
+                    options=None if question_type == Question.TEXT else ['a', 'é', 'c'],
+                )
+        form = self.forms[0]
+        for n in range(5):
+            Response.objects.create(form=form, submitted_by=self.user if n % 2 else None,
+                                    ip_address='10.0.0.%d' % n, user_agent='Agent ☃')
+
+    def both(self, url):
+        with override_settings(FORM_STUFF_FAST_SERIALIZER_ROUTES=()):
+            expected = self.client.get(url)
+        with mock.patch.object(fast_serializers, 'json_response', wraps=fast_serializers.json_response) as fast:
+            actual = self.client.get(url)
+        fast.assert_called_once()
+        self.assertEqual(actual.status_code, expected.status_code)
+        self.assertEqual(actual['Content-Type'], expected['Content-Type'])
+        self.assertEqual(actual.content, expected.content)
+        return actual
+
+    def test_form_list(self):
+        self.client.force_authenticate(self.user)
+        self.assertEqual(len(self.both('/api/forms/').json()), 2)
+
+    def test_form_responses(self):
+        form = self.forms[0]
+        self.assertEqual(len(self.both(f'/api/form_responses/{form.id}/').json()), 5)
+        page = self.both(f'/api/form_responses/{form.id}/?page_size=2').json()
+        self.assertEqual(len(page['results']), 2)
+        self.both(f'/api/form_responses/{form.id}/?page_size=2&cursor={page["next_cursor"]}')
+        self.both(f'/api/form_responses/{self.forms[1].id}/')
+        with override_settings(TIME_ZONE='America/New_York'):
+            self.both(f'/api/form_responses/{form.id}/')
+
+    def test_stdlib_encoder_matches(self):
+        data = fast_serializers.compiled(FormSerializer).data(Form.objects.all())
+        with mock.patch.object(fast_serializers, 'orjson', None):
+            self.assertEqual(fast_serializers.dumps(data), JSONRenderer().render(data))
+        self.assertEqual(fast_serializers.dumps(data), JSONRenderer().render(data))
+
+    def test_json_fields_with_floats_and_big_integers(self):
+        self.client.force_authenticate(self.user)
+        Question.objects.filter(form=self.forms[0], order=1).update(
+            options=['a', 2 ** 70, 1e16, 0.1, -1e-07, {'weight': 2.5, 'rank': [1, 3e-30]}]
+        )
+        self.both('/api/forms/')
+        Question.objects.filter(form=self.forms[0], order=1).update(options=['a', 2 ** 70])
+        self.both('/api/forms/')
+        unsafe = [fast_serializers._json_value(float('nan'))]
+        with self.assertRaises(ValueError):
+            JSONRenderer().render(unsafe)
+        with self.assertRaises(ValueError):
+            fast_serializers.dumps(unsafe)
+
+    def test_browsable_api_keeps_the_drf_path(self):
+        response = self.client.get(f'/api/form_responses/{self.forms[0].id}/', HTTP_ACCEPT='text/html')
+        self.assertTrue(response['Content-Type'].startswith('text/html'))
+
+
+class QuestionSetTests(QueryBudgetMixin, TestCase):
+    """
+    Bulk question authoring validates the whole question set and writes it
+    with a fixed number of queries.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('admin', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.form = Form.objects.create(title="Survey", created_by=self.user)
+        self.url = f'/api/forms/{self.form.id}/questions/'
+
+    def create_questions(self, count):
+        return [
+            Question.objects.create(
+                form=self.form, text=f"Question {order}", order=order,
+                question_type=Question.DROPDOWN, options=['a', 'b']
+            )
+            for order in range(count)
+        ]
+
+    def test_add_edit_and_reorder(self):
+        first, second = self.create_questions(2)
+        self.client.get(f'/api/forms/{self.form.id}/')  # Cache the schema
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(self.url, {'questions': [
+                {'id': first.id, 'order': 1, 'options': ['a', 'c']},
+                {'id': second.id, 'order': 0, 'question_type': Question.TEXT},
+                {'text': "New", 'question_type': Question.CHECKBOX, 'options': ['x', 'y'], 'order': 2},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([item['id'] for item in response.json()][:2], [second.id, first.id])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        added = Question.objects.get(form=self.form, text="New")
+        self.assertEqual((first.order, first.options, first.stored_options), (1, ['a', 'c'], ['a', 'b', 'c']))
+        self.assertEqual((second.order, second.options, second.question_type), (0, None, Question.TEXT))
+        self.assertEqual((added.order, added.stored_options), (2, ['x', 'y']))
+        detail = self.client.get(f'/api/forms/{self.form.id}/').json()
+        self.assertEqual([question['text'] for question in detail['questions']], ["Question 1", "Question 0", "New"])
+
+    def test_query_count_is_independent_of_question_count(self):
+        for count in (3, 30):
+            Question.objects.filter(form=self.form).delete()
+            questions = self.create_questions(count)
+            # Reverse the form and add as many questions again
+            items = [{'id': question.id, 'order': count - 1 - question.order} for question in questions]
+            items += [
+                {'text': f"Added {n}", 'question_type': Question.TEXT, 'order': count + n}
+                for n in range(count)
+            ]
+            self.assertQueryBudget(9, 'patch', self.url, {'questions': items})
+            self.assertEqual(
+                list(Question.objects.filter(form=self.form).values_list('id', flat=True)[:count]),
+                [question.id for question in reversed(questions)]
+            )
+
+    def test_invalid_sets_write_nothing(self):
+        question, = self.create_questions(1)
+        other = Question.objects.create(
+            form=Form.objects.create(title="Other"), text="Elsewhere", question_type=Question.TEXT
+        )
+        for items in (
+            [{'text': "Duplicate order", 'question_type': Question.TEXT, 'order': 0}],
+            [{'text': "No options", 'question_type': Question.DROPDOWN, 'order': 1}],
+            [{'id': question.id, 'options': ['a', 'a']}],
+            [{'id': other.id, 'order': 5}],
+            [{'id': question.id, 'order': 1}, {'id': question.id, 'order': 2}],
+            [{'question_type': Question.TEXT, 'order': 1}],
+            [
+                {'text': f"Q{n}", 'question_type': Question.TEXT, 'order': n + 1}
+                for n in range(Form.MAX_QUESTIONS)
+            ],
+        ):
+            with self.subTest(items=items[:2]):
+                response = self.client.patch(self.url, {'questions': items}, format='json')
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(Question.objects.filter(form=self.form)), [question])
+        question.refresh_from_db()
+        self.assertEqual((question.order, question.options), (0, ['a', 'b']))
+
+
+class IdempotentSubmissionTests(TestCase):
+    """
+    Submissions repeating an idempotency key are stored once, and repeated
+    responses submitted without one are found offline.
+    """
+
+    def setUp(self):
+        cache.clear()
+        idempotency.recent.clear()
+        self.client = APIClient()
+        self.form = Form.objects.create(title="Survey")
+        self.question = Question.objects.create(
+            form=self.form, text="Pick", question_type=Question.DROPDOWN, options=['a', 'b']
+        )
+
+    def submit(self, answer='a', key=None, **headers):
+        if key is not None:
+            headers['HTTP_IDEMPOTENCY_KEY'] = key
+        return self.client.post('/api/responses/', {
+            'form': self.form.id,
+            'answers': [{'question': self.question.id, 'text_answer': answer}],
+        }, format='json', **headers)
+
+    def test_repeated_key_is_stored_once(self):
+        first = self.submit(key='retry-1')
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(1):  # The form lookup of the validation
+            replayed = self.submit(key='retry-1')
+        self.assertEqual((replayed.status_code, replayed.json()), (201, first.json()))
+        self.assertEqual(replayed[idempotency.REPLAYED_HEADER], 'true')
+
+        # A worker that has not seen the key falls back on the unique index
+        idempotency.recent.clear()
+        replayed = self.submit(key='retry-1')
+        self.assertEqual((replayed.status_code, replayed.json()['id']), (201, first.json()['id']))
+        self.assertEqual(self.submit(key='retry-2').status_code, 201)
+        self.assertEqual(Response.objects.count(), 2)
+        self.assertEqual(aggregates.check_form(self.form.id), [])
+        analytics = aggregates.form_analytics(self.form.id)
+        self.assertEqual(analytics[self.question.id]['data']['top_options'], [{'option': 'a', 'count': 2}])
+
+    def test_invalid_key(self):
+        self.assertEqual(self.submit(key='x' * (idempotency.MAX_KEY_LENGTH + 1)).status_code, 400)
+        self.assertFalse(Response.objects.exists())
+
+    def test_queued_repeats_resolve_to_one_response(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            FORM_STUFF_INGEST_MODE='queued',
+            FORM_STUFF_INGEST_QUEUE_PATH=os.path.join(directory, 'queue.sqlite3')
+        ):
+            receipt = self.submit(key='retry').json()['receipt']
+            self.assertEqual(self.submit(key='retry').json()['receipt'], receipt)
+            # Two workers queued the same key
+            idempotency.recent.clear()
+            other = self.submit(key='retry').json()['receipt']
+            self.assertNotEqual(other, receipt)
+            self.assertEqual(ingest.flush(ingest.get_queue()), (2, 0))
+            queue = ingest.get_queue()
+            response_id = queue.status(receipt)['response']
+            self.assertEqual(queue.status(other)['response'], response_id)
+            self.assertEqual(Response.objects.get().idempotency_key, 'retry')
+
+    def test_flush_racing_a_synchronous_submission(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+            FORM_STUFF_INGEST_MODE='queued',
+            FORM_STUFF_INGEST_QUEUE_PATH=os.path.join(directory, 'queue.sqlite3')
+        ):
+            raced = self.submit(key='raced').json()['receipt']
+            others = [self.submit('b', key='other').json()['receipt'], self.submit('b').json()['receipt']]
+            store = ingest._store
+            synchronous = []
+
+            def store_after_a_synchronous_submission(submissions, using):
+                if not synchronous:
+                    # Stored between the key lookup and the batch insert
+                    serializer = ResponseSerializer(data={
+                        'form': self.form.id,
+                        'answers': [{'question': self.question.id, 'text_answer': 'a'}],
+                    })
+                    serializer.is_valid(raise_exception=True)
+                    synchronous.append(serializer.save(idempotency_key='raced'))
+                return store(submissions, using)
+
+            with mock.patch.object(ingest, '_store', side_effect=store_after_a_synchronous_submission):
+                self.assertEqual(ingest.flush(ingest.get_queue()), (3, 0))
+            queue = ingest.get_queue()
+            self.assertEqual(queue.status(raced)['response'], synchronous[0].id)
+            stored = [queue.status(receipt)['response'] for receipt in others]
+        self.assertEqual(
+            sorted(Response.objects.values_list('id', flat=True)), sorted([synchronous[0].id, *stored])
+        )
+        self.assertEqual(aggregates.check_form(self.form.id), [])
+        analytics = aggregates.form_analytics(self.form.id)
+        self.assertEqual(
+            analytics[self.question.id]['data']['top_options'],
+            [{'option': 'b', 'count': 2}, {'option': 'a', 'count': 1}]
+        )
+
+    def test_dedupe_command(self):
+        for answer in ('a', 'a', 'b', 'a'):
+            self.submit(answer)
+        self.client.post('/api/responses/', {
+            'form': self.form.id,
+            'user_agent': 'Other browser',
+            'answers': [{'question': self.question.id, 'text_answer': 'a'}],
+        }, format='json')
+        first, second, _, fourth, _ = Response.objects.order_by('id').values_list('id', flat=True)
+        self.assertEqual(
+            idempotency.find_duplicates(self.form.id),
+            [(second, first), (fourth, first)]
+        )
+
+        output = StringIO()
+        call_command('dedupe_responses', stdout=output)
+        self.assertIn("2 repeated response(s) found.", output.getvalue())
+        self.assertEqual(Response.objects.count(), 5)
+        call_command('dedupe_responses', '--delete', stdout=StringIO())
+        self.assertEqual(Response.objects.count(), 3)
+        self.assertFalse(Answer.objects.filter(response_id__in=[second, fourth]).exists())
+        self.assertEqual(aggregates.check_form(self.form.id), [])
@@ -0,0 +1,158 @@
+"""
+Word-frequency analytics for text answers.
+
+Text answers are tokenized in batches: a batch of answers is joined into one
+string, lowercased once, passed through a character translation table that
+turns every character which is not a letter, digit, apostrophe or hyphen
+into a space, and split on whitespace. All of that runs in C, so the only
+per-answer work done in Python is collecting the strings. Raw tokens are
+counted with `Counter.update` (also C); normalisation (stripping apostrophes
+and hyphens left at the edges of a token) and filtering then only touch the
+distinct tokens of the batch, not every occurrence.
+
+The result is punctuation-aware: "great!" and "great" are the same word,
+while "don't" and "follow-up" stay whole. Tokens shorter than `min_length`
+and stop words are dropped. The defaults come from the
+`FORM_STUFF_TEXT_MIN_WORD_LENGTH` and `FORM_STUFF_TEXT_STOP_WORDS` settings;
+the pre-aggregated counts depend on them, so run `rebuild_analytics` after
+changing either.
+"""
+import heapq
+from collections import Counter
+from itertools import islice
+from operator import itemgetter
+
+from django.conf import settings
+
+
+MIN_WORD_LENGTH = 5
+TOP_K = 5
+MAX_TOP_K = 100
+BATCH_SIZE = 5000
+
+JOINERS = "'’-"
+# Separates answers in a batch; never part of a token
+_SEPARATOR = '\n'
+
+
+class _TokenTable(dict):
+    """
+    `str.translate` table mapping separators to a space.
+
+    Entries are filled in on first use, so the table covers all of Unicode
+    while only holding the characters actually seen.
+    """
+
+    def __missing__(self, codepoint):
+        char = chr(codepoint)
+        value = char if char.isalnum() or char in JOINERS else ' '
+        self[codepoint] = value
+        return value
+
+
+TOKEN_TABLE = _TokenTable()
+
+
+class Tokenizer:
+    """
+    Split text answers into counted words.
+
+    Parameters:
+    min_length (int): Shortest word that is counted.
+    stop_words (iterable): Words that are never counted.
+    """
+
+    def __init__(self, min_length=MIN_WORD_LENGTH, stop_words=()):
+        self.min_length = min_length
+        self.stop_words = frozenset(word.lower() for word in stop_words)
+
+    def word(self, token):
+        """
+        Normalise a raw token, returning None if it is not counted.
+        """
+        word = token.strip(JOINERS)
+        if len(word) < self.min_length or word in self.stop_words:
+            return None
+        return word
+
+    @staticmethod
+    def _raw_tokens(text):
+        return text.lower().translate(TOKEN_TABLE).split()
+
+    def tokenize(self, text):
+        """
+        Return the counted words of one answer, in order.
+        """
+        if not isinstance(text, str):
+            return []
+        words = (self.word(token) for token in self._raw_tokens(text))
+        return [word for word in words if word]
+
+    def count_batch(self, texts, counts):
+        """
+        Add the words of one batch of answers to `counts`.
+
+        Values that are not strings are skipped.
+        """
+        raw = Counter(self._raw_tokens(
+            _SEPARATOR.join(text for text in texts if isinstance(text, str))
+        ))
+        for token, n in raw.items():
+            word = self.word(token)
+            if word:
+                counts[word] += n
+        return counts
+
+    def count(self, texts, counts=None, batch_size=BATCH_SIZE):
+        """
+        Count the words of `texts`, `batch_size` answers at a time.
+
+        Returns:
+        Counter: `counts` (or a new counter) updated with the words.
+        """
+        counts = Counter() if counts is None else counts
+        texts = iter(texts)
+        while True:
+            batch = list(islice(texts, batch_size))
+            if not batch:
+                return counts
+            self.count_batch(batch, counts)
+
+
+def default_tokenizer():
+    """
+    Build the tokenizer configured in settings.
+    """
+    return Tokenizer(
+        getattr(settings, 'FORM_STUFF_TEXT_MIN_WORD_LENGTH', MIN_WORD_LENGTH),
+        getattr(settings, 'FORM_STUFF_TEXT_STOP_WORDS', ()),
+    )
+
+
+def top_k(counts, k=TOP_K):
+    """
+    Select the `k` most frequent items with a bounded heap.
+
+    Returns:
+    tuple: `(top, others)` where `top` is a list of `(item, count)` pairs in
+           descending count order and `others` is the summed count of the
+           rest.
+    """
+    top = heapq.nlargest(k, counts.items(), key=itemgetter(1))
+    others = sum(counts.values()) - sum(count for _, count in top)
+    return top, others
+
+
+def word_frequencies(texts, k=TOP_K, tokenizer=None):
+    """
+    Compute the top `k` words of a collection of text answers.
+
+    Returns:
+    dict: `{'top_words': [{'word': ..., 'count': ...}], 'others': ...}`.
+    """
+    tokenizer = tokenizer or default_tokenizer()
+    top, others = top_k(tokenizer.count(texts), k)
+    return {
+        'top_words': [{'word': word, 'count': count} for word, count in top],
+        'others': others
+    }
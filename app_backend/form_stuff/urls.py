@@ -1,13 +1,24 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import (
+    AsyncAnalyticsLiveView,
+    AsyncAnalyticsView,
+    AsyncFormQuestionsView,
+    AsyncFormResponsesView,
+)
 from .views import (
     FormViewSet,
     QuestionViewSet,
     ResponseViewSet,
     AnswerViewSet,
+    JobViewSet,
     AnalyticsView,
+    AnalyticsLiveView,
     FormResponsesView,
-    FormQuestionsView
+    FormQuestionsView,
+    FormExportView,
+    SubmissionReceiptView
 )
 
 router = DefaultRouter()
@@ -15,11 +26,27 @@ router.register(r'forms', FormViewSet)
 router.register(r'questions', QuestionViewSet)
 router.register(r'responses', ResponseViewSet)
 router.register(r'answers', AnswerViewSet)
+router.register(r'jobs', JobViewSet)
+
+# Under ASGI the public read endpoints are served by async views
+if getattr(settings, 'FORM_STUFF_ASYNC_VIEWS', False):
+    analytics_view = AsyncAnalyticsView.as_view()
+    analytics_live_view = AsyncAnalyticsLiveView.as_view()
+    form_responses_view = AsyncFormResponsesView.as_view()
+    form_questions_view = AsyncFormQuestionsView.as_view()
+else:
+    analytics_view = AnalyticsView.as_view()
+    analytics_live_view = AnalyticsLiveView.as_view()
+    form_responses_view = FormResponsesView.as_view()
+    form_questions_view = FormQuestionsView.as_view()
 
 urlpatterns = [
     path('', include(router.urls)),  # Prefix with /api/ to group all the API endpoints
 
-    path('response_analytics/<int:form_id>/', AnalyticsView.as_view(), name='analytics'),
-    path('form_responses/<int:form_id>/', FormResponsesView.as_view(), name='form-responses'),
-    path('form_questions/<int:form_id>/', FormQuestionsView.as_view(), name='form-questions'),
+    path('response_analytics/<int:form_id>/', analytics_view, name='analytics'),
+    path('response_analytics/<int:form_id>/live/', analytics_live_view, name='analytics-live'),
+    path('form_responses/<int:form_id>/', form_responses_view, name='form-responses'),
+    path('form_questions/<int:form_id>/', form_questions_view, name='form-questions'),
+    path('form_export/<int:form_id>/', FormExportView.as_view(), name='form-export'),
+    path('submissions/<str:receipt>/', SubmissionReceiptView.as_view(), name='submission-receipt'),
 ]
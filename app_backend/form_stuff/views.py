@@ -1,25 +1,63 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.views import View
 from drf_yasg.utils import swagger_auto_schema
 
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from collections import Counter
 import logging
 
 # Models
-from .models import Form, Question, Answer
+from .models import Form, Question, Answer, Job
 from .models import Response as FormResponse  # Rename the model Response
+from .answer_storage import ANSWER_COLUMNS, cached_codec
 
 
 # Serializers
-from .serializers import FormSerializer, QuestionSerializer, ResponseSerializer, AnswerSerializer
+from .serializers import (
+    FormSerializer, QuestionSerializer, QuestionSetSerializer, ResponseSerializer, AnswerSerializer, JobSerializer
+)
+
+# Analytics
+from . import aggregates, live, rollups, sharding, sketches, text_analytics
+
+# Ingest
+from . import idempotency, ingest
+
+# Schema cache
+from . import schema
+
+# Exports
+from . import exports, jobs
+
+# Metrics
+from . import metrics
+
+# Compiled serializers
+from . import fast_serializers
+
+# Pagination
+from .pagination import ResponseCursorPagination, is_stream_requested, stream_json_lines
 
 # Logging
 logger = logging.getLogger("django.utils.autoreload")
 
 
+def form_list_queryset(queryset):
+    """
+    Load everything FormSerializer renders alongside the forms themselves.
+    """
+    return queryset.select_related('created_by').prefetch_related(
+        Prefetch('questions', queryset=Question.objects.order_by('order'))
+    )
+
+
 class ProtectedView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -73,10 +111,79 @@ class FormViewSet(viewsets.ModelViewSet):
         This method overrides the default queryset to return only the Forms
         created by the current authenticated user.
 
+        The creator and the ordered questions are loaded up front so that
+        serializing any number of forms takes a fixed number of queries.
+
         Returns:
             QuerySet: A filtered queryset containing Form objects created by the current user.
         """
-        return Form.objects.filter()
+        return form_list_queryset(Form.objects.filter())
+
+    def list(self, request, *args, **kwargs):
+        """
+        List forms. Plain JSON requests are rendered from database rows by the
+        compiled FormSerializer (see `fast_serializers`).
+        """
+        if fast_serializers.use_fast_path(request):
+            queryset = self.filter_queryset(self.get_queryset()).prefetch_related(None)
+            return fast_serializers.json_response(
+                fast_serializers.compiled(FormSerializer).data(queryset)
+            )
+        return super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        """
+        Retrieve a form from the versioned schema cache.
+
+        The rendered form is cached until the form or one of its questions
+        changes, and is served with a strong ETag so unchanged forms are
+        revalidated with a 304 NOT MODIFIED response.
+        """
+        try:
+            form_id = int(kwargs[self.lookup_field])
+        except (TypeError, ValueError):
+            raise Http404
+        return schema.cached_schema_response(
+            request,
+            form_id,
+            'form',
+            lambda: self.get_serializer(self.get_object()).data
+        )
+
+    @action(
+        detail=True,
+        methods=['patch'],
+        url_path='questions',
+        url_name='question-set',
+        permission_classes=[IsAuthenticated]
+    )
+    def question_set(self, request, pk=None):
+        """
+        Add, edit and reorder questions of a form in one request.
+
+        The body is `{"questions": [...]}`: items with an `id` change the
+        given fields of that question, items without one add a question.
+        The resulting question set is validated as a whole and written in one
+        transaction with a fixed number of queries (see
+        `QuestionSetSerializer`). Questions are removed through
+        `DELETE /api/questions/<id>/`.
+
+        Returns:
+        Response: Every question of the form, in order, or HTTP 400 BAD
+                  REQUEST with the validation errors.
+        """
+        try:
+            form_id = int(pk)
+        except (TypeError, ValueError):
+            raise Http404
+        with transaction.atomic():
+            # Concurrent edits of a form are serialized so the question cap
+            # and unique orders are checked against what is committed
+            form = get_object_or_404(Form.objects.select_for_update(), pk=form_id)
+            serializer = QuestionSetSerializer(data=request.data, context={'form': form})
+            serializer.is_valid(raise_exception=True)
+            questions = serializer.save()
+        return Response(QuestionSerializer(questions, many=True).data)
 
 
 
@@ -118,6 +225,41 @@ class QuestionViewSet(viewsets.ModelViewSet):
         return super().create(request, *args, **kwargs)
 
 
+def form_shard_queryset(view, queryset, form_field):
+    """
+    Route a queryset of sharded rows to the shard of the form named by the
+    'form' query parameter, and keep only that form's rows.
+
+    Row ids are only unique within a shard, so while sharding is on a list
+    or detail request without 'form' could reach another form's rows; it is
+    rejected instead. Without sharding every row lives on `default` and the
+    parameter stays optional.
+
+    Parameters:
+        view (GenericAPIView): The view handling the request.
+        queryset (QuerySet): The unfiltered queryset.
+        form_field (str): The lookup from the queryset's model to the form ID.
+
+    Returns:
+        QuerySet: The queryset on the form's database, filtered by form.
+
+    Raises:
+        ValidationError: If sharding is on and no form is given.
+    """
+    form_id = view.request.query_params.get('form')
+    if form_id is None:
+        if sharding.enabled() and not getattr(view, 'swagger_fake_view', False):
+            raise ValidationError({'form': "This parameter is required while responses are sharded."})
+        return queryset
+    try:
+        using = sharding.get_form_db(form_id)
+    except (Form.DoesNotExist, ValueError):
+        return queryset.none()
+    if using is not None:
+        queryset = queryset.using(using)
+    return queryset.filter(**{form_field: form_id})
+
+
 # Response Viewset
 class ResponseViewSet(viewsets.ModelViewSet):
     """
@@ -134,30 +276,109 @@ class ResponseViewSet(viewsets.ModelViewSet):
     permission_classes = [AllowAny]
     queryset = FormResponse.objects.all()
     serializer_class = ResponseSerializer
+    pagination_class = ResponseCursorPagination
+
+    def create(self, request, *args, **kwargs):
+        """
+        Submit a response.
+
+        In queued ingest mode the validated submission is appended to the
+        local ingest queue instead of being written to the database, and a
+        receipt id is returned with HTTP 202 ACCEPTED. The receipt can be
+        polled at `/api/submissions/<receipt>/`.
+
+        A submission sent with an `Idempotency-Key` header the form already
+        has is not stored again; the first submission's outcome is returned
+        instead (see `idempotency`).
+        """
+        key = idempotency.request_key(request)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        form = serializer.validated_data['form']
+        if key is not None:
+            outcome = idempotency.recent.get(form.id, key)
+            if outcome is not None:
+                return idempotency.replay(*outcome)
+
+        if ingest.is_queued_mode():
+            receipt = ingest.get_queue().enqueue(
+                ingest.submission_payload(serializer.validated_data, idempotency_key=key)
+            )
+            data, status_code = {'receipt': receipt, 'status': ingest.QUEUED}, status.HTTP_202_ACCEPTED
+        else:
+            try:
+                serializer.save(idempotency_key=key)
+            except IntegrityError:
+                # Another worker stored the key first
+                original = key and idempotency.stored_response(form, key)
+                if not original:
+                    raise
+                data = self.get_serializer(original).data
+                idempotency.recent.add(form.id, key, status.HTTP_201_CREATED, data)
+                return idempotency.replay(status.HTTP_201_CREATED, data)
+            data, status_code = serializer.data, status.HTTP_201_CREATED
+
+        if key is not None:
+            idempotency.recent.add(form.id, key, status_code, data)
+        return Response(data, status=status_code, headers=self.get_success_headers(data))
+
+    def list(self, request, *args, **kwargs):
+        """
+        List responses, optionally paginated by cursor or streamed as JSON lines.
+
+        Passing `cursor` or `page_size` returns one keyset page wrapped in
+        `{'next', 'next_cursor', 'results'}`; passing `stream=true` streams
+        every matching response as newline-delimited JSON.
+        """
+        if is_stream_requested(request):
+            queryset = self.filter_queryset(self.get_queryset())
+            return stream_json_lines(queryset, self.get_serializer_class(), request)
+        return super().list(request, *args, **kwargs)
+
+    def perform_destroy(self, instance):
+        """
+        Delete a response and take its answers back out of the analytics
+        counts and rollups, in one transaction on the form's shard.
+
+        The approximate analytics cannot forget answers; run
+        `update_sketches --rebuild` to drop them from the sketches.
+        """
+        using = instance._state.db
+        questions = schema.question_map(instance.form_id)
+        with transaction.atomic(using=using):
+            counted = []
+            for question_id, *stored in Answer.objects.using(using).filter(
+                response=instance
+            ).values_list('question_id', *ANSWER_COLUMNS):
+                question = questions[question_id]
+                codec = cached_codec(question.question_type, question.stored_options)
+                counted.append((question_id, question.question_type, codec.decode(*stored)))
+            aggregates.forget_answers(counted, using)
+            rollups.forget_submissions([(instance.form_id, instance.submitted_at, counted)], using)
+            instance.delete()
 
     def get_queryset(self):
         """
         Get the queryset of Response objects, optionally filtered by form ID.
 
         This method overrides the default queryset to optionally filter Response objects
-        based on the 'form' query parameter in the request.
+        based on the 'form' query parameter in the request. While sharding is
+        on a response is only found on its form's shard, so the parameter is
+        required (see `form_shard_queryset`).
 
         Returns:
             QuerySet: A queryset of Response objects, potentially filtered by form ID.
         """
-        queryset = super().get_queryset()
-        form_id = self.request.query_params.get('form')  # Get the 'form' query parameter
-        if form_id is not None:
-            queryset = queryset.filter(form_id=form_id)  # Filter by form ID
-        return queryset
+        return form_shard_queryset(self, super().get_queryset(), 'form_id')
 
     
 # Answer Viewset
-class AnswerViewSet(viewsets.ModelViewSet):
+class AnswerViewSet(viewsets.ReadOnlyModelViewSet):
     """
-    A viewset for handling Answer objects.
+    A viewset for reading Answer objects.
 
-    This viewset provides CRUD operations for Answer objects.
+    Answers are written with their response (see `ResponseViewSet`), which
+    keeps the analytics in step; this viewset only lists and retrieves them.
     It allows access to all users and can filter answers by response ID.
 
     Attributes:
@@ -166,7 +387,8 @@ class AnswerViewSet(viewsets.ModelViewSet):
         serializer_class (Serializer): The serializer class for Answer objects.
     """
     permission_classes = [AllowAny]
-    queryset = Answer.objects.all()
+    # Answers decode through their question (see `answer_storage`)
+    queryset = Answer.objects.select_related('question')
     serializer_class = AnswerSerializer
 
     def get_queryset(self):
@@ -174,18 +396,80 @@ class AnswerViewSet(viewsets.ModelViewSet):
         Get the queryset of Answer objects, optionally filtered by response ID.
 
         This method overrides the default queryset to optionally filter Answer objects
-        based on the 'response' query parameter in the request.
+        based on the 'response' query parameter in the request. While sharding
+        is on the 'form' parameter is required as well (see `form_shard_queryset`).
 
         Returns:
             QuerySet: A queryset of Answer objects, potentially filtered by response ID.
         """
-        queryset = super().get_queryset()
+        queryset = form_shard_queryset(self, super().get_queryset(), 'response__form_id')
+        if queryset.db != 'default':
+            # Questions stay on `default`, so they cannot be joined from a shard
+            queryset = queryset.select_related(None).prefetch_related('question')
         response_id = self.request.query_params.get('response')
         if response_id is not None:
             queryset = queryset.filter(response_id=response_id)
         return queryset
 
     
+# Job Viewset
+class JobViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    A viewset for queuing background jobs and following their progress.
+
+    Jobs are run by the `run_jobs` management command. Finished artifacts
+    are downloaded from the `artifact` action, which supports range requests
+    so large files can be resumed.
+
+    Attributes:
+        permission_classes (list): Specifies that only authenticated users can access this viewset.
+        queryset (QuerySet): The base queryset for retrieving Job objects.
+        serializer_class (Serializer): The serializer class for Job objects.
+    """
+    permission_classes = [IsAuthenticated]
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+    def get_queryset(self):
+        """
+        Restrict jobs to the ones queued by the current user.
+        """
+        return super().get_queryset().filter(created_by=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        """
+        Queue a job. Returns HTTP 202 ACCEPTED with the job to poll.
+        """
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    @action(detail=True)
+    def artifact(self, request, pk=None):
+        """
+        Download the artifact of a finished job, honouring `Range` headers.
+
+        Returns HTTP 409 CONFLICT while the job has not finished successfully,
+        and HTTP 404 NOT FOUND if its artifact has since been removed.
+        """
+        job = self.get_object()
+        if job.status != Job.DONE:
+            return Response(
+                {"detail": f"Job is {job.status}; no artifact available."},
+                status=status.HTTP_409_CONFLICT
+            )
+        if job.kind == Job.EXPORT:
+            content_type = exports.CONTENT_TYPES[job.export_format]
+        else:
+            content_type = 'application/json'
+        return jobs.ranged_file_response(
+            request, jobs.artifact_path(job), content_type, job.artifact
+        )
+
+
 # Form Creation View
 class FormCreateView(APIView):
     permission_classes = [IsAuthenticated]
@@ -204,7 +488,7 @@ class AdminFormsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        forms = Form.objects.filter(created_by=request.user)
+        forms = form_list_queryset(Form.objects.filter(created_by=request.user))
         serializer = FormSerializer(forms, many=True)
         return Response(serializer.data)
 
@@ -268,7 +552,7 @@ class AdminFormsView(APIView):
         Response: A Django Rest Framework Response object containing the serialized
                   form data for all forms created by the authenticated user.
         """
-        forms = Form.objects.filter(created_by=request.user)  # Filter forms by admin user
+        forms = form_list_queryset(Form.objects.filter(created_by=request.user))  # Filter forms by admin user
         serializer = FormSerializer(forms, many=True)
         return Response(serializer.data)
 
@@ -293,18 +577,76 @@ class FormQuestionsView(APIView):
         Response: A Django Rest Framework Response object containing the serialized
                   question data for the specified form.
                   - If questions are found, returns a 200 OK status with the serialized data.
+                  - If the client's ETag is still current, returns a 304 NOT MODIFIED status.
                   - If no questions are found, returns a 404 NOT FOUND status with an error message.
         """
         try:
-            questions = Question.objects.filter(form_id=form_id)
-            serializer = QuestionSerializer(questions, many=True)
-            return Response(serializer.data)
+            # Served from the versioned schema cache with ETag revalidation
+            return schema.cached_schema_response(
+                request,
+                form_id,
+                'questions',
+                lambda: QuestionSerializer(
+                    Question.objects.filter(form_id=form_id), many=True
+                ).data
+            )
         except Question.DoesNotExist:
             return Response(
                 {"detail": "No questions found for this form."}, 
                 status=status.HTTP_404_NOT_FOUND
             )
 
+def analytics_options(params):
+    """
+    Read the query parameters of the analytics endpoint.
+
+    Returns:
+    dict: `k`, `mode` and `window` (`(start, end, bucket)` or None).
+
+    Raises:
+    ValueError: If a parameter is invalid.
+    """
+    try:
+        k = int(params.get('k', text_analytics.TOP_K))
+    except (TypeError, ValueError):
+        k = 0
+    if not 1 <= k <= text_analytics.MAX_TOP_K:
+        raise ValueError(f"k must be an integer between 1 and {text_analytics.MAX_TOP_K}.")
+    mode = params.get('mode', 'exact')
+    if mode not in ('exact', 'approximate'):
+        raise ValueError("mode must be 'exact' or 'approximate'.")
+    window = None
+    if any(name in params for name in rollups.WINDOW_PARAMS):
+        if mode == 'approximate':
+            raise ValueError("Time windows are only available in exact mode.")
+        window = rollups.parse_window(params)
+    return {'k': k, 'mode': mode, 'window': window}
+
+
+def build_analytics(form_id, options, using=None):
+    """
+    Build the analytics payload of a form for the given `analytics_options`,
+    reading the form's shard `using` (see `sharding`).
+
+    Raises:
+    ValueError: If the time window has too many buckets.
+    """
+    k = options['k']
+    if options['window'] is not None:
+        start, end, bucket = options['window']
+        return {
+            'from': start,
+            'to': end,
+            'bucket': bucket,
+            'submissions': rollups.submission_series(form_id, start, end, bucket, using),
+            'questions': rollups.windowed_analytics(form_id, start, end, k, using),
+        }
+    if options['mode'] == 'approximate':
+        return sketches.form_analytics(form_id, k, using)
+    # Served from the pre-aggregated counts kept by ResponseSerializer
+    return aggregates.form_analytics(form_id, k, using)
+
+
 # Analytics View
 class AnalyticsView(APIView):
     """
@@ -327,6 +669,17 @@ class AnalyticsView(APIView):
         by the provided form_id. It calculates and returns the most common answers for
         each question type (text, checkbox, dropdown) within the form.
 
+        The number of top values per question defaults to 5 and can be set
+        with the `k` query parameter (1 to 100). `mode=approximate` serves
+        the analytics from the mergeable sketches kept by `update_sketches`
+        instead of the exact counts, plus the answers submitted since; see
+        `sketches` for the error bounds and the reported lag.
+
+        Passing any of `from`, `to` (ISO dates or datetimes, `to` exclusive)
+        or `bucket` (`hour` or `day`) restricts the analytics to responses
+        submitted in that window and adds the number of submissions per
+        bucket. Both are answered from the hourly rollups (see `rollups`).
+
         Parameters:
         request (Request): The HTTP request object containing metadata about the request.
         form_id (int): The ID of the form for which analytics are to be retrieved.
@@ -335,77 +688,21 @@ class AnalyticsView(APIView):
         Response: A Django Rest Framework Response object containing the analytics data.
                   - If the form is found and analytics are generated, returns a 200 OK status
                     with the analytics data.
+                  - If `k` is not an integer between 1 and 100, `mode` is neither
+                    "exact" nor "approximate", or the time window is invalid,
+                    returns a 400 BAD REQUEST status.
                   - If the form is not found, returns a 404 NOT FOUND status with an error message.
         """
+        try:
+            options = analytics_options(request.query_params)
+        except ValueError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
         try:
             form = get_object_or_404(Form, id=form_id)
-            responses = FormResponse.objects.filter(form_id=form_id)
-            analytics = {}
-     
-            questions = Question.objects.filter(form_id=form_id)
-            for question in questions:
-                if question.question_type == 'text':
-                    answers = Answer.objects.filter(question=question)
-                    words = [word.lower() for answer in answers 
-                            for word in answer.text_answer.split() if len(word) >= 5]
-                    word_count = Counter(words)
-                    top_words = word_count.most_common(5)
-                    others = sum([count for word, count in word_count.items() 
-                                if word not in dict(top_words)])
-
-                    analytics[question.id] = {
-                        'type': question.question_type,
-                        'data': {
-                            'top_words': [
-                                {'word': word, 'count': count} 
-                                for word, count in top_words
-                            ],
-                            'others': others
-                        }
-                    }
-
-                elif question.question_type == 'checkbox':
-                    answers = Answer.objects.filter(question=question)
-                    
-                    option_combinations = [
-                        tuple(sorted(answer.text_answer)) 
-                        for answer in answers
-                    ]
-                    combo_count = Counter(option_combinations)
-                    top_combos = combo_count.most_common(5)
-                    others = sum([count for combo, count in combo_count.items() 
-                                if combo not in dict(top_combos)])
-
-                    analytics[question.id] = {
-                        'type': question.question_type,
-                        'data': {
-                            'top_combos': [
-                                {'combination': combo, 'count': count} 
-                                for combo, count in top_combos
-                            ],
-                            'others': others
-                        }
-                    }
-
-
-                elif question.question_type == 'dropdown':
-                    answers = Answer.objects.filter(question=question)
-                    options = [answer.text_answer for answer in answers]
-                    option_count = Counter(options)
-                    top_options = option_count.most_common(5)
-                    others = sum([count for option, count in option_count.items() 
-                                if option not in dict(top_options)])
-
-                    analytics[question.id] = {
-                        'type': question.question_type,
-                        'data': {
-                            'top_options': [
-                                {'option': option, 'count': count} 
-                                for option, count in top_options
-                            ],
-                            'others': others
-                        }
-                    }
+            try:
+                analytics = build_analytics(form.id, options, sharding.form_db(form))
+            except ValueError as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
             return Response(analytics, status=status.HTTP_200_OK)
         except Form.DoesNotExist:
@@ -414,6 +711,35 @@ class AnalyticsView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+# Live Analytics View
+class AnalyticsLiveView(View):
+    """
+    A server-sent events feed of the analytics of a form.
+
+    The feed opens with the payload served by `AnalyticsView` and then
+    pushes the counts added by new submissions at a bounded rate, replacing
+    polling with one long-lived connection per viewer (see `live`). Like
+    `AnalyticsView` it is public and accepts the `k` query parameter.
+
+    This is a plain Django view: `EventSource` asks for `text/event-stream`,
+    which DRF content negotiation would refuse. Under WSGI every open feed
+    holds a worker thread; `async_views.AsyncAnalyticsLiveView` serves it
+    under ASGI.
+    """
+
+    def get(self, request, form_id):
+        try:
+            k = analytics_options(request.GET)['k']
+        except ValueError as exc:
+            return JsonResponse({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        form = Form.objects.only('shard').filter(id=form_id).first()
+        if form is None:
+            return JsonResponse({"detail": "Form not found."}, status=status.HTTP_404_NOT_FOUND)
+        using = sharding.form_db(form)
+        return live.event_response(
+            live.event_stream(form_id, lambda: aggregates.form_analytics(form_id, k, using))
+        )
+
 # Form Responses View
 class FormResponsesView(APIView):
     """
@@ -440,6 +766,13 @@ class FormResponsesView(APIView):
         request (Request): The HTTP request object containing metadata about the request.
         form_id (int): The ID of the form for which responses are to be retrieved.
 
+        Query parameters:
+        cursor / page_size: Return one keyset page instead of the full list.
+        stream: When true, stream every response as newline-delimited JSON.
+
+        Plain JSON requests are rendered by the compiled ResponseSerializer
+        (see `fast_serializers`), with the same output.
+
         Returns:
         Response: A Django Rest Framework Response object containing the serialized
                   response data for the specified form.
@@ -448,7 +781,25 @@ class FormResponsesView(APIView):
         """
         try:
             form = Form.objects.get(id=form_id)
-            responses = FormResponse.objects.filter(form=form)
+            responses = FormResponse.objects.using(sharding.form_db(form)).filter(form=form)
+            if is_stream_requested(request):
+                return stream_json_lines(responses, ResponseSerializer, request)
+
+            paginator = ResponseCursorPagination()
+            if fast_serializers.use_fast_path(request):
+                compiled = fast_serializers.compiled(ResponseSerializer)
+                rows = paginator.paginate_rows(responses, request, compiled.columns)
+                if rows is not None:
+                    data = paginator.get_paginated_data(compiled.serialize_rows(rows))
+                else:
+                    data = compiled.data(responses)
+                return fast_serializers.json_response(data)
+
+            page = paginator.paginate_queryset(responses, request, view=self)
+            if page is not None:
+                serializer = ResponseSerializer(page, many=True)
+                return paginator.get_paginated_response(serializer.data)
+
             serializer = ResponseSerializer(responses, many=True)
             return Response(serializer.data)
         except Form.DoesNotExist:
@@ -457,3 +808,95 @@ class FormResponsesView(APIView):
                 status=status.HTTP_404_NOT_FOUND
             )
 
+
+# Form Export View
+class FormExportView(APIView):
+    """
+    A view for exporting every response of a form as a wide table.
+
+    Attributes:
+        permission_classes (list): Specifies that only authenticated users can access this view.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, form_id):
+        """
+        Stream the responses of a form, one row per response and one column per question.
+
+        Parameters:
+        request (Request): The HTTP request object. The `output` query parameter
+                           selects "csv" (default), "ndjson" or "columnar".
+        form_id (int): The ID of the form to export.
+
+        Returns:
+        StreamingHttpResponse: The export as a file attachment, generated from a single
+                               database cursor with bounded memory.
+                  - If the output format is unknown, returns a 400 BAD REQUEST status.
+                  - If the form is not found, returns a 404 NOT FOUND status.
+        """
+        export_format = request.query_params.get('output', 'csv')
+        if export_format not in exports.FORMATS:
+            return Response(
+                {"detail": f"Unknown output format. Choose one of: {', '.join(exports.FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        form = get_object_or_404(Form, id=form_id)
+        response = StreamingHttpResponse(
+            exports.export_form(form.id, export_format, using=sharding.form_db(form)),
+            content_type=exports.CONTENT_TYPES[export_format]
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="{exports.export_filename(form.id, export_format)}"'
+        )
+        return response
+
+
+# Submission Receipt View
+class SubmissionReceiptView(APIView):
+    """
+    A view for polling the status of a queued submission.
+
+    Attributes:
+        permission_classes (list): Specifies that any user can access this view.
+    """
+    permission_classes = [AllowAny]
+
+    def get(self, request, receipt):
+        """
+        Retrieve the status of a submission accepted in queued ingest mode.
+
+        Parameters:
+        request (Request): The HTTP request object containing metadata about the request.
+        receipt (str): The receipt id returned when the submission was queued.
+
+        Returns:
+        Response: A Django Rest Framework Response object.
+                  - Returns a 200 OK status with the receipt, its status ("queued",
+                    "stored" or "failed"), the stored response id and any errors.
+                  - If the receipt is unknown, returns a 404 NOT FOUND status.
+        """
+        receipt_status = ingest.get_queue().status(receipt)
+        if receipt_status is None:
+            return Response(
+                {"detail": "Submission not found."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return Response(receipt_status)
+
+
+# Metrics View
+class MetricsView(View):
+    """
+    A view exposing the request metrics of this process (see
+    `form_stuff/metrics.py`) in the Prometheus text format.
+    """
+
+    def get(self, request):
+        """
+        Returns:
+        HttpResponse: 200 OK with the metrics, or 404 NOT FOUND while
+                      `FORM_STUFF_METRICS` is off.
+        """
+        if not metrics.enabled():
+            raise Http404
+        return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)